@@ -1,16 +1,39 @@
 import os
+import json
 import logging
 import hashlib
-import boto3
 from jose import jwt
 from abc import ABC, abstractmethod
+import aws_clients
+import avp_batch
+from decision_cache import build_decision_cache
+from policy_builder import PolicyBuilder
+from token_cache import TokenCache
 
 # Configuración de logs
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
+# Registro de eventos: "fields" (solo AUTHORIZER_LOG_FIELDS, en JSON) o "full" (evento completo, para depuración)
+AUTHORIZER_EVENT_LOG_MODE = os.environ.get("AUTHORIZER_EVENT_LOG_MODE", "fields")
+AUTHORIZER_LOG_FIELDS = os.environ.get(
+    "AUTHORIZER_LOG_FIELDS",
+    "requestContext.requestId,httpMethod,path,methodArn,pathParameters"
+)
+
 # Cliente de AWS Verified Permissions
-verified_permissions_client = boto3.client("verifiedpermissions")
+verified_permissions_client = aws_clients.client("verifiedpermissions")
+
+# Decisiones de Verified Permissions cacheadas por (policy store, principal, recurso, acción)
+decision_cache = build_decision_cache()
+
+# Claims y políticas de tokens ya verificados, compartidos entre invocaciones del contenedor
+token_cache = TokenCache()
+
+# Políticas de respuesta: por defecto limitadas al methodArn, ya que la decisión de AVP depende del
+# recurso solicitado. Las granularidades "api" y "routes" (AUTHORIZER_POLICY_GRANULARITY) solo son
+# seguras con el cache del authorizer si sus identity sources incluyen el recurso.
+policy_builder = PolicyBuilder()
 
 # Acciones permitidas sin validación adicional
 ALLOWED_ACTIONS_WITHOUT_PERMISSION = {
@@ -28,27 +51,75 @@ class AbstractHandler(ABC):
 
     def __init__(self):
         self.verified_permissions_client = verified_permissions_client
+        self.token_cache = token_cache
+        self.decision_cache = decision_cache
+        self.policy_builder = policy_builder
+        self.event_log_mode = AUTHORIZER_EVENT_LOG_MODE
+        self.log_fields = [tuple(field.strip().split(".")) for field in AUTHORIZER_LOG_FIELDS.split(",") if field.strip()]
+        self.policy_store_id = None
+
+    def warm_up(self):
+        """Inicialización del contenedor: resuelve configuración y recursos reutilizados entre invocaciones.
+
+        Se invoca una sola vez al crear el handler del contenedor; las subclases pueden
+        extenderlo para precargar sus propias dependencias (llamando a super().warm_up()).
+        """
+        self.policy_store_id = self.get_policy_store()
+        logger.info(f"Handler {type(self).__name__} initialized for policy store {self.policy_store_id}")
+        return self
+
+    def log_event(self, message, event):
+        """Registra el evento completo o solo los campos seleccionados, según event_log_mode."""
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        if self.event_log_mode == "full":
+            logger.info(f"{message}: {event}")
+            return
+        fields = {}
+        for path in self.log_fields:
+            value = event
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            if value is not None:
+                fields[".".join(path)] = value
+        logger.info(json.dumps({"message": message, **fields}, default=str))
 
     def handle_request(self, event, context):
         """Procesa la solicitud y verifica la autorización."""
-        logger.info(f"Processing event: {event}")
+        self.log_event("Processing event", event)
 
         headers = event.get("headers", {})
         auth_token = self.get_authorization_jwt(headers)
 
         if not auth_token:
             logger.error("No authorization token provided")
-            return self.generate_policy(DENY, {})
-
-        # Validación del token JWT con Cognito
-        try:
-            subject = self.validate_jwt(auth_token)
-        except Exception as e:
-            logger.error(f"JWT validation failed: {e}")
-            return self.generate_policy(DENY, {})
+            return self.generate_policy(DENY, {}, event.get("methodArn"))
+
+        # Política ya generada para este token y solicitud
+        scope = self.get_cache_scope(event)
+        cached_policy = self.token_cache.get(auth_token, scope=scope)
+        if cached_policy is not None:
+            logger.info(f"Policy served from token cache: {self.token_cache.stats()}")
+            return cached_policy
+
+        # Validación del token JWT con Cognito (solo si no fue verificado antes en este contenedor)
+        subject = self.token_cache.get(auth_token)
+        if subject is None:
+            try:
+                subject = self.validate_jwt(auth_token)
+            except Exception as e:
+                logger.error(f"JWT validation failed: {e}")
+                return self.generate_policy(DENY, {}, event.get("methodArn"))
+            self.token_cache.put(auth_token, subject, subject.get("exp"))
 
         auth_decision = self.handle_authorization(event, subject)
-        return self.generate_policy(auth_decision, subject)
+        policy = self.generate_policy(auth_decision, subject, event.get("methodArn"))
+        self.token_cache.put(auth_token, policy, self.token_cache.policy_expiry(subject), scope=scope)
+        return policy
+
+    def get_cache_scope(self, event):
+        """Identifica la solicitud para cachear la política generada (methodArn o método + ruta)."""
+        return event.get("methodArn") or f"{event.get('httpMethod', '')} {event.get('path', '')}"
 
     def get_authorization_jwt(self, headers):
         """Obtiene el token JWT de los headers."""
@@ -78,46 +149,61 @@ class AbstractHandler(ABC):
         return self.authorize_with_avp(resources, subject, action)
 
     def authorize_with_avp(self, resources, subject, action):
-        """Verifica la autorización con AWS Verified Permissions."""
-        policy_store_id = self.get_policy_store()
-
-        if len(resources) == 1:
+        """Verifica la autorización con AWS Verified Permissions (Allow si algún recurso está permitido)."""
+        decisions = self.evaluate_resources(resources, subject, action, short_circuit=True)
+        return ALLOW if ALLOW in decisions else DENY
+
+    def evaluate_resources(self, resources, subject, action, short_circuit=False):
+        """Retorna la decisión de AVP para cada recurso, en el orden recibido.
+
+        Con short_circuit=True se detiene en el primer Allow y los recursos no
+        evaluados quedan en None. Las subclases pueden usarlo con short_circuit=False
+        para obtener decisiones por recurso (p.ej. resource_authorization_batch).
+        """
+        policy_store_id = self.policy_store_id or self.get_policy_store()
+        principal = {"entityId": subject["sub"], "entityType": "User"}
+        action_ref = {"actionId": action}
+
+        # Decisiones ya conocidas: un Allow cacheado resuelve la solicitud sin llamar a AVP
+        decisions = self.decision_cache.get_many(policy_store_id, principal, resources, action_ref)
+        if short_circuit and ALLOW in decisions:
+            return decisions
+
+        pending = [index for index, decision in enumerate(decisions) if decision is None]
+        if not pending:
+            return decisions
+
+        if len(pending) == 1:
             response = self.verified_permissions_client.is_authorized(
                 policyStoreId=policy_store_id,
-                principal={"entityId": subject["sub"], "entityType": "User"},
-                resource=resources[0],
-                action={"actionId": action}
+                principal=principal,
+                resource=resources[pending[0]],
+                action=action_ref
             )
-            return response["decision"]
-
-        batch_requests = [{"principal": {"entityId": subject["sub"], "entityType": "User"},
-                           "resource": res, "action": {"actionId": action}} for res in resources]
+            evaluated = [response["decision"]]
+        else:
+            batch_requests = [{"principal": principal, "resource": resources[index], "action": action_ref} for index in pending]
+            evaluated = avp_batch.evaluate(self.verified_permissions_client, policy_store_id, batch_requests, short_circuit)
 
-        response = self.verified_permissions_client.batch_is_authorized(
-            policyStoreId=policy_store_id,
-            requests=batch_requests
-        )
+        evaluated_decisions = []
+        for index, decision in zip(pending, evaluated):
+            if decision is not None:
+                decisions[index] = decision
+                evaluated_decisions.append((resources[index], decision))
+        self.decision_cache.put_many(policy_store_id, principal, evaluated_decisions, action_ref)
 
-        return next((res["decision"] for res in response["results"] if res["decision"] == ALLOW), DENY)
+        return decisions
 
-    def generate_policy(self, auth_decision, subject):
+    def generate_policy(self, auth_decision, subject, method_arn=None):
         """Genera la política de respuesta del API Gateway."""
-        arn = f"arn:aws:execute-api:{os.getenv('AWS_REGION')}:*:*/*"
-        
-        policy_document = {
-            "Version": "2012-10-17",
-            "Statement": [{
-                "Effect": auth_decision,
-                "Action": "execute-api:Invoke",
-                "Resource": arn
-            }]
-        }
-
-        return {
-            "principalId": subject.get("sub", "unknown"),
-            "policyDocument": policy_document,
-            "context": subject
-        }
+        # Sin methodArn (p.ej. invocaciones de prueba) se mantiene el comodín de la región
+        arn = method_arn or f"arn:aws:execute-api:{os.getenv('AWS_REGION')}:*:*/*"
+        routes = self.get_allowed_routes(subject) if auth_decision == ALLOW else None
+        return self.policy_builder.build(subject.get("sub", "unknown"), auth_decision, arn, context=subject, routes=routes)
+
+    def get_allowed_routes(self, subject):
+        """Rutas ("GET /orgs/*") que cubre un Allow con granularidad "routes"; None usa AUTHORIZER_POLICY_ROUTES."""
+        return None
 
     @abstractmethod
     def get_policy_store(self):
@@ -0,0 +1,68 @@
+"""Motor de evaluación por lotes para AWS Verified Permissions (batch_is_authorized).
+
+Divide las listas de solicitudes que superan el límite de AVP por llamada en
+chunks que se evalúan en paralelo. En modo short-circuit retorna en cuanto algún
+chunk contiene un Allow, sin esperar al resto; si no, retorna la decisión de cada
+solicitud en el mismo orden en que se recibieron.
+"""
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger()
+
+AVP_BATCH_LIMIT = 30  # Máximo de solicitudes permitido por batch_is_authorized
+AVP_BATCH_CONCURRENCY = int(os.environ.get("AVP_BATCH_CONCURRENCY", "4"))
+
+ALLOW = "Allow"
+
+# Pool reutilizado entre invocaciones del mismo contenedor
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=AVP_BATCH_CONCURRENCY, thread_name_prefix="avp-batch")
+    return _executor
+
+
+def _request_key(request):
+    return json.dumps(request["resource"], sort_keys=True)
+
+
+def _evaluate_chunk(client, policy_store_id, chunk):
+    """Evalúa un chunk y retorna sus decisiones alineadas con el orden de las solicitudes."""
+    response = client.batch_is_authorized(policyStoreId=policy_store_id, requests=chunk)
+    by_resource = {_request_key(result["request"]): result["decision"] for result in response["results"]}
+    return [by_resource.get(_request_key(request)) for request in chunk]
+
+
+def evaluate(client, policy_store_id, requests, short_circuit=False, chunk_size=AVP_BATCH_LIMIT):
+    """Retorna una lista de decisiones alineada con `requests`.
+
+    Con short_circuit=True la evaluación se detiene al primer chunk con Allow; las
+    solicitudes de los chunks no evaluados quedan en None.
+    """
+    decisions = [None] * len(requests)
+    chunks = [(start, requests[start:start + chunk_size]) for start in range(0, len(requests), chunk_size)]
+
+    if len(chunks) == 1:
+        decisions[:] = _evaluate_chunk(client, policy_store_id, requests)
+        return decisions
+
+    pending = {_get_executor().submit(_evaluate_chunk, client, policy_store_id, chunk): start for start, chunk in chunks}
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            start = pending.pop(future)
+            chunk_decisions = future.result()
+            decisions[start:start + len(chunk_decisions)] = chunk_decisions
+            if short_circuit and ALLOW in chunk_decisions:
+                for remaining in pending:
+                    remaining.cancel()
+                logger.info(f"AVP batch short-circuited after Allow ({len(chunks) - len(pending)}/{len(chunks)} chunks evaluated)")
+                return decisions
+
+    return decisions
@@ -0,0 +1,271 @@
+"""Cache de decisiones de AWS Verified Permissions (AVP).
+
+Las decisiones se indexan por (policy store, versión del policy store, principal,
+recurso, acción) y se guardan con TTL distintos para Allow y Deny. Cambiar la
+versión de un policy store deja inaccesibles todas las decisiones anteriores de ese
+store. La versión efectiva combina:
+
+  - AVP_POLICY_STORE_VERSION, fijada en el deploy (alcanza a todos los contenedores nuevos).
+  - La versión compartida que escribe invalidate en la tabla DynamoDB: cada contenedor
+    la relee cada AVP_POLICY_STORE_VERSION_REFRESH_SECONDS, de modo que una revocación
+    llega a todos en ese plazo. Sin AVP_DECISION_CACHE_TABLE, invalidate solo afecta al
+    contenedor que la ejecuta y la única invalidación global es cambiar
+    AVP_POLICY_STORE_VERSION y redesplegar.
+
+Backends disponibles, consultados en orden:
+  - InMemoryDecisionBackend: LRU en el proceso, vive mientras el contenedor esté caliente.
+  - DynamoDBDecisionBackend: tabla compartida entre contenedores (atributo TTL `expires_at`).
+    Con AVP_DECISION_CACHE_ENDPOINT_URL puede apuntar a DynamoDB Local.
+
+get_many/put_many resuelven todos los recursos de una solicitud con un BatchGetItem
+(hasta 100 claves) y un BatchWriteItem (batch_writer) por nivel, en lugar de un
+GetItem/PutItem secuencial por recurso.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import aws_clients
+
+logger = logging.getLogger()
+
+AVP_DECISION_ALLOW_TTL = float(os.environ.get("AVP_DECISION_ALLOW_TTL", "60"))
+AVP_DECISION_DENY_TTL = float(os.environ.get("AVP_DECISION_DENY_TTL", "10"))
+AVP_DECISION_CACHE_SIZE = int(os.environ.get("AVP_DECISION_CACHE_SIZE", "4096"))
+AVP_DECISION_CACHE_TABLE = os.environ.get("AVP_DECISION_CACHE_TABLE")
+AVP_DECISION_CACHE_ENDPOINT_URL = os.environ.get("AVP_DECISION_CACHE_ENDPOINT_URL")
+AVP_POLICY_STORE_VERSION = os.environ.get("AVP_POLICY_STORE_VERSION", "0")
+AVP_POLICY_STORE_VERSION_REFRESH_SECONDS = float(os.environ.get("AVP_POLICY_STORE_VERSION_REFRESH_SECONDS", "5"))
+
+ALLOW = "Allow"
+DYNAMODB_BATCH_GET_SIZE = 100  # Máximo de claves permitido por batch_get_item
+DYNAMODB_BATCH_GET_ATTEMPTS = 3  # Reintentos de UnprocessedKeys antes de tratarlas como miss
+
+
+class InMemoryDecisionBackend:
+    """LRU en memoria con expiración por entrada."""
+
+    def __init__(self, max_size=AVP_DECISION_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            decision, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return decision, expires_at
+
+    def put(self, key, decision, expires_at):
+        with self._lock:
+            self._entries[key] = (decision, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_many(self, keys, now):
+        found = {}
+        for key in keys:
+            cached = self.get(key, now)
+            if cached is not None:
+                found[key] = cached
+        return found
+
+    def put_many(self, entries):
+        for key, decision, expires_at in entries:
+            self.put(key, decision, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DynamoDBDecisionBackend:
+    """Tabla DynamoDB compartida (PK `cache_key`, TTL en `expires_at`)."""
+
+    def __init__(self, table, dynamodb=None):
+        self.table = table
+        self.dynamodb = dynamodb  # Recurso DynamoDB para batch_get_item (la tabla no lo expone)
+
+    @staticmethod
+    def _decision(item, now):
+        # El borrado por TTL de DynamoDB es diferido: se valida el vencimiento al leer
+        if not item or "decision" not in item or float(item["expires_at"]) <= now:
+            return None
+        return item["decision"], float(item["expires_at"])
+
+    def get(self, key, now):
+        return self._decision(self.table.get_item(Key={"cache_key": key}).get("Item"), now)
+
+    def put(self, key, decision, expires_at):
+        self.table.put_item(Item={"cache_key": key, "decision": decision, "expires_at": int(expires_at) + 1})
+
+    def get_many(self, keys, now):
+        """Lee las claves con batch_get_item de a DYNAMODB_BATCH_GET_SIZE. Retorna {clave: (decisión, expires_at)}."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        if self.dynamodb is None or len(keys) == 1:
+            for key in keys:
+                cached = self.get(key, now)
+                if cached is not None:
+                    found[key] = cached
+            return found
+
+        table_name = self.table.name
+        for i in range(0, len(keys), DYNAMODB_BATCH_GET_SIZE):
+            request = {table_name: {"Keys": [{"cache_key": key} for key in keys[i:i + DYNAMODB_BATCH_GET_SIZE]]}}
+            for _ in range(DYNAMODB_BATCH_GET_ATTEMPTS):
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                for item in response.get("Responses", {}).get(table_name, []):
+                    cached = self._decision(item, now)
+                    if cached is not None:
+                        found[item["cache_key"]] = cached
+                request = response.get("UnprocessedKeys") or {}
+                if not request:
+                    break
+        return found
+
+    def put_many(self, entries):
+        with self.table.batch_writer(overwrite_by_pkeys=["cache_key"]) as batch:
+            for key, decision, expires_at in entries:
+                batch.put_item(Item={"cache_key": key, "decision": decision, "expires_at": int(expires_at) + 1})
+
+    def get_version(self, policy_store_id):
+        """Versión compartida del policy store, o None si nunca se invalidó."""
+        item = self.table.get_item(Key={"cache_key": f"version#{policy_store_id}"}, ConsistentRead=True).get("Item")
+        return item["version"] if item else None
+
+    def set_version(self, policy_store_id, version):
+        # Sin expires_at: la versión no expira por TTL
+        self.table.put_item(Item={"cache_key": f"version#{policy_store_id}", "version": version})
+
+    def clear(self):
+        """Las entradas compartidas se invalidan cambiando la versión del policy store."""
+
+
+class DecisionCache:
+    """Cache de decisiones AVP con TTL separados para Allow y Deny."""
+
+    def __init__(self, backends, allow_ttl=AVP_DECISION_ALLOW_TTL, deny_ttl=AVP_DECISION_DENY_TTL, clock=time.time,
+                 version_refresh_seconds=AVP_POLICY_STORE_VERSION_REFRESH_SECONDS):
+        self.backends = backends
+        self.allow_ttl = allow_ttl
+        self.deny_ttl = deny_ttl
+        self.version_refresh_seconds = version_refresh_seconds
+        self._clock = clock
+        self._versions = {}  # policy_store_id -> (versión efectiva, momento de lectura)
+        self.hits = 0
+        self.misses = 0
+
+    def _shared_backends(self):
+        return [backend for backend in self.backends if hasattr(backend, "get_version")]
+
+    def policy_store_version(self, policy_store_id):
+        """Versión efectiva: AVP_POLICY_STORE_VERSION más la versión compartida, releída cada version_refresh_seconds."""
+        now = self._clock()
+        cached = self._versions.get(policy_store_id)
+        if cached and now - cached[1] < self.version_refresh_seconds:
+            return cached[0]
+
+        version = cached[0] if cached else AVP_POLICY_STORE_VERSION
+        for backend in self._shared_backends():
+            try:
+                shared = backend.get_version(policy_store_id)
+            except Exception as e:
+                # Se conserva la última versión conocida hasta el próximo refresco
+                logger.warning(f"Decision cache backend {type(backend).__name__} unavailable: {e}")
+                continue
+            version = AVP_POLICY_STORE_VERSION if shared is None else f"{AVP_POLICY_STORE_VERSION}.{shared}"
+            break
+        self._versions[policy_store_id] = (version, now)
+        return version
+
+    def invalidate(self, policy_store_id, version=None):
+        """Invalida las decisiones de un policy store publicando una versión nueva en el backend compartido.
+
+        Los demás contenedores la toman en hasta version_refresh_seconds. Sin backend
+        compartido solo se invalida este contenedor (ver AVP_POLICY_STORE_VERSION).
+        """
+        version = str(int(self._clock() * 1000) if version is None else version)
+        shared = self._shared_backends()
+        for backend in shared:
+            backend.set_version(policy_store_id, version)
+        if not shared:
+            logger.warning(f"Decision cache without shared backend: invalidation of {policy_store_id} only applies to this container")
+        self._versions[policy_store_id] = (f"{AVP_POLICY_STORE_VERSION}.{version}", self._clock())
+        for backend in self.backends:
+            backend.clear()
+        logger.info(f"Decision cache invalidated for policy store {policy_store_id} (version {version})")
+
+    def _key(self, policy_store_id, principal, resource, action):
+        raw = json.dumps([policy_store_id, self.policy_store_version(policy_store_id), principal, resource, action], sort_keys=True)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, policy_store_id, principal, resource, action):
+        """Retorna la decisión cacheada o None."""
+        return self.get_many(policy_store_id, principal, [resource], action)[0]
+
+    def get_many(self, policy_store_id, principal, resources, action):
+        """Decisiones cacheadas de cada recurso (None si no está), con una lectura por lote en cada nivel."""
+        keys = [self._key(policy_store_id, principal, resource, action) for resource in resources]
+        now = self._clock()
+        found = {}
+        for index, backend in enumerate(self.backends):
+            missing = [key for key in keys if key not in found]
+            if not missing:
+                break
+            try:
+                cached = backend.get_many(missing, now)
+            except Exception as e:
+                logger.warning(f"Decision cache backend {type(backend).__name__} unavailable: {e}")
+                continue
+            if cached and index:
+                # Se completa el nivel más rápido con las decisiones encontradas en uno más lento
+                for faster in self.backends[:index]:
+                    faster.put_many([(key, decision, expires_at) for key, (decision, expires_at) in cached.items()])
+            found.update(cached)
+
+        decisions = [found[key][0] if key in found else None for key in keys]
+        hits = sum(1 for decision in decisions if decision is not None)
+        self.hits += hits
+        self.misses += len(decisions) - hits
+        return decisions
+
+    def put(self, policy_store_id, principal, resource, action, decision):
+        self.put_many(policy_store_id, principal, [(resource, decision)], action)
+
+    def put_many(self, policy_store_id, principal, decisions, action):
+        """Guarda [(recurso, decisión)] en todos los niveles con una escritura por lote en cada uno."""
+        now = self._clock()
+        entries = [
+            (self._key(policy_store_id, principal, resource, action), decision,
+             now + (self.allow_ttl if decision == ALLOW else self.deny_ttl))
+            for resource, decision in decisions
+        ]
+        if not entries:
+            return
+        for backend in self.backends:
+            try:
+                backend.put_many(entries)
+            except Exception as e:
+                logger.warning(f"Decision cache backend {type(backend).__name__} unavailable: {e}")
+
+
+def build_decision_cache():
+    """Cache por defecto: memoria del proceso y, si AVP_DECISION_CACHE_TABLE está definida, DynamoDB."""
+    backends = [InMemoryDecisionBackend()]
+    if AVP_DECISION_CACHE_TABLE:
+        table = aws_clients.table(AVP_DECISION_CACHE_TABLE, endpoint_url=AVP_DECISION_CACHE_ENDPOINT_URL)
+        dynamodb = aws_clients.resource("dynamodb", endpoint_url=AVP_DECISION_CACHE_ENDPOINT_URL)
+        backends.append(DynamoDBDecisionBackend(table, dynamodb))
+    return DecisionCache(backends)
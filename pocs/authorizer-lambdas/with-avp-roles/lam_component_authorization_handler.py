@@ -19,7 +19,7 @@ class ComponentAuthorizationHandler(AbstractHandler):
 
     def get_resource(self, event):
         """Obtiene el recurso de la solicitud."""
-        logger.info(f"Got event in getResource: {event}")
+        self.log_event("Got event in getResource", event)
 
         path_params = event.get("pathParameters", {})
         org_id = path_params.get("orgId")
@@ -30,7 +30,9 @@ class ComponentAuthorizationHandler(AbstractHandler):
         logger.info(f"orgId to send: {org_id}")
         return {"entityId": org_id, "entityType": "ORGANIZATION_CONTAINER"}
 
+# Instancia única por contenedor, inicializada durante el init de la Lambda
+handler = ComponentAuthorizationHandler().warm_up()
+
 # Handler para AWS Lambda
 def lambda_handler(event, context):
-    handler = ComponentAuthorizationHandler()
     return handler.handle_request(event, context)
\ No newline at end of file
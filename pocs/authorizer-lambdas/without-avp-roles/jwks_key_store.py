@@ -0,0 +1,76 @@
+"""Almacén de claves públicas JWKS (Cognito) con cache y refresco controlado.
+
+Cada JWK se convierte una sola vez en un objeto de clave pública, de modo que
+validar un token solo cuesta la verificación de la firma. Las claves se refrescan:
+  - cuando vence JWKS_CACHE_TTL,
+  - cuando llega un token con un `kid` desconocido (rotación de claves en Cognito),
+y nunca más de una vez cada JWKS_MIN_REFRESH_INTERVAL segundos, para evitar
+tormentas de descargas ante tokens con `kid` inválidos. Si una descarga falla se
+conservan las últimas claves conocidas.
+
+La URL es configurable, por lo que puede probarse contra un stub HTTP local.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+
+import jwt
+
+logger = logging.getLogger()
+
+JWKS_CACHE_TTL = float(os.environ.get("JWKS_CACHE_TTL", "3600"))
+JWKS_MIN_REFRESH_INTERVAL = float(os.environ.get("JWKS_MIN_REFRESH_INTERVAL", "30"))
+JWKS_FETCH_TIMEOUT = float(os.environ.get("JWKS_FETCH_TIMEOUT", "3"))
+
+
+class JwksKeyStore:
+    """Claves públicas de un endpoint JWKS, indexadas por `kid`."""
+
+    def __init__(self, jwks_url, ttl=JWKS_CACHE_TTL, min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL, timeout=JWKS_FETCH_TIMEOUT):
+        self.jwks_url = jwks_url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._keys = {}
+        self._fetched_at = None
+        self._last_attempt = None
+        self._lock = threading.Lock()
+
+    def get_key(self, kid):
+        """Retorna la clave pública para `kid`, refrescando el JWKS si es necesario."""
+        if self._fetched_at is None or time.monotonic() - self._fetched_at >= self.ttl:
+            self.refresh()
+
+        key = self._keys.get(kid)
+        if key is None:
+            # kid desconocido: puede tratarse de una rotación de claves reciente
+            self.refresh()
+            key = self._keys.get(kid)
+
+        if key is None:
+            raise Exception("No matching key found for JWT validation")
+        return key
+
+    def refresh(self):
+        """Descarga y parsea el JWKS, respetando el intervalo mínimo entre intentos."""
+        with self._lock:
+            now = time.monotonic()
+            if self._last_attempt is not None and now - self._last_attempt < self.min_refresh_interval:
+                return
+            self._last_attempt = now
+
+            try:
+                logger.info(f"Descargando claves públicas desde {self.jwks_url}")
+                with urllib.request.urlopen(self.jwks_url, timeout=self.timeout) as response:
+                    jwks = json.loads(response.read())
+                self._keys = {
+                    key["kid"]: jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(key))
+                    for key in jwks["keys"]
+                }
+                self._fetched_at = now
+                logger.info(f"{len(self._keys)} claves públicas cargadas")
+            except Exception as e:
+                logger.error(f"Error al obtener claves públicas desde {self.jwks_url}: {str(e)}", exc_info=True)
@@ -1,18 +1,19 @@
-import json
 import jwt  # PyJWT library (pip install PyJWT)
-import boto3
-import urllib.request
 import logging
 import os
 import uuid
-from datetime import datetime
+import aws_clients
+from audit_emitter import AuditEmitter
+from jwks_key_store import JwksKeyStore
+from policy_builder import PolicyBuilder
+from token_cache import TokenCache
 
 # Configuración de logs
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
 # Configuración de AWS
-sqs = boto3.client('sqs')
+sqs = aws_clients.client('sqs')
 
 # Variables de entorno
 COGNITO_USERPOOL_ID = os.environ.get("COGNITO_USERPOOL_ID", "us-east-1_example")
@@ -22,47 +23,25 @@ SQS_AUDIT_QUEUE_URL = os.environ.get("SQS_AUDIT_QUEUE_URL")
 COGNITO_ISSUER = f"https://cognito-idp.{COGNITO_REGION}.amazonaws.com/{COGNITO_USERPOOL_ID}"
 COGNITO_JWKS_URL = f"{COGNITO_ISSUER}/.well-known/jwks.json"
 
-# Obtener claves públicas de Cognito
-def get_cognito_public_keys():
-    try:
-        logger.info(f"Descargando claves públicas de Cognito desde {COGNITO_JWKS_URL}")
-        response = urllib.request.urlopen(COGNITO_JWKS_URL)
-        keys = json.loads(response.read())["keys"]
-        return {key["kid"]: key for key in keys}
-    except Exception as e:
-        logger.error(f"Error al obtener claves públicas de Cognito: {str(e)}", exc_info=True)
-        return {}
-
-COGNITO_KEYS = get_cognito_public_keys()
-
-# Enviar evento de auditoría a SQS
-def send_audit_event(transaction_id, path, request_body, transaction_output, request_id):
-    """Envía un mensaje de auditoría a SQS."""
-    audit_message = {
-        "transaction_id": transaction_id,
-        "type": "auth-request",
-        "timestamp": datetime.utcnow().strftime("%Y-%m-%d-%H.%M.%S.%f"),
-        "path": path,
-        "request_body": request_body,
-        "transaction_output": transaction_output,
-        "aws_request_id": request_id
-    }
-    try:
-        sqs.send_message(QueueUrl=SQS_AUDIT_QUEUE_URL, MessageBody=json.dumps(audit_message))
-        logger.info(f"Evento de auditoría enviado: {audit_message}")
-    except Exception as e:
-        logger.error(f"Error al enviar evento de auditoría: {str(e)}", exc_info=True)
+# Claves públicas de Cognito: se descargan en el primer uso y se refrescan por TTL o kid desconocido
+cognito_keys = JwksKeyStore(COGNITO_JWKS_URL)
+
+# Claims y políticas de tokens ya verificados, válidos hasta el exp del token
+token_cache = TokenCache()
+
+# La decisión depende solo del token: por defecto el Allow cubre todo el stage, de modo que
+# API Gateway puede reutilizar el resultado cacheado para cualquier ruta de la sesión
+policy_builder = PolicyBuilder(default_granularity="api")
+
+# Eventos de auditoría con envío por lotes a SQS (ver audit_emitter)
+audit = AuditEmitter(sqs, SQS_AUDIT_QUEUE_URL, "auth-request")
 
 # Validar JWT con Cognito
 def validate_jwt(token):
     try:
         headers = jwt.get_unverified_header(token)
-        key = COGNITO_KEYS.get(headers["kid"])
+        public_key = cognito_keys.get_key(headers["kid"])
 
-        if not key:
-            raise Exception("No matching key found for JWT validation")
-
-        public_key = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(key))
         decoded_token = jwt.decode(
             token,
             public_key,
@@ -77,7 +56,18 @@ def validate_jwt(token):
         logger.error(f"Error al validar JWT: {str(e)}", exc_info=True)
         raise
 
+# Construir la política de autorización a partir de los claims del JWT
+def build_policy(decoded_token, method_arn):
+    user_id = decoded_token.get("sub")
+    context = {
+        "userId": user_id,
+        "email": decoded_token.get("email", "N/A"),
+        "orgId": decoded_token.get("custom:orgId", "N/A")  # Atributo personalizado
+    }
+    return policy_builder.build(user_id, "Allow", method_arn, context=context)
+
 # Función principal del Lambda Authorizer
+@audit.flush_on_return
 def lambda_handler(event, context):
     request_id = context.aws_request_id if context else "N/A"
     transaction_id = str(uuid.uuid4())
@@ -88,55 +78,34 @@ def lambda_handler(event, context):
         token = event["authorizationToken"].split(" ")[1]  # Bearer <token>
         logger.info("Token de autorización recibido, iniciando validación...")
 
-        # Validar y decodificar el JWT
-        decoded_token = validate_jwt(token)
-
-        # Extraer datos del JWT
-        user_id = decoded_token.get("sub")
-        email = decoded_token.get("email", "N/A")
-        org_id = decoded_token.get("custom:orgId", "N/A")  # Atributo personalizado
-
-        # Construir la política de autorización
-        policy = {
-            "principalId": user_id,
-            "policyDocument": {
-                "Version": "2012-10-17",
-                "Statement": [
-                    {
-                        "Action": "execute-api:Invoke",
-                        "Effect": "Allow",
-                        "Resource": event["methodArn"]
-                    }
-                ]
-            },
-            "context": {
-                "userId": user_id,
-                "email": email,
-                "orgId": org_id
-            }
-        }
+        method_arn = event["methodArn"]
+        scope = policy_builder.cache_scope(method_arn)
+        policy = token_cache.get(token, scope=scope)
+
+        if policy is None:
+            # Validar y decodificar el JWT (solo si no fue verificado antes en este contenedor)
+            decoded_token = token_cache.get(token)
+            if decoded_token is None:
+                decoded_token = validate_jwt(token)
+                token_cache.put(token, decoded_token, decoded_token.get("exp"))
+
+            policy = build_policy(decoded_token, method_arn)
+            token_cache.put(token, policy, token_cache.policy_expiry(decoded_token), scope=scope)
+        else:
+            logger.info("Política obtenida de la cache de tokens verificados")
+
+        user_id = policy["context"]["userId"]
+        org_id = policy["context"]["orgId"]
 
         transaction_output = {"status": "ALLOW", "userId": user_id, "orgId": org_id}
-        send_audit_event(transaction_id, "/auth/validate", {"token": "***"}, transaction_output, request_id)
+        audit.emit(transaction_id, "/auth/validate", {"token": "***"}, transaction_output, request_id)
 
-        logger.info(f"Autorización concedida para el usuario {user_id}. Contexto generado: {policy['context']}")
+        logger.info(f"Autorización concedida para el usuario {user_id}. Contexto generado: {policy['context']}. Cache de tokens: {token_cache.stats()}")
         return policy
 
     except Exception as e:
         logger.warning("Fallo en la autorización. Retornando política de denegación.", exc_info=True)
         transaction_output = {"status": "DENY", "error": str(e)}
-        send_audit_event(transaction_id, "/auth/validate", {"token": "***"}, transaction_output, request_id)
-
-        return {
-            "principalId": "unauthorized",
-            "policyDocument": {
-                "Version": "2012-10-17",
-                "Statement": [
-                    {
-                        "Action": "execute-api:Invoke",
-                        "Effect": "Deny",
-                        "Resource": event["methodArn"]
-                    }
-                ]
-            }
-        }
\ No newline at end of file
+        audit.emit(transaction_id, "/auth/validate", {"token": "***"}, transaction_output, request_id)
+
+        return policy_builder.build("unauthorized", "Deny", event["methodArn"])
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""Archivo comprimido de auditoría vs lecturas sobre la tabla operativa.
+
+Genera eventos de auditoría repartidos en --hours horas, los escribe en la tabla
+por tiempo (audit_index) y en el archivo de audit_archive (directorio temporal) y
+compara dos consultas de analítica:
+
+  - investigación: eventos de un tipo en la última hora con un filtro por path
+  - bulk: todos los eventos de las últimas 24 h (p.ej. un reporte diario)
+
+Para la tabla se reportan las unidades de lectura (Query por particiones type#hora);
+para el archivo, los archivos leídos/descartados por el rango de su nombre y los
+bytes comprimidos leídos, sin ninguna lectura sobre DynamoDB.
+
+Uso:
+    python bench_audit_archive.py [--events 50000] [--hours 72] [--codec zstd|gzip] [--max-file-mb 1]
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from local_aws import ApiCalls, LocalDynamoResource, load_handler
+
+TYPES = ["prepare-notification", "email-notification", "sms-notification", "push-notification"]
+PATHS = ["/users/emails", "/users/sms", "/users/push"]
+
+
+def default_codec():
+    try:
+        import zstandard  # noqa: F401
+        return "zstd"
+    except ImportError:
+        return "gzip"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--hours", type=int, default=72)
+    parser.add_argument("--codec", default=default_codec())
+    parser.add_argument("--max-file-mb", type=float, default=1.0, help="Umbral de tamaño por archivo (sin comprimir)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    audit_index = load_handler("notification-lambdas", "audit_index", {"AUDIT_PARTITION_BUCKET": "hour"})
+    audit_archive = load_handler("notification-lambdas", "audit_archive", {})
+
+    table = LocalDynamoResource(ApiCalls()).Table("bench_audit_events_by_time")
+    archive = audit_archive.AuditArchive(
+        audit_archive.LocalArchiveStore(tempfile.mkdtemp(prefix="coto-audit-archive-")),
+        codec=args.codec, max_bytes=int(args.max_file_mb * 1024 * 1024), max_age_seconds=3600,
+    )
+
+    end = datetime.now(timezone.utc).replace(microsecond=0)
+    start = end - timedelta(hours=args.hours)
+    offsets = sorted(random.uniform(0, args.hours * 3600) for _ in range(args.events))
+    raw_bytes, archive_seconds = 0, 0.0
+    for offset in offsets:
+        when = start + timedelta(seconds=offset)
+        transaction_id, event_type = str(uuid.uuid4()), random.choice(TYPES)
+        event = {
+            **audit_index.index_attributes(event_type, transaction_id, when, bucket="hour", shards=1),
+            "transaction_id": transaction_id,
+            "type": event_type,
+            "timestamp": when.strftime(audit_index.LEGACY_TIMESTAMP_FORMAT),
+            "path": random.choice(PATHS),
+            "request_body": {"message_count": 10, "message_ids": [str(uuid.uuid4()) for _ in range(10)]},
+            "transaction_output": {"status": "sent", "sns_message_id": str(uuid.uuid4())},
+            "aws_request_id": "bench",
+        }
+        table.put_item(Item=event)
+        archive_start = time.perf_counter()
+        archive.append([event])
+        archive_seconds += time.perf_counter() - archive_start
+        raw_bytes += len(json.dumps(event, default=str))
+    archive_start = time.perf_counter()
+    archive.flush()
+    archive_seconds += time.perf_counter() - archive_start
+
+    print(f"{args.events} eventos en {args.hours} h, codec {args.codec}")
+    print(f"archivo: {archive.files_written} archivos, {archive.bytes_written:,} bytes comprimidos de {raw_bytes:,} "
+          f"({raw_bytes / max(archive.bytes_written, 1):.1f}x), {archive_seconds * 1e6 / args.events:.1f} µs por evento")
+
+    queries = [
+        ("investigación 1 h", ["email-notification"], end - timedelta(hours=1), lambda event: event["path"] == "/users/emails"),
+        ("bulk 24 h", TYPES, end - timedelta(hours=24), None),
+    ]
+    print(f"\n{'consulta':<18} {'eventos':>8} {'RCU tabla':>10} {'archivos leídos':>16} {'descartados':>12} {'bytes leídos':>13} {'ms archivo':>11}")
+    for name, types, query_start, predicate in queries:
+        query = audit_index.AuditQuery(table, bucket="hour", shards=1, layout="time")
+        table_events = [event for event in query.events(types, query_start, end, page_size=1000)
+                        if predicate is None or predicate(event)]
+
+        reader = audit_archive.ArchiveReader(archive.store)
+        read_start = time.perf_counter()
+        archived_events = list(reader.scan(query_start, end, types, predicate, columns=["transaction_id", "type", "epoch_ms"]))
+        read_ms = (time.perf_counter() - read_start) * 1000
+
+        if {event["transaction_id"] for event in archived_events} != {event["transaction_id"] for event in table_events}:
+            raise SystemExit(f"Resultados distintos para '{name}': {len(archived_events)} vs {len(table_events)}")
+        print(f"{name:<18} {len(archived_events):>8} {query.consumed_capacity:>10.1f} {reader.files_read:>16} "
+              f"{reader.files_skipped:>12} {reader.bytes_read:>13,} {read_ms:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
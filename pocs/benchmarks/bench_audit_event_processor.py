@@ -0,0 +1,69 @@
+"""Benchmark de round trips por registro en lam_coto_audit_event_processor_handler.
+
+Compara el flujo anterior (put_item + delete_message por registro) con el
+flujo actual (batch_writer + batchItemFailures / delete_message_batch).
+
+Uso:
+    python bench_audit_event_processor.py [--records 1000] [--batch-size 10] [--latency-ms 5]
+"""
+import argparse
+import json
+import time
+
+from local_aws import ApiCalls, LocalDynamoTable, LocalSQS, load_handler
+
+QUEUE_URL = "https://sqs.local/000000000000/coto-audit"
+
+
+def legacy_process(handler, event):
+    """Réplica del procesamiento original: dos llamadas secuenciales por registro."""
+    for record in event["Records"]:
+        handler.audit_table.put_item(Item=handler.build_audit_event(record, "bench"))
+        handler.sqs.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=record["receiptHandle"])
+
+
+def run(handler, process, records, batch_size, latency):
+    calls = ApiCalls(latency)
+    sqs = LocalSQS(ApiCalls())
+    handler.sqs = LocalSQS(calls)
+    handler.audit_table = LocalDynamoTable(calls)
+
+    for i in range(records):
+        sqs.send_message(QueueUrl=QUEUE_URL, MessageBody=json.dumps({"transaction_id": f"tx-{i}", "type": "bench"}))
+
+    start = time.perf_counter()
+    while sqs.queues[QUEUE_URL]:
+        process(handler, sqs.to_lambda_event(QUEUE_URL, batch_size))
+    elapsed = time.perf_counter() - start
+
+    return calls, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    handler = load_handler("notification-lambdas", "lam_coto_audit_event_processor_handler", {
+        "SQS_AUDIT_QUEUE_URL": QUEUE_URL,
+        "DYNAMODB_AUDIT_TABLE": "audit_events",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    })
+
+    scenarios = [
+        ("legacy put_item + delete_message", legacy_process),
+        ("batch_writer + batchItemFailures", lambda h, e: h.process_sqs_messages(e, "bench")),
+    ]
+
+    print(f"{'escenario':<36} {'llamadas':>9} {'por registro':>13} {'tiempo (s)':>11}")
+    for name, process in scenarios:
+        calls, elapsed = run(handler, process, args.records, args.batch_size, args.latency_ms / 1000)
+        print(f"{name:<36} {calls.total():>9} {calls.total() / args.records:>13.3f} {elapsed:>11.3f}")
+        for operation, count in sorted(calls.items()):
+            print(f"    {operation:<32} {count:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Bytes de auditoría escritos por notificación según AUDIT_PAYLOAD_MODE.
+
+Ejecuta el pipeline local de bench_notification_pipeline con cada modo del emisor:
+
+  - raw:     payloads completos y sin guarda de tamaño (comportamiento anterior)
+  - compact: proyección de audit_projection con guarda de AUDIT_MAX_EVENT_BYTES
+  - full:    proyección + copia completa en el bucket de claim-check
+
+y reporta los bytes escritos en DynamoDB (tamaño aproximado del ítem serializado) y
+en S3 por notificación entregada, el ítem más grande y cuántos superan los 400 KB.
+
+Uso:
+    python bench_audit_payload_size.py [--requests 30] [--recipients 2000] [--padding-chars 60000]
+"""
+import argparse
+import json
+import random
+from collections import defaultdict
+
+from bench_notification_pipeline import build_pipeline, run_request
+from local_aws import ApiCalls
+
+DYNAMODB_MAX_ITEM_BYTES = 400 * 1024
+CLAIM_CHECK_BUCKET = "coto-claim-checks"
+MODES = ("raw", "compact", "full")
+
+
+def configure(pipeline, mode, max_event_bytes):
+    """Aplica el modo de payload a los emisores de auditoría de todos los handlers."""
+    for module in [pipeline["prepare"], *pipeline["channels"].values()]:
+        module.audit.payload_mode = mode
+        module.audit.max_event_bytes = 0 if mode == "raw" else max_event_bytes
+        module.claim_checks.bucket = CLAIM_CHECK_BUCKET if mode == "full" else None
+
+
+def audit_emitters(pipeline):
+    return [module.audit for module in [pipeline["prepare"], *pipeline["channels"].values()]]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--recipients", type=int, default=2000, help="Destinatarios por solicitud")
+    parser.add_argument("--users", type=int, default=5000, help="Usuarios cargados en UsersTable")
+    parser.add_argument("--padding-chars", type=int, default=60000, help="Caracteres agregados al contenido de cada mensaje")
+    parser.add_argument("--max-event-bytes", type=int, default=200 * 1024)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    pipeline = build_pipeline(ApiCalls(), args.users)
+    user_ids = [str(user) for user in range(args.users)]
+    channels = ["email", "sms", "push"]
+    padding = " lorem ipsum" * (args.padding_chars // 12)
+
+    print(f"{args.requests} solicitudes x {args.recipients} destinatarios, contenido de {args.padding_chars} caracteres")
+    print(f"\n{'modo':<8} {'eventos':>8} {'B/notif DynamoDB':>17} {'B/notif S3':>11} {'ítem máx':>10} {'> 400 KB':>9} {'descartados':>12}")
+    for mode in MODES:
+        random.seed(args.seed)
+        configure(pipeline, mode, args.max_event_bytes)
+        for table in pipeline["dynamodb"].tables.values():
+            table.items.clear()
+        pipeline["sns"].published.clear()
+        pipeline["s3"].objects = {key: value for key, value in pipeline["s3"].objects.items() if key[0] != CLAIM_CHECK_BUCKET}
+        dropped_before = sum(emitter.dropped for emitter in audit_emitters(pipeline))
+
+        latencies = defaultdict(list)
+        for index in range(args.requests):
+            recipients = random.sample(user_ids, min(args.recipients, len(user_ids)))
+            run_request(pipeline, channels[index % len(channels)], recipients, index, latencies, padding)
+
+        notifications = max(1, sum(
+            len(json.loads(message["Message"]).get("recipients", [])) for message in pipeline["sns"].published
+        ))
+        item_sizes = [
+            len(json.dumps(item, default=str).encode("utf-8"))
+            for table in pipeline["dynamodb"].tables.values() for item in table.items
+        ]
+        s3_bytes = sum(len(body) for (bucket, _), (body, _) in pipeline["s3"].objects.items() if bucket == CLAIM_CHECK_BUCKET)
+        oversized = sum(1 for size in item_sizes if size > DYNAMODB_MAX_ITEM_BYTES)
+        dropped = sum(emitter.dropped for emitter in audit_emitters(pipeline)) - dropped_before
+
+        print(f"{mode:<8} {len(item_sizes):>8} {sum(item_sizes) / notifications:>17,.1f} {s3_bytes / notifications:>11,.1f} "
+              f"{max(item_sizes, default=0):>10,} {oversized:>9} {dropped:>12}")
+
+
+if __name__ == "__main__":
+    main()
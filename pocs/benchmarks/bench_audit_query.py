@@ -0,0 +1,142 @@
+"""Unidades de lectura por consulta de panel: tabla histórica vs layout por tiempo.
+
+Carga eventos de auditoría repartidos en --hours horas en la tabla con la clave
+histórica (transaction_id, timestamp), los migra con audit_backfill a la tabla
+particionada por tiempo (audit_index) y ejecuta la consulta típica del panel de
+monitoreo, "eventos de tipo X en las últimas --window-hours horas":
+
+  - histórica: Scan con FilterExpression por tipo y timestamp (paga toda la tabla)
+  - por tiempo: AuditQuery (Query sobre las particiones type#hora del rango)
+
+Sin --endpoint-url usa la tabla en memoria de local_aws, que calcula las unidades
+como DynamoDB; con --endpoint-url corre contra DynamoDB Local (requiere boto3) y
+reporta el ConsumedCapacity que devuelve el servicio.
+
+Uso:
+    python bench_audit_query.py [--events 20000] [--hours 72] [--window-hours 1] [--item-bytes 1024]
+        [--endpoint-url http://localhost:8000]
+"""
+import argparse
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from local_aws import ApiCalls, LocalDynamoResource, load_handler
+
+TYPES = ["prepare-notification", "email-notification", "sms-notification", "push-notification"]
+LEGACY_TABLE = "bench_audit_events"
+TIME_TABLE = "bench_audit_events_by_time"
+
+
+def create_tables(endpoint_url, audit_index, calls):
+    """Retorna las tablas (histórica, por tiempo), en memoria o en DynamoDB Local."""
+    if not endpoint_url:
+        dynamodb = LocalDynamoResource(calls)
+        return dynamodb.Table(LEGACY_TABLE), dynamodb.Table(TIME_TABLE)
+
+    aws_clients = load_handler("notification-lambdas", "aws_clients", {})
+    dynamodb = aws_clients.resource("dynamodb", endpoint_url=endpoint_url)
+    for table in (LEGACY_TABLE, TIME_TABLE):
+        try:
+            dynamodb.Table(table).delete()
+            dynamodb.Table(table).wait_until_not_exists()
+        except Exception:
+            pass
+    dynamodb.create_table(
+        TableName=LEGACY_TABLE,
+        KeySchema=[{"AttributeName": "transaction_id", "KeyType": "HASH"}, {"AttributeName": "timestamp", "KeyType": "RANGE"}],
+        AttributeDefinitions=[{"AttributeName": "transaction_id", "AttributeType": "S"}, {"AttributeName": "timestamp", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    ).wait_until_exists()
+    dynamodb.create_table(TableName=TIME_TABLE, **audit_index.TABLE_DEFINITION).wait_until_exists()
+    return dynamodb.Table(LEGACY_TABLE), dynamodb.Table(TIME_TABLE)
+
+
+def legacy_dashboard_query(table, event_type, start, end, legacy_format):
+    """Consulta del panel sobre la clave histórica: Scan filtrado. Retorna (items, unidades, páginas)."""
+    items, units, pages = [], 0.0, 0
+    kwargs = {
+        "FilterExpression": "#type = :type AND #ts BETWEEN :start AND :end",
+        "ExpressionAttributeNames": {"#type": "type", "#ts": "timestamp"},
+        "ExpressionAttributeValues": {
+            ":type": event_type, ":start": start.strftime(legacy_format), ":end": end.strftime(legacy_format),
+        },
+        "ReturnConsumedCapacity": "TOTAL",
+    }
+    while True:
+        response = table.scan(**kwargs)
+        pages += 1
+        units += response.get("ConsumedCapacity", {}).get("CapacityUnits", 0)
+        items.extend(response.get("Items", []))
+        if not response.get("LastEvaluatedKey"):
+            return items, units, pages
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--hours", type=int, default=72, help="Horas de historia cargadas")
+    parser.add_argument("--window-hours", type=int, default=1, help="Rango de la consulta del panel")
+    parser.add_argument("--item-bytes", type=int, default=1024, help="Tamaño aproximado del payload de cada evento")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--endpoint-url", help="Endpoint de DynamoDB Local")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    audit_index = load_handler("notification-lambdas", "audit_index", {"AUDIT_PARTITION_BUCKET": "hour"})
+    audit_backfill = load_handler("notification-lambdas", "audit_backfill", {})
+    legacy_table, time_table = create_tables(args.endpoint_url, audit_index, ApiCalls())
+
+    end = datetime.now(timezone.utc).replace(microsecond=0)
+    history_start = end - timedelta(hours=args.hours)
+    payload = "x" * args.item_bytes
+    with legacy_table.batch_writer() as batch:
+        for _ in range(args.events):
+            when = history_start + timedelta(seconds=random.uniform(0, args.hours * 3600))
+            batch.put_item(Item={
+                "transaction_id": str(uuid.uuid4()),
+                "type": random.choice(TYPES),
+                "timestamp": when.strftime(audit_index.LEGACY_TIMESTAMP_FORMAT),
+                "path": "/users/emails",
+                "request_body": {"preview": payload},
+                "transaction_output": {"status": "sent"},
+                "aws_request_id": "bench",
+            })
+
+    stats = audit_backfill.backfill([(legacy_table, time_table)])
+    print(f"{args.events} eventos en {args.hours} h; backfill: {dict(stats)}")
+
+    start = end - timedelta(hours=args.window_hours)
+    print(f"\nconsulta: eventos de un tipo en las últimas {args.window_hours} h (páginas de {args.page_size})")
+    print(f"{'tipo':<22} {'eventos':>8} {'RCU histórica':>14} {'RCU por tiempo':>15} {'páginas hist.':>14} {'páginas tiempo':>15}")
+    totals = [0.0, 0.0]
+    for event_type in TYPES:
+        legacy_items, legacy_units, legacy_pages = legacy_dashboard_query(
+            legacy_table, event_type, start, end, audit_index.LEGACY_TIMESTAMP_FORMAT
+        )
+
+        query = audit_index.AuditQuery(time_table, bucket="hour", shards=1, layout="time")
+        items, query_pages, cursor = [], 0, None
+        while True:
+            result = query.page([event_type], start, end, args.page_size, cursor)
+            items.extend(result["items"])
+            query_pages += 1
+            cursor = result["cursor"]
+            if not cursor:
+                break
+
+        if {item["transaction_id"] for item in items} != {item["transaction_id"] for item in legacy_items}:
+            raise SystemExit(f"Resultados distintos para {event_type}: {len(items)} vs {len(legacy_items)}")
+        totals[0] += legacy_units
+        totals[1] += query.consumed_capacity
+        print(f"{event_type:<22} {len(items):>8} {legacy_units:>14.1f} {query.consumed_capacity:>15.1f} "
+              f"{legacy_pages:>14} {query_pages:>15}")
+
+    print(f"\nRCU totales: histórica {totals[0]:.1f}, por tiempo {totals[1]:.1f} "
+          f"({totals[0] / max(totals[1], 0.5):.0f}x menos lecturas)")
+
+
+if __name__ == "__main__":
+    main()
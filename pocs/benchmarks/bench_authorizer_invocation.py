@@ -0,0 +1,100 @@
+"""Benchmark del overhead por invocación de lam_component_authorization_handler.
+
+Compara tres configuraciones sobre los mismos eventos REQUEST de API Gateway:
+  - handler nuevo por invocación y log del evento completo (comportamiento anterior),
+  - handler único del contenedor y log del evento completo,
+  - handler único del contenedor y log estructurado de campos seleccionados.
+
+Los logs se emiten en INFO hacia /dev/null para incluir el costo de formateo sin
+ensuciar la salida. Verified Permissions se reemplaza por un doble en memoria.
+
+Uso:
+    python bench_authorizer_invocation.py [--invocations 20000] [--users 50] [--orgs 20]
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import time
+
+from local_aws import ApiCalls, LocalVerifiedPermissions, load_handler
+
+
+def build_token(user):
+    """JWT sin firma válida (el handler de ejemplo no verifica la firma)."""
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+    claims = {"sub": f"user-{user}", "email": f"user{user}@coto.com", "exp": int(time.time()) + 3600}
+    return f"{encode({'alg': 'RS256', 'kid': 'bench'})}.{encode(claims)}.signature"
+
+
+def build_event(token, org):
+    """Evento REQUEST de API Gateway con headers y requestContext de tamaño realista."""
+    headers = {f"X-Header-{i}": "x" * 64 for i in range(20)}
+    headers["Authorization"] = f"Bearer {token}"
+    return {
+        "type": "REQUEST",
+        "methodArn": f"arn:aws:execute-api:us-east-1:000000000000:bench/prod/GET/orgs/{org}",
+        "httpMethod": "GET",
+        "path": f"/orgs/{org}",
+        "headers": headers,
+        "multiValueHeaders": {key: [value] for key, value in headers.items()},
+        "pathParameters": {"orgId": f"org-{org}"},
+        "queryStringParameters": {"page": "1"},
+        "requestContext": {"requestId": f"req-{org}", "stage": "prod", "identity": {"sourceIp": "10.0.0.1", "userAgent": "bench"}}
+    }
+
+
+def run(module, abstract_handler, events, per_invocation, log_mode):
+    abstract_handler.token_cache._entries.clear()
+    abstract_handler.decision_cache.backends[0].clear()
+    handler = module.ComponentAuthorizationHandler().warm_up()
+    handler.event_log_mode = log_mode
+
+    start = time.perf_counter()
+    for event in events:
+        if per_invocation:
+            handler = module.ComponentAuthorizationHandler()
+            handler.event_log_mode = log_mode
+        handler.handle_request(event, None)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invocations", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--orgs", type=int, default=20)
+    args = parser.parse_args()
+
+    module = load_handler("authorizer-lambdas/with-avp-roles", "lam_component_authorization_handler", {"AWS_REGION": "us-east-1"})
+    abstract_handler = load_handler("authorizer-lambdas/with-avp-roles", "abstract_handler", {})
+    abstract_handler.verified_permissions_client = LocalVerifiedPermissions(ApiCalls())
+
+    root = logging.getLogger()
+    devnull = open(os.devnull, "w")
+    root.handlers = [logging.StreamHandler(devnull)]
+    root.setLevel(logging.INFO)
+
+    tokens = [build_token(user) for user in range(args.users)]
+    events = [build_event(tokens[i % args.users], i % args.orgs) for i in range(args.invocations)]
+
+    scenarios = [
+        ("handler por invocación, log completo", True, "full"),
+        ("handler único, log completo", False, "full"),
+        ("handler único, log de campos", False, "fields"),
+    ]
+    print(f"{args.invocations} invocaciones, {args.users} usuarios, {args.orgs} organizaciones")
+    baseline = None
+    for label, per_invocation, log_mode in scenarios:
+        elapsed = run(module, abstract_handler, events, per_invocation, log_mode)
+        baseline = baseline or elapsed
+        print(f"{label:<40} {elapsed / args.invocations * 1e6:>8.1f} us/invocación  ({baseline / elapsed:.2f}x)")
+
+    root.setLevel(logging.WARNING)
+    devnull.close()
+
+
+if __name__ == "__main__":
+    main()
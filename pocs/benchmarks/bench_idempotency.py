@@ -0,0 +1,150 @@
+"""Reentregas de SQS con y sin la capa de idempotencia en el handler de SMS.
+
+Encola --chunks mensajes de una transacción y los procesa con
+lam_coto_sms_notification_handler simulando una falla después de publicar en SNS
+(delete_message_batch no responde). Al vencer el visibility timeout SQS reentrega
+todo el lote y se vuelve a invocar el handler:
+
+  - sin idempotencia: cada reentrega se vuelve a publicar (SMS duplicados)
+  - contenedor caliente: la reentrega se descarta con el LRU en memoria (0 llamadas al store)
+  - contenedor nuevo: la reentrega cuesta una escritura condicional rechazada por mensaje
+
+Luego simula un contenedor que reclama las claves y vence antes de publicar: las
+reentregas dentro del lease no se publican ni se confirman, y al vencer el lease
+se publican todas (ningún chunk perdido).
+
+Uso:
+    python bench_idempotency.py [--chunks 100] [--recipients 50]
+"""
+import argparse
+import json
+import logging
+from collections import Counter
+
+from local_aws import ApiCalls, LocalS3, LocalSNS, LocalSQS, load_handler
+
+QUEUE_URL = "https://sqs.local/000000000000/coto-sms"
+AUDIT_QUEUE_URL = "https://sqs.local/000000000000/coto-audit"
+
+
+def counting_store(idempotency_module):
+    """InMemoryIdempotencyStore que cuenta las operaciones sobre el store."""
+
+    class CountingStore(idempotency_module.InMemoryIdempotencyStore):
+        def __init__(self):
+            super().__init__()
+            self.operations = Counter()
+
+        def put_if_absent(self, *args):
+            self.operations["put_if_absent"] += 1
+            return super().put_if_absent(*args)
+
+        def put(self, *args):
+            self.operations["put"] += 1
+            return super().put(*args)
+
+        def delete(self, key):
+            self.operations["delete"] += 1
+            return super().delete(key)
+
+    return CountingStore()
+
+
+def drain(handler, sqs):
+    while sqs.queues.get(QUEUE_URL):
+        handler.lambda_handler({}, None)
+
+
+def run(handler, idempotency_module, sqs, sns, chunks, recipients, mode):
+    store = counting_store(idempotency_module)
+    handler.idempotency = idempotency_module.Idempotency(store) if mode != "sin idempotencia" else None
+    sns.published.clear()
+
+    for index in range(chunks):
+        sqs.send_message(QueueUrl=QUEUE_URL, MessageBody=json.dumps({
+            "transaction_id": f"tx-{mode}", "chunk_index": index, "chunk_count": chunks,
+            "message": "Su código es 123456", "senderId": "COTO",
+            "recipients": [f"+5411{index:04d}{r:04d}" for r in range(recipients)],
+        }))
+
+    # Primera entrega: se publica pero la Lambda "vence" antes de confirmar
+    delete_message_batch = sqs.delete_message_batch
+    sqs.delete_message_batch = lambda **kwargs: (_ for _ in ()).throw(TimeoutError("Task timed out"))
+    drain(handler, sqs)
+    sqs.delete_message_batch = delete_message_batch
+    first_publishes = len(sns.published)
+    first_operations = sum(store.operations.values())
+
+    # Reentrega tras el visibility timeout
+    redelivered = sqs.expire_in_flight(QUEUE_URL)
+    if mode == "contenedor nuevo":
+        handler.idempotency = idempotency_module.Idempotency(store)
+    drain(handler, sqs)
+
+    duplicates = len(sns.published) - first_publishes
+    retry_operations = sum(store.operations.values()) - first_operations
+    return redelivered, duplicates, retry_operations
+
+
+def run_orphaned_claims(handler, idempotency_module, sqs, sns, chunks, recipients, lease_seconds=300):
+    """Claves IN_PROGRESS de un contenedor que venció antes de publicar. Retorna (publicados en el lease, después)."""
+    now = [1_000_000.0]
+    store = idempotency_module.InMemoryIdempotencyStore()
+    crashed = idempotency_module.Idempotency(store, lease_seconds=lease_seconds, clock=lambda: now[0])
+    handler.idempotency = idempotency_module.Idempotency(store, lease_seconds=lease_seconds, clock=lambda: now[0])
+    sns.published.clear()
+
+    for index in range(chunks):
+        sqs.send_message(QueueUrl=QUEUE_URL, MessageBody=json.dumps({
+            "transaction_id": "tx-huerfano", "chunk_index": index, "chunk_count": chunks,
+            "message": "Su código es 123456", "senderId": "COTO",
+            "recipients": [f"+5411{index:04d}{r:04d}" for r in range(recipients)],
+        }))
+        crashed.claim(idempotency_module.message_key("sms", {"transaction_id": "tx-huerfano", "chunk_index": index}, None))
+
+    # Reentrega dentro del lease: no se publica ni se confirma
+    sqs.expire_in_flight(QUEUE_URL)
+    drain(handler, sqs)
+    within_lease = len(sns.published)
+
+    # Reentrega después del lease: se reclama y se publica
+    now[0] += lease_seconds + 1
+    sqs.expire_in_flight(QUEUE_URL)
+    drain(handler, sqs)
+    return within_lease, len(sns.published) - within_lease
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100)
+    parser.add_argument("--recipients", type=int, default=50, help="Destinatarios por chunk")
+    args = parser.parse_args()
+
+    calls = ApiCalls()
+    sqs, sns = LocalSQS(calls), LocalSNS(calls)
+    env = {
+        "SQS_QUEUE_URL": QUEUE_URL, "SQS_COTO_AUDIT_QUEUE": AUDIT_QUEUE_URL,
+        "SNS_TARGET_TOPIC_ARN": "arn:aws:sns:us-east-1:000000000000:coto-notifications",
+    }
+    aws_clients = load_handler("notification-lambdas", "aws_clients", env)
+    aws_clients.register("sqs", sqs)
+    aws_clients.register("sns", sns)
+    aws_clients.register("s3", LocalS3(calls))
+    handler = load_handler("notification-lambdas", "lam_coto_sms_notification_handler", env)
+    idempotency_module = load_handler("notification-lambdas", "idempotency", {})
+    # Las fallas simuladas de delete_message_batch se registran como errores en cada mensaje
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    print(f"{args.chunks} chunks x {args.recipients} destinatarios, falla después de publicar y reentrega completa")
+    print(f"\n{'escenario':<20} {'reentregados':>13} {'publicaciones dup.':>19} {'SMS duplicados':>15} {'ops. store reintento':>21}")
+    for mode in ("sin idempotencia", "contenedor caliente", "contenedor nuevo"):
+        redelivered, duplicates, retry_operations = run(handler, idempotency_module, sqs, sns, args.chunks, args.recipients, mode)
+        print(f"{mode:<20} {redelivered:>13} {duplicates:>19} {duplicates * args.recipients:>15} {retry_operations:>21}")
+
+    within_lease, after_lease = run_orphaned_claims(handler, idempotency_module, sqs, sns, args.chunks, args.recipients)
+    print(f"\nclaim huérfano ({args.chunks} chunks): {within_lease} publicados dentro del lease, "
+          f"{after_lease} al vencer el lease, {args.chunks - within_lease - after_lease} perdidos")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Prueba de carga local de punta a punta del pipeline de notificaciones.
+
+Ejecuta en el mismo proceso, sin cuenta de AWS:
+
+    prepare-notifications -> SQS -> email / sms / push -> SNS
+                                  \\-> SQS auditoría -> audit-event-processor -> DynamoDB
+
+SQS, SNS, S3 y DynamoDB son los dobles en memoria de local_aws (registrados en
+aws_clients) y UsersTable/otps viven en SQLite. Por cada solicitud se invoca
+prepare-notifications, luego el handler del canal hasta vaciar su cola y por último
+el procesador de auditoría hasta vaciar la cola de auditoría.
+
+Reporta throughput, latencias p50/p95/p99 por etapa y de punta a punta, y llamadas
+a la API de AWS por notificación entregada.
+
+Uso:
+    python bench_notification_pipeline.py [--requests 100] [--recipients 200] [--users 5000]
+        [--channels email,sms,push] [--rate 0] [--latency-ms 0]
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+from local_aws import (ApiCalls, LocalDynamoResource, LocalS3, LocalSNS, LocalSQLConnection, LocalSQS,
+                       load_handler)
+
+SQS_URL = "https://sqs.local/000000000000/"
+QUEUES = {
+    "email": SQS_URL + "coto-email",
+    "sms": SQS_URL + "coto-sms",
+    "push": SQS_URL + "coto-push",
+    "audit": SQS_URL + "coto-audit",
+}
+TEMPLATE_BUCKET = "coto-templates"
+TEMPLATE_NAME = "email-template.html"
+TEMPLATE = "<html><body><h1>%{subject}%</h1><div>%{body}%</div><footer>%{from}%</footer></body></html>"
+
+PATHS = {"email": "/users/emails", "sms": "/users/sms", "push": "/users/push"}
+CHANNEL_MODULES = {
+    "email": "lam_coto_email_notification_handler",
+    "sms": "lam_coto_sms_notification_handler",
+    "push": "lam_coto_push_notification_handler",
+}
+
+SCHEMA = """
+CREATE TABLE UsersTable (user_id TEXT PRIMARY KEY, email TEXT, phone TEXT, device_token TEXT);
+CREATE TABLE otps (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, otp TEXT, user_id TEXT, created_at TIMESTAMP,
+    status TEXT, transaction_type TEXT
+);
+"""
+
+
+class LocalContext:
+    """Contexto de invocación Lambda con el tiempo restante de una invocación de 30 s."""
+
+    def __init__(self, timeout_ms=30000):
+        self.aws_request_id = None
+        self._deadline = time.monotonic() + timeout_ms / 1000
+
+    @classmethod
+    def new(cls):
+        context = cls()
+        context.aws_request_id = f"bench-{random.getrandbits(32):08x}"
+        return context
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def build_pipeline(calls, users):
+    """Importa los handlers contra los dobles locales y carga `users` usuarios en SQLite."""
+    sqs, sns, s3, dynamodb = LocalSQS(calls), LocalSNS(calls), LocalS3(calls), LocalDynamoResource(calls)
+    s3.objects[(TEMPLATE_BUCKET, TEMPLATE_NAME)] = (TEMPLATE.encode("utf-8"), '"template-v1"')
+
+    env = {
+        "DB_HOST": "sqlite", "DB_USER": "bench", "DB_PASS": "bench", "DB_NAME": "bench",
+        "SQS_QUEUE_URL_EMAIL": QUEUES["email"], "SQS_QUEUE_URL_SMS": QUEUES["sms"], "SQS_QUEUE_URL_PUSH": QUEUES["push"],
+        "SQS_COTO_AUDIT_QUEUE": QUEUES["audit"], "SQS_COTO_AUDIT_QUEUE_EMAIL": QUEUES["audit"], "SQS_AUDIT_QUEUE_URL": QUEUES["audit"],
+        "S3_BUCKET_NAME_EMAIL": TEMPLATE_BUCKET, "TEMPLATE_FILE_NAME_EMAIL": TEMPLATE_NAME,
+        "TEMPLATE_CACHE_DIR": tempfile.mkdtemp(prefix="coto-templates-"),
+        "SNS_TOPIC_ARN_EMAIL": "arn:aws:sns:us-east-1:000000000000:coto-email",
+        "SNS_TARGET_TOPIC_ARN": "arn:aws:sns:us-east-1:000000000000:coto-notifications",
+        "DYNAMODB_AUDIT_TABLE": "coto-audit-events",
+    }
+
+    aws_clients = load_handler("notification-lambdas", "aws_clients", env)
+    aws_clients.register("sqs", sqs)
+    aws_clients.register("sns", sns)
+    aws_clients.register("s3", s3)
+    aws_clients.register("dynamodb", dynamodb, kind="resource")
+
+    prepare = load_handler("notification-lambdas", "lam_coto_prepare_notifications_handler", env)
+    channels = {}
+    for channel, module_name in CHANNEL_MODULES.items():
+        # sms y push leen su cola de SQS_QUEUE_URL al importarse
+        channels[channel] = load_handler("notification-lambdas", module_name, {"SQS_QUEUE_URL": QUEUES[channel]})
+    processor = load_handler("notification-lambdas", "lam_coto_audit_event_processor_handler", env)
+
+    database = LocalSQLConnection()
+    database.executescript(SCHEMA)
+    with database.cursor() as cursor:
+        for user in range(users):
+            cursor.execute(
+                "INSERT INTO UsersTable (user_id, email, phone, device_token) VALUES (%s, %s, %s, %s);",
+                (str(user), f"user{user}@coto.com", f"+5411{user:08d}", f"device-token-{user}")
+            )
+    db_connection = load_handler("notification-lambdas", "db_connection", {})
+    prepare.db = db_connection.DatabaseConnection("sqlite", lambda: database, lambda conn: None)
+
+    return {"sqs": sqs, "sns": sns, "s3": s3, "dynamodb": dynamodb, "prepare": prepare, "channels": channels, "processor": processor}
+
+
+def api_event(channel, recipients, index, padding=""):
+    """Evento de API Gateway; `padding` se agrega al contenido para simular mensajes grandes."""
+    body = {"to": recipients, "type": channel}
+    if channel == "email":
+        body.update({"subject": f"Aviso {index}", "body": f"<p>Contenido {index}{padding}</p>", "from": "no-reply@coto.com"})
+    elif channel == "sms":
+        body.update({"message": f"Aviso {index}{padding}", "senderId": "COTO"})
+    else:
+        body.update({"title": f"Aviso {index}", "body": f"Contenido {index}{padding}", "data": {"index": index}})
+    return {"httpMethod": "POST", "path": PATHS[channel], "body": json.dumps(body)}
+
+
+def drain(sqs, queue_url, invoke, latencies):
+    """Invoca `invoke` hasta vaciar la cola y registra la latencia de cada invocación."""
+    while sqs.queues.get(queue_url):
+        start = time.perf_counter()
+        invoke()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def run_request(pipeline, channel, recipients, index, latencies, padding=""):
+    """Procesa una solicitud de punta a punta: prepare, handler del canal y auditoría."""
+    sqs, processor = pipeline["sqs"], pipeline["processor"]
+    request_start = time.perf_counter()
+
+    response = pipeline["prepare"].lambda_handler(api_event(channel, recipients, index, padding), LocalContext.new())
+    latencies["prepare"].append((time.perf_counter() - request_start) * 1000)
+    if response["statusCode"] != 200:
+        raise SystemExit(f"prepare-notifications falló: {response['body']}")
+
+    module = pipeline["channels"][channel]
+    drain(sqs, QUEUES[channel], lambda: module.lambda_handler({}, LocalContext.new()), latencies[channel])
+    drain(sqs, QUEUES["audit"], lambda: processor.lambda_handler(sqs.to_lambda_event(QUEUES["audit"], 10), LocalContext.new()), latencies["audit"])
+
+    latencies["end-to-end"].append((time.perf_counter() - request_start) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--recipients", type=int, default=200, help="Destinatarios por solicitud")
+    parser.add_argument("--users", type=int, default=5000, help="Usuarios cargados en UsersTable")
+    parser.add_argument("--channels", default="email,sms,push")
+    parser.add_argument("--rate", type=float, default=0, help="Solicitudes por segundo (0 = sin límite)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latencia simulada por llamada a AWS")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    calls = ApiCalls(args.latency_ms / 1000)
+    pipeline = build_pipeline(calls, args.users)
+    channels = args.channels.split(",")
+    user_ids = [str(user) for user in range(args.users)]
+
+    latencies = defaultdict(list)
+    start = time.perf_counter()
+    for index in range(args.requests):
+        if args.rate:
+            delay = start + index / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        channel = channels[index % len(channels)]
+        recipients = random.sample(user_ids, min(args.recipients, len(user_ids)))
+        run_request(pipeline, channel, recipients, index, latencies)
+    elapsed = time.perf_counter() - start
+
+    notifications = sum(len(json.loads(message["Message"]).get("recipients", [])) for message in pipeline["sns"].published)
+    audit_items = sum(len(table.items) for table in pipeline["dynamodb"].tables.values())
+
+    print(f"{args.requests} solicitudes x {args.recipients} destinatarios, canales {args.channels}, "
+          f"latencia simulada {args.latency_ms} ms por llamada")
+    print(f"\n{'etapa':<12} {'invocaciones':>12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage in ["prepare"] + channels + ["audit", "end-to-end"]:
+        values = latencies[stage]
+        print(f"{stage:<12} {len(values):>12} {percentile(values, 50):>9.2f} {percentile(values, 95):>9.2f} {percentile(values, 99):>9.2f}")
+
+    print(f"\nthroughput: {notifications} notificaciones en {elapsed:.2f} s = {notifications / elapsed:,.0f} notificaciones/s "
+          f"({args.requests / elapsed:.1f} solicitudes/s)")
+    print(f"eventos de auditoría en DynamoDB: {audit_items}")
+    print(f"llamadas a AWS: {calls.total()} ({calls.total() / max(notifications, 1):.4f} por notificación)")
+    for operation, count in sorted(calls.items()):
+        print(f"  {operation:<32} {count:>8}  {count / max(notifications, 1):.4f}/notificación")
+
+
+if __name__ == "__main__":
+    main()
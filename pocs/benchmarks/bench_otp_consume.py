@@ -0,0 +1,163 @@
+"""Benchmark de concurrencia del consumo de OTPs: exactamente una verificación exitosa por OTP.
+
+Emite N OTPs y lanza T hilos que intentan verificar todos los OTPs a la vez, cada
+uno con su propia conexión (como contenedores Lambda distintos). Compara:
+  - el flujo anterior: SELECT del OTP pendiente y luego UPDATE por id (dos round trips),
+  - OtpStore.consume: un único UPDATE condicional con control de vigencia,
+  - OtpStore.consume con tier en memoria (otp_cache.InMemoryOtpCache compartido entre
+    hilos, como un Redis): GETDEL atómico y UPDATE por clave primaria en la tabla.
+
+También se emiten OTPs vencidos, que ninguna de las verificaciones debe aceptar con
+OtpStore. `--race-window-ms` simula la latencia de red entre el SELECT y el UPDATE.
+
+Por defecto usa SQLite en un archivo temporal; con `--dialect postgres` usa Aurora
+PostgreSQL con las variables DB_HOST, DB_USER, DB_PASS y DB_NAME (requiere psycopg2).
+
+Uso:
+    python bench_otp_consume.py [--otps 200] [--threads 8] [--race-window-ms 2] [--dialect sqlite]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from local_aws import LocalSQLConnection, load_handler
+
+SCHEMA = {
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS otps (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, otp TEXT, user_id TEXT, created_at TIMESTAMP,
+            status TEXT, transaction_type TEXT
+        );
+    """,
+    "postgres": """
+        CREATE TABLE IF NOT EXISTS otps (
+            id SERIAL PRIMARY KEY, otp TEXT, user_id TEXT, created_at TIMESTAMP,
+            status TEXT, transaction_type TEXT
+        );
+    """,
+}
+TRANSACTION_TYPE = "bench-login"
+
+
+def legacy_consume(db, user_id, otp, transaction_type, race_window):
+    """Réplica del flujo original de verificación: SELECT y UPDATE por separado."""
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT id FROM otps WHERE user_id = %s AND otp = %s AND transaction_type = %s AND status = 'PENDING';",
+            (user_id, otp, transaction_type)
+        )
+        record = cursor.fetchone()
+    if not record:
+        return False
+    time.sleep(race_window)
+    with db.cursor() as cursor:
+        cursor.execute("UPDATE otps SET status = 'USED' WHERE id = %s;", (record[0],))
+    return True
+
+
+def run(open_store, otps, threads, consume):
+    """Cada hilo verifica todos los OTPs; retorna (éxitos por OTP, consultas a la base, segundos)."""
+    successes = Counter()
+    stores = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(offset):
+        store = open_store()
+        stores.append(store)
+        barrier.wait()
+        # Cada hilo recorre los OTPs desde un punto distinto para maximizar la contención
+        for index in range(len(otps)):
+            user_id, otp = otps[(index + offset) % len(otps)]
+            if consume(store, user_id, otp):
+                with lock:
+                    successes[(user_id, otp)] += 1
+
+    workers = [threading.Thread(target=worker, args=(i * len(otps) // threads,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return successes, sum(store.db.metrics["queries"] for store in stores), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--otps", type=int, default=200)
+    parser.add_argument("--expired", type=int, default=20, help="OTPs emitidos fuera de la ventana de vigencia")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--race-window-ms", type=float, default=2)
+    parser.add_argument("--dialect", choices=["sqlite", "postgres"], default="sqlite")
+    args = parser.parse_args()
+
+    db_connection = load_handler("notification-lambdas", "db_connection", {})
+    otp_store = load_handler("notification-lambdas", "otp_store", {})
+    otp_cache = load_handler("notification-lambdas", "otp_cache", {})
+
+    if args.dialect == "sqlite":
+        path = os.path.join(tempfile.mkdtemp(prefix="coto-otps-"), "otps.db")
+
+        def connect():
+            return db_connection.DatabaseConnection("sqlite", lambda: LocalSQLConnection(path), lambda conn: None)
+    else:
+        def connect():
+            return db_connection.postgres_connection(
+                host=os.environ["DB_HOST"], user=os.environ["DB_USER"],
+                password=os.environ["DB_PASS"], dbname=os.environ["DB_NAME"]
+            )
+
+    def issue(cache):
+        """Crea la tabla con sus índices y emite OTPs vigentes y vencidos."""
+        store = otp_store.OtpStore(connect(), args.dialect, cache=cache)
+        with store.db.cursor() as cursor:
+            cursor.execute(SCHEMA[args.dialect])
+            # Solo se eliminan los OTPs emitidos por ejecuciones anteriores del benchmark
+            cursor.execute("DELETE FROM otps WHERE transaction_type = %s;", (TRANSACTION_TYPE,))
+        store.ensure_indexes()
+        valid = [(f"user-{i}", f"{100000 + i}") for i in range(args.otps)]
+        expired = [(f"expired-{i}", f"{900000 + i}") for i in range(args.expired)]
+        for user_id, otp in valid + expired:
+            store.save(user_id, otp, TRANSACTION_TYPE)
+        with store.db.cursor() as cursor:
+            for user_id, _ in expired:
+                cursor.execute(
+                    "UPDATE otps SET created_at = '2000-01-01 00:00:00' WHERE user_id = %s AND transaction_type = %s;", (user_id, TRANSACTION_TYPE)
+                )
+        if cache is not None:
+            # En el tier los vencidos ya expiraron por TTL
+            for user_id, otp in expired:
+                cache.getdel(store._cache_key(user_id, otp, TRANSACTION_TYPE))
+        return valid + expired, {otp for _, otp in expired}
+
+    race_window = args.race_window_ms / 1000
+    def consume(store, user_id, otp):
+        return store.consume(user_id, otp, TRANSACTION_TYPE)
+
+    scenarios = [
+        ("SELECT + UPDATE (anterior)", lambda store, user_id, otp: legacy_consume(store.db, user_id, otp, TRANSACTION_TYPE, race_window), None),
+        ("OtpStore.consume", consume, None),
+        ("OtpStore.consume + tier", consume, otp_cache.InMemoryOtpCache()),
+    ]
+
+    print(f"{args.otps} OTPs vigentes + {args.expired} vencidos, {args.threads} verificaciones concurrentes por OTP ({args.dialect})")
+    print(f"{'flujo':<28} {'consumidos':>10} {'doble uso':>10} {'vencidos aceptados':>19} {'consultas/verif.':>17} {'tiempo':>8}")
+    for label, consume_otp, cache in scenarios:
+        otps, expired = issue(cache)
+        successes, queries, elapsed = run(lambda: otp_store.OtpStore(connect(), args.dialect, cache=cache), otps, args.threads, consume_otp)
+        valid_consumed = sum(1 for (_, otp) in successes if otp not in expired)
+        double_use = sum(count - 1 for count in successes.values() if count > 1)
+        expired_accepted = sum(count for (_, otp), count in successes.items() if otp in expired)
+        print(f"{label:<28} {valid_consumed:>10} {double_use:>10} {expired_accepted:>19} "
+              f"{queries / (len(otps) * args.threads):>17.2f} {elapsed:>7.2f}s")
+
+        if label.startswith("OtpStore"):
+            assert valid_consumed == args.otps and double_use == 0 and expired_accepted == 0, \
+                "OtpStore.consume no garantizó exactamente una verificación por OTP"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Invocaciones necesarias para vaciar un backlog: un receive por invocación vs drain.
+
+Encola --messages chunks en la cola de SMS y ejecuta lam_coto_sms_notification_handler
+hasta vaciarla con SQS_RECEIVE_MODE=single (un lote de 10 por invocación, como
+antes) y con SQS_RECEIVE_MODE=drain (lotes hasta vaciar la cola o agotar el tiempo
+de la invocación menos el margen de seguridad). Cada llamada a AWS tiene
+--latency-ms de latencia y cada invocación --timeout-ms de tiempo disponible.
+
+Luego invoca --idle veces el handler con la cola vacía: ninguna invocación emite
+eventos de auditoría (el handler anterior emitía uno por cada poll vacío).
+
+Uso:
+    python bench_receive_drain.py [--messages 1000] [--latency-ms 2] [--timeout-ms 3000] [--margin-ms 500]
+"""
+import argparse
+import json
+import time
+
+from bench_notification_pipeline import LocalContext
+from local_aws import ApiCalls, LocalS3, LocalSNS, LocalSQS, load_handler
+
+QUEUE_URL = "https://sqs.local/000000000000/coto-sms"
+AUDIT_QUEUE_URL = "https://sqs.local/000000000000/coto-audit"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="Latencia simulada por llamada a AWS")
+    parser.add_argument("--timeout-ms", type=int, default=3000, help="Tiempo disponible por invocación")
+    parser.add_argument("--margin-ms", type=int, default=500, help="SQS_DRAIN_SAFETY_MARGIN_MS")
+    parser.add_argument("--idle", type=int, default=20, help="Invocaciones con la cola vacía")
+    args = parser.parse_args()
+
+    calls = ApiCalls(args.latency_ms / 1000)
+    sqs, sns = LocalSQS(calls), LocalSNS(calls)
+    env = {
+        "SQS_QUEUE_URL": QUEUE_URL, "SQS_COTO_AUDIT_QUEUE": AUDIT_QUEUE_URL,
+        "SNS_TARGET_TOPIC_ARN": "arn:aws:sns:us-east-1:000000000000:coto-notifications",
+    }
+    aws_clients = load_handler("notification-lambdas", "aws_clients", env)
+    aws_clients.register("sqs", sqs)
+    aws_clients.register("sns", sns)
+    aws_clients.register("s3", LocalS3(calls))
+    handler = load_handler("notification-lambdas", "lam_coto_sms_notification_handler", env)
+    receive_loop = load_handler("notification-lambdas", "receive_loop", {})
+    receive_loop.SQS_DRAIN_SAFETY_MARGIN_MS = args.margin_ms
+
+    print(f"backlog de {args.messages} mensajes, {args.latency_ms} ms por llamada a AWS, "
+          f"{args.timeout_ms} ms por invocación (margen {args.margin_ms} ms)")
+    print(f"\n{'modo':<8} {'invocaciones':>13} {'receives':>9} {'eventos auditoría':>18} {'auditoría poll vacío':>21} {'s totales':>10}")
+    for mode in ("single", "drain"):
+        receive_loop.SQS_RECEIVE_MODE = mode
+        for index in range(args.messages):
+            sqs.send_message(QueueUrl=QUEUE_URL, MessageBody=json.dumps({
+                "transaction_id": f"tx-{mode}", "chunk_index": index, "message": "Aviso", "senderId": "COTO",
+                "recipients": [f"+5411{index:08d}"],
+            }))
+        sqs.queues[AUDIT_QUEUE_URL] = []
+        receives_before = calls["sqs.receive_message"]
+
+        invocations, start = 0, time.perf_counter()
+        while sqs.queues.get(QUEUE_URL):
+            handler.lambda_handler({}, LocalContext(args.timeout_ms))
+            invocations += 1
+        elapsed = time.perf_counter() - start
+        backlog_audit = len(sqs.queues[AUDIT_QUEUE_URL])
+        receives = calls["sqs.receive_message"] - receives_before
+
+        for _ in range(args.idle):
+            handler.lambda_handler({}, LocalContext(args.timeout_ms))
+        idle_audit = len(sqs.queues[AUDIT_QUEUE_URL]) - backlog_audit
+
+        print(f"{mode:<8} {invocations:>13} {receives:>9} {backlog_audit:>18} {idle_audit:>21} {elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Micro-benchmark del renderizado de emails: str.replace vs plantilla precompilada.
+
+Renderiza N mensajes sobre una plantilla HTML grande con varios placeholders y
+compara el enfoque anterior (un str.replace por placeholder y mensaje) con
+template_engine.compile_template(...).render(...).
+
+Uso:
+    python bench_template_rendering.py [--messages 10000] [--template-kb 64]
+"""
+import argparse
+import time
+
+from local_aws import load_handler
+
+PLACEHOLDERS = ["subject", "body", "user_name", "from"]
+
+
+def build_template(size_kb):
+    """Plantilla HTML de ~size_kb KB con los placeholders repartidos en el contenido."""
+    block = "<tr><td style=\"padding:8px;font-family:Arial\">Lorem ipsum dolor sit amet, consectetur.</td></tr>\n"
+    filler = block * max(1, (size_kb * 1024) // (len(block) * (len(PLACEHOLDERS) + 1)))
+    sections = [f"<h1>%{{{name}}}%</h1>\n{filler}" for name in PLACEHOLDERS]
+    return "<html><body><table>\n" + filler + "".join(sections) + "</table></body></html>"
+
+
+def render_with_replace(template, variables):
+    content = template
+    for name, value in variables.items():
+        content = content.replace(f"%{{{name}}}%", value)
+    return content
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--template-kb", type=int, default=64)
+    args = parser.parse_args()
+
+    template_engine = load_handler("notification-lambdas", "template_engine", {})
+    template = build_template(args.template_kb)
+    messages = [
+        {"subject": f"Asunto {i}", "body": f"<p>Contenido del mensaje {i}</p>", "user_name": f"Usuario {i}", "from": "no-reply@coto.com"}
+        for i in range(args.messages)
+    ]
+
+    start = time.perf_counter()
+    expected = [render_with_replace(template, variables) for variables in messages]
+    replace_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = template_engine.compile_template(template)
+    rendered = [compiled.render(variables) for variables in messages]
+    compiled_elapsed = time.perf_counter() - start
+
+    assert rendered == expected, "El renderizado precompilado difiere de str.replace"
+
+    print(f"plantilla: {len(template) / 1024:.1f} KB, {len(PLACEHOLDERS)} placeholders, {args.messages} mensajes")
+    print(f"{'str.replace':<22} {replace_elapsed:>8.3f} s  {replace_elapsed / args.messages * 1e6:>8.1f} us/mensaje")
+    print(f"{'compile_template':<22} {compiled_elapsed:>8.3f} s  {compiled_elapsed / args.messages * 1e6:>8.1f} us/mensaje")
+    print(f"speedup: {replace_elapsed / compiled_elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+"""Dobles locales (en memoria) de los servicios AWS usados por las Lambdas de COTO.
+
+Cada doble cuenta las llamadas a la API (round trips) y puede simular una
+latencia fija por llamada, de modo que los benchmarks puedan comparar
+implementaciones sin necesidad de una cuenta de AWS.
+"""
+import importlib
+import io
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import sys
+import time
+import uuid
+from collections import Counter
+
+POCS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_handler(lambda_dir, module_name, env):
+    """Importa un handler de pocs/<lambda_dir> con las variables de entorno indicadas.
+
+    pocs/shared se agrega al path como lo haría el Lambda Layer en AWS.
+    """
+    os.environ.update(env)
+    for path in (os.path.join(POCS_DIR, "shared"), os.path.join(POCS_DIR, lambda_dir)):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    module = importlib.import_module(module_name)
+    # Los handlers configuran logs en INFO; en benchmarks solo interesan los warnings
+    logging.getLogger().setLevel(logging.WARNING)
+    return module
+
+
+class ApiCalls(Counter):
+    """Contador de llamadas a la API por 'servicio.operacion'."""
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+
+    def hit(self, operation):
+        self[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def total(self):
+        return sum(self.values())
+
+
+class LocalSQS:
+    """Cola SQS en memoria con la misma interfaz que el cliente boto3."""
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.queues = {}
+        self.in_flight = {}
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self.calls.hit("sqs.send_message")
+        message_id = str(uuid.uuid4())
+        self.queues.setdefault(QueueUrl, []).append({"MessageId": message_id, "Body": MessageBody})
+        return {"MessageId": message_id}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.calls.hit("sqs.send_message_batch")
+        successful = []
+        for entry in Entries:
+            message_id = str(uuid.uuid4())
+            self.queues.setdefault(QueueUrl, []).append({"MessageId": message_id, "Body": entry["MessageBody"]})
+            successful.append({"Id": entry["Id"], "MessageId": message_id})
+        return {"Successful": successful, "Failed": []}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, **kwargs):
+        self.calls.hit("sqs.receive_message")
+        queue = self.queues.setdefault(QueueUrl, [])
+        batch, self.queues[QueueUrl] = queue[:MaxNumberOfMessages], queue[MaxNumberOfMessages:]
+        if not batch:
+            return {}
+        messages = []
+        for message in batch:
+            receipt_handle = str(uuid.uuid4())
+            self.in_flight[receipt_handle] = (QueueUrl, message)
+            messages.append(dict(message, ReceiptHandle=receipt_handle))
+        return {"Messages": messages}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        self.calls.hit("sqs.delete_message")
+        self.in_flight.pop(ReceiptHandle, None)
+        return {}
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        self.calls.hit("sqs.delete_message_batch")
+        for entry in Entries:
+            self.in_flight.pop(entry["ReceiptHandle"], None)
+        return {"Successful": [{"Id": entry["Id"]} for entry in Entries], "Failed": []}
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):
+        self.calls.hit("sqs.change_message_visibility_batch")
+        successful = [{"Id": entry["Id"]} for entry in Entries if entry["ReceiptHandle"] in self.in_flight]
+        failed = [
+            {"Id": entry["Id"], "Code": "ReceiptHandleIsInvalid", "SenderFault": True}
+            for entry in Entries if entry["ReceiptHandle"] not in self.in_flight
+        ]
+        return {"Successful": successful, "Failed": failed}
+
+    def expire_in_flight(self, QueueUrl):
+        """Simula el vencimiento del visibility timeout: los mensajes no eliminados vuelven a la cola."""
+        expired = [handle for handle, (queue_url, _) in self.in_flight.items() if queue_url == QueueUrl]
+        for handle in expired:
+            self.queues.setdefault(QueueUrl, []).append(self.in_flight.pop(handle)[1])
+        return len(expired)
+
+    def to_lambda_event(self, QueueUrl, batch_size=10):
+        """Construye un evento de trigger SQS -> Lambda con los mensajes pendientes de la cola."""
+        queue = self.queues.setdefault(QueueUrl, [])
+        batch, self.queues[QueueUrl] = queue[:batch_size], queue[batch_size:]
+        records = []
+        for message in batch:
+            receipt_handle = str(uuid.uuid4())
+            self.in_flight[receipt_handle] = (QueueUrl, message)
+            records.append({"messageId": message["MessageId"], "receiptHandle": receipt_handle, "body": message["Body"]})
+        return {"Records": records}
+
+
+class LocalBatchWriter:
+    """Equivalente local de Table.batch_writer(): agrupa put_item de a 25 por BatchWriteItem."""
+
+    BATCH_SIZE = 25
+
+    def __init__(self, table, overwrite_by_pkeys=None):
+        self.table = table
+        self.overwrite_by_pkeys = overwrite_by_pkeys
+        self.buffer = []
+
+    def put_item(self, Item):
+        if self.overwrite_by_pkeys:
+            key = tuple(Item.get(k) for k in self.overwrite_by_pkeys)
+            self.buffer = [i for i in self.buffer if tuple(i.get(k) for k in self.overwrite_by_pkeys) != key]
+        self.buffer.append(Item)
+        if len(self.buffer) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.table.calls.hit("dynamodb.batch_write_item")
+            self.table.items.extend(self.buffer)
+            self.buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+class LocalDynamoTable:
+    """Tabla DynamoDB en memoria con la interfaz del recurso Table de boto3.
+
+    query y scan entienden el subconjunto de expresiones que usan los handlers
+    (=, <, <=, >, >=, BETWEEN y begins_with unidos por AND) y calculan las unidades
+    de lectura como DynamoDB: bytes evaluados (antes del filtro) en bloques de 4 KB,
+    la mitad con lectura eventual. LastEvaluatedKey es una posición opaca.
+    """
+
+    PAGE_BYTES = 1024 * 1024  # DynamoDB corta cada página de Query/Scan en 1 MB evaluado
+
+    def __init__(self, calls, name=None):
+        self.calls = calls
+        self.name = name
+        self.items = []
+
+    def put_item(self, Item, **kwargs):
+        self.calls.hit("dynamodb.put_item")
+        self.items.append(Item)
+        return {}
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return LocalBatchWriter(self, overwrite_by_pkeys)
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues, ScanIndexForward=True, **kwargs):
+        self.calls.hit("dynamodb.query")
+        conditions = _parse_expression(KeyConditionExpression, kwargs.get("ExpressionAttributeNames"), ExpressionAttributeValues)
+        items = [item for item in self.items if _matches(item, conditions)]
+        sort_names = [name for name, operator, _ in conditions if operator != "="]
+        if sort_names:
+            items.sort(key=lambda item: item[sort_names[0]], reverse=not ScanIndexForward)
+        return self._page(items, kwargs)
+
+    def scan(self, Segment=0, TotalSegments=1, **kwargs):
+        self.calls.hit("dynamodb.scan")
+        return self._page(self.items[Segment::TotalSegments], kwargs)
+
+    def _page(self, items, kwargs):
+        position = kwargs.get("ExclusiveStartKey", {}).get("$position", 0)
+        limit = kwargs.get("Limit")
+        filters = []
+        if kwargs.get("FilterExpression"):
+            filters = _parse_expression(kwargs["FilterExpression"], kwargs.get("ExpressionAttributeNames"),
+                                        kwargs.get("ExpressionAttributeValues", {}))
+
+        evaluated, evaluated_bytes, matched = 0, 0, []
+        for item in items[position:]:
+            if (limit and evaluated >= limit) or evaluated_bytes >= self.PAGE_BYTES:
+                break
+            evaluated += 1
+            evaluated_bytes += len(json.dumps(item, default=str).encode("utf-8"))
+            if _matches(item, filters):
+                matched.append(item)
+
+        response = {"Items": matched, "Count": len(matched), "ScannedCount": evaluated}
+        if position + evaluated < len(items):
+            response["LastEvaluatedKey"] = {"$position": position + evaluated}
+        if kwargs.get("ReturnConsumedCapacity") in ("TOTAL", "INDEXES"):
+            units = max(1, math.ceil(evaluated_bytes / 4096))
+            response["ConsumedCapacity"] = {
+                "TableName": self.name,
+                "CapacityUnits": units if kwargs.get("ConsistentRead") else units / 2,
+            }
+        return response
+
+
+_CONDITION = re.compile(
+    r"begins_with\(\s*(?P<prefix_name>[#\w]+)\s*,\s*(?P<prefix>:\w+)\s*\)"
+    r"|(?P<between_name>[#\w]+)\s+BETWEEN\s+(?P<low>:\w+)\s+AND\s+(?P<high>:\w+)"
+    r"|(?P<name>[#\w]+)\s*(?P<operator><=|>=|=|<|>)\s*(?P<value>:\w+)"
+)
+
+
+def _parse_expression(expression, names, values):
+    """Convierte una expresión de condición en una lista de (atributo, operador, valor)."""
+    names = names or {}
+    conditions = []
+    for match in _CONDITION.finditer(expression):
+        if match.group("prefix_name"):
+            conditions.append((names.get(match.group("prefix_name"), match.group("prefix_name")), "begins_with", values[match.group("prefix")]))
+        elif match.group("between_name"):
+            name = names.get(match.group("between_name"), match.group("between_name"))
+            conditions.append((name, "between", (values[match.group("low")], values[match.group("high")])))
+        else:
+            conditions.append((names.get(match.group("name"), match.group("name")), match.group("operator"), values[match.group("value")]))
+    return conditions
+
+
+def _matches(item, conditions):
+    for name, operator, value in conditions:
+        if name not in item:
+            return False
+        current = item[name]
+        if operator == "between":
+            matched = value[0] <= current <= value[1]
+        elif operator == "begins_with":
+            matched = str(current).startswith(value)
+        else:
+            matched = {"=": current == value, "<": current < value, "<=": current <= value,
+                       ">": current > value, ">=": current >= value}[operator]
+        if not matched:
+            return False
+    return True
+
+
+class LocalDynamoResource:
+    """Recurso DynamoDB en memoria: Table(name) retorna siempre la misma LocalDynamoTable."""
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.tables = {}
+
+    def Table(self, name):
+        return self.tables.setdefault(name, LocalDynamoTable(self.calls, name))
+
+
+class LocalSNS:
+    """Topics SNS en memoria: registra cada mensaje publicado."""
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.published = []
+
+    def publish(self, TopicArn, Message, **kwargs):
+        self.calls.hit("sns.publish")
+        message_id = str(uuid.uuid4())
+        self.published.append({"TopicArn": TopicArn, "Message": Message, "MessageId": message_id})
+        return {"MessageId": message_id}
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries):
+        self.calls.hit("sns.publish_batch")
+        successful = []
+        for entry in PublishBatchRequestEntries:
+            message_id = str(uuid.uuid4())
+            self.published.append({"TopicArn": TopicArn, "Message": entry["Message"], "MessageId": message_id})
+            successful.append({"Id": entry["Id"], "MessageId": message_id})
+        return {"Successful": successful, "Failed": []}
+
+
+class LocalSQLCursor:
+    """Cursor DB-API sobre SQLite que acepta el dialecto de psycopg2/pymysql usado por los handlers.
+
+    Traduce los placeholders %s, `= ANY(%s)` con una lista y NOW(). Con dict_rows=True
+    retorna filas como diccionarios (equivalente a pymysql.cursors.DictCursor).
+    """
+
+    ANY_PATTERN = re.compile(r"=\s*ANY\(%s\)", re.IGNORECASE)
+
+    def __init__(self, cursor, dict_rows=False):
+        self._cursor = cursor
+        self._dict_rows = dict_rows
+
+    def execute(self, sql, params=()):
+        sql = self.ANY_PATTERN.sub("IN %l", sql).replace("NOW()", "CURRENT_TIMESTAMP")
+        parts = re.split(r"(%s|%l)", sql)
+        values = list(params or ())
+        query, args = [], []
+        for part in parts:
+            if part == "%s":
+                query.append("?")
+                args.append(values.pop(0))
+            elif part == "%l":
+                items = list(values.pop(0))
+                query.append(f"({', '.join('?' * len(items)) or 'NULL'})")
+                args.extend(items)
+            else:
+                query.append(part)
+        self._cursor.execute("".join(query), args)
+        return self._cursor.rowcount
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def _row(self, row):
+        if row is None or not self._dict_rows:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class LocalSQLConnection:
+    """Conexión SQLite en autocommit con cursores LocalSQLCursor (UsersTable, otps, etc.)."""
+
+    def __init__(self, path=":memory:", dict_rows=False):
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._dict_rows = dict_rows
+
+    def cursor(self, **kwargs):
+        return LocalSQLCursor(self._conn.cursor(), self._dict_rows)
+
+    def executescript(self, script):
+        self._conn.executescript(script)
+
+    def close(self):
+        self._conn.close()
+
+
+class LocalS3:
+    """Bucket S3 en memoria con get_object/put_object (incluye ETag e IfNoneMatch)."""
+
+    class NotModified(Exception):
+        response = {"ResponseMetadata": {"HTTPStatusCode": 304}, "Error": {"Code": "304"}}
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.calls.hit("s3.put_object")
+        body = Body.encode("utf-8") if isinstance(Body, str) else Body
+        etag = f'"{uuid.uuid5(uuid.NAMESPACE_OID, body.hex()).hex}"'
+        self.objects[(Bucket, Key)] = (body, etag)
+        return {"ETag": etag}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, **kwargs):
+        self.calls.hit("s3.get_object")
+        body, etag = self.objects[(Bucket, Key)]
+        if IfNoneMatch == etag:
+            raise self.NotModified()
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+
+class LocalVerifiedPermissions:
+    """Verified Permissions en memoria: permite los recursos de `allowed` (o todos si es None)."""
+
+    def __init__(self, calls, allowed=None):
+        self.calls = calls
+        self.allowed = allowed
+
+    def _decide(self, resource):
+        return "Allow" if self.allowed is None or resource.get("entityId") in self.allowed else "Deny"
+
+    def is_authorized(self, policyStoreId, principal, resource, action, **kwargs):
+        self.calls.hit("verifiedpermissions.is_authorized")
+        return {"decision": self._decide(resource), "determiningPolicies": [], "errors": []}
+
+    def batch_is_authorized(self, policyStoreId, requests, **kwargs):
+        self.calls.hit("verifiedpermissions.batch_is_authorized")
+        return {"results": [
+            {"request": request, "decision": self._decide(request["resource"]), "determiningPolicies": [], "errors": []}
+            for request in requests
+        ]}
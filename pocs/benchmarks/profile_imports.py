@@ -0,0 +1,111 @@
+"""Costo de importación (cold start) de cada Lambda, medido con `python -X importtime`.
+
+Cada handler se importa en un proceso nuevo con pocs/shared y su directorio en el
+PYTHONPATH (como en Lambda con el Layer). Se reporta el tiempo acumulado de importar
+el handler y los módulos más costosos de su árbol de imports.
+
+Requiere las dependencias de las Lambdas instaladas (boto3, PyJWT, python-jose,
+psycopg2, pymysql); los handlers que no pueden importarse se reportan con el error.
+
+Uso:
+    python profile_imports.py [--top 5] [--runs 3] [--handler lam_request_authorizer]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from local_aws import POCS_DIR
+
+HANDLERS = [
+    ("authorizer-lambdas/without-avp-roles", "lam_request_authorizer"),
+    ("authorizer-lambdas/with-avp-roles", "lam_component_authorization_handler"),
+    ("notification-lambdas", "lam_coto_prepare_notifications_handler"),
+    ("notification-lambdas", "lam_coto_email_notification_handler"),
+    ("notification-lambdas", "lam_coto_sms_notification_handler"),
+    ("notification-lambdas", "lam_coto_push_notification_handler"),
+    ("notification-lambdas", "lam_coto_verificacion_notifications_handler"),
+    ("notification-lambdas", "lam_coto_audit_event_processor_handler"),
+]
+
+# Variables mínimas para que los handlers puedan importarse fuera de AWS
+ENV = {
+    "AWS_REGION": "us-east-1",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "DB_CONNECT_TIMEOUT": "1",
+    "DB_HOST": "localhost", "DB_NAME": "coto", "DB_USER": "coto", "DB_PASS": "coto",
+    "AURORA_DB_HOST": "localhost", "AURORA_DB_NAME": "coto", "AURORA_DB_USER": "coto", "AURORA_DB_PASSWORD": "coto",
+    "DYNAMODB_AUDIT_TABLE": "coto-audit-events",
+    "S3_BUCKET_NAME_EMAIL": "coto-templates",
+    "TEMPLATE_FILE_NAME_EMAIL": "template.html",
+    "SNS_TARGET_TOPIC_ARN": "arn:aws:sns:us-east-1:000000000000:coto",
+    "SNS_TOPIC_ARN_EMAIL": "arn:aws:sns:us-east-1:000000000000:coto-email",
+    **{name: f"https://sqs.us-east-1.amazonaws.com/000000000000/{name.lower()}" for name in (
+        "SQS_AUDIT_QUEUE_URL", "SQS_COTO_AUDIT_QUEUE", "SQS_COTO_AUDIT_QUEUE_EMAIL", "SQS_QUEUE_URL",
+        "SQS_QUEUE_URL_EMAIL", "SQS_QUEUE_URL_PUSH", "SQS_QUEUE_URL_SMS"
+    )},
+}
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile(lambda_dir, module_name):
+    """Importa el handler en un proceso nuevo y retorna {módulo: (self_us, cumulative_us)} o el error."""
+    env = dict(os.environ, **ENV)
+    paths = [os.path.join(POCS_DIR, "shared"), os.path.join(POCS_DIR, lambda_dir)]
+    env["PYTHONPATH"] = os.pathsep.join(paths + [env.get("PYTHONPATH", "")])
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        env=env, capture_output=True, text=True
+    )
+    imports = {}
+    errors = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            imports[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+        elif not line.startswith("import time:"):
+            errors.append(line)
+    if result.returncode != 0:
+        return None, errors[-1] if errors else f"exit code {result.returncode}"
+    return imports, None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--handler", help="Perfila solo el handler indicado")
+    args = parser.parse_args()
+
+    for lambda_dir, module_name in HANDLERS:
+        if args.handler and args.handler != module_name:
+            continue
+
+        runs = []
+        for _ in range(args.runs):
+            imports, error = profile(lambda_dir, module_name)
+            if error:
+                break
+            runs.append(imports)
+
+        print(f"\n{module_name} ({lambda_dir})")
+        if error:
+            print(f"  no se pudo importar: {error}")
+            continue
+
+        # Mediana del acumulado del handler entre ejecuciones; el desglose es de la última
+        total = statistics.median(run[module_name][1] for run in runs)
+        print(f"  import total: {total / 1000:.1f} ms (mediana de {len(runs)})")
+        heaviest = sorted(
+            ((name, cumulative) for name, (_, cumulative) in runs[-1].items() if name != module_name and "." not in name),
+            key=lambda item: item[1], reverse=True
+        )[:args.top]
+        for name, cumulative in heaviest:
+            print(f"  {name:<40} {cumulative / 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
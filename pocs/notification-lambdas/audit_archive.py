@@ -0,0 +1,309 @@
+"""Archivo comprimido de eventos de auditoría para analítica.
+
+Con AUDIT_ARCHIVE_URL definida, el procesador de auditoría además de escribir en
+DynamoDB agrega cada evento a archivos JSON-lines comprimidos, particionados por
+fecha y tipo:
+
+    <prefijo>date=2026-10-18/type=email-notification/<epoch_ms min>-<epoch_ms max>-<id>.jsonl.zst
+
+Los eventos se acumulan en memoria por partición y se escribe un archivo cuando la
+partición supera AUDIT_ARCHIVE_MAX_BYTES (sin comprimir) o su evento más antiguo
+tiene más de AUDIT_ARCHIVE_MAX_AGE_SECONDS; el procesador lo revisa al final de cada
+invocación. Con el valor por defecto (0) cada invocación escribe un archivo por
+partición y no queda nada en memoria entre invocaciones: un valor mayor agrupa más
+eventos por archivo, pero lo que quede en memoria si el contenedor se recicla no
+llega al archivo (DynamoDB sigue siendo la fuente de verdad).
+
+Si el store falla, la partición vuelve al buffer y se reintenta en el próximo flush,
+hasta AUDIT_ARCHIVE_MAX_PENDING_BYTES por partición; por encima se descartan los
+eventos más antiguos y se cuentan en `events_dropped`.
+
+URLs soportadas:
+  - s3://bucket/prefijo/ : objetos en S3.
+  - file:///ruta/        : directorio local (pruebas y exportaciones).
+
+AUDIT_ARCHIVE_CODEC: "zstd" (requiere el paquete zstandard) o "gzip" (stdlib).
+
+El archivo es al menos una vez: una reentrega de SQS puede repetir un evento, que
+se identifica por su sk / message_id (en DynamoDB la reentrega sobrescribe el ítem).
+
+ArchiveReader.scan lee un rango de tiempo aplicando los predicados lo antes posible:
+descarta particiones por fecha y tipo, archivos por el rango de epoch_ms de su
+nombre y recién entonces filtra evento por evento.
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger()
+
+AUDIT_ARCHIVE_URL = os.environ.get('AUDIT_ARCHIVE_URL')  # Sin URL, el archivo queda desactivado
+AUDIT_ARCHIVE_CODEC = os.environ.get('AUDIT_ARCHIVE_CODEC', 'zstd')
+AUDIT_ARCHIVE_MAX_BYTES = int(os.environ.get('AUDIT_ARCHIVE_MAX_BYTES', str(8 * 1024 * 1024)))
+AUDIT_ARCHIVE_MAX_AGE_SECONDS = float(os.environ.get('AUDIT_ARCHIVE_MAX_AGE_SECONDS', '0'))
+AUDIT_ARCHIVE_MAX_PENDING_BYTES = int(os.environ.get('AUDIT_ARCHIVE_MAX_PENDING_BYTES', str(32 * 1024 * 1024)))
+AUDIT_ARCHIVE_ZSTD_LEVEL = int(os.environ.get('AUDIT_ARCHIVE_ZSTD_LEVEL', '3'))
+
+_EXTENSIONS = {"zstd": ".jsonl.zst", "gzip": ".jsonl.gz"}
+
+
+def _compressor(codec, level=AUDIT_ARCHIVE_ZSTD_LEVEL):
+    if codec == "gzip":
+        return gzip.compress
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=level).compress
+    raise ValueError(f"Codec de archivo no soportado: {codec}")
+
+
+def _decompress(key, data):
+    if key.endswith(_EXTENSIONS["gzip"]):
+        return gzip.decompress(data)
+    import zstandard
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+def _partition(event):
+    """(fecha, tipo) del evento a partir de epoch_ms (o del momento actual si no lo tiene)."""
+    epoch_ms = event.get("epoch_ms") or int(time.time() * 1000)
+    date = datetime.fromtimestamp(epoch_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+    event_type = str(event.get("type", "unknown")).replace("/", "_")
+    return date, event_type
+
+
+class S3ArchiveStore:
+    """Objetos del archivo en S3."""
+
+    def __init__(self, s3_client, bucket, prefix=""):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def put(self, key, data):
+        self.s3.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data)
+
+    def list(self, prefix):
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            for entry in page.get("Contents", []):
+                yield entry["Key"][len(self.prefix):]
+
+    def get(self, key):
+        return self.s3.get_object(Bucket=self.bucket, Key=self.prefix + key)["Body"].read()
+
+
+class LocalArchiveStore:
+    """Objetos del archivo en un directorio local."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def put(self, key, data):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escritura atómica: un lector nunca ve un archivo a medio escribir
+        with open(path + ".tmp", "wb") as file:
+            file.write(data)
+        os.replace(path + ".tmp", path)
+
+    def list(self, prefix):
+        directory = os.path.join(self.root, prefix)
+        if not os.path.isdir(directory):
+            return
+        for current, _, files in os.walk(directory):
+            for name in sorted(files):
+                if not name.endswith(".tmp"):
+                    yield os.path.relpath(os.path.join(current, name), self.root).replace(os.sep, "/")
+
+    def get(self, key):
+        with open(os.path.join(self.root, key), "rb") as file:
+            return file.read()
+
+
+def build_archive_store(url=AUDIT_ARCHIVE_URL):
+    """Retorna el store del archivo configurado, o None si está desactivado."""
+    if not url:
+        return None
+    if url.startswith("file://"):
+        return LocalArchiveStore(url[len("file://"):])
+    if url.startswith("s3://"):
+        import aws_clients
+        bucket, _, prefix = url[len("s3://"):].partition("/")
+        return S3ArchiveStore(aws_clients.client("s3"), bucket, prefix)
+    raise ValueError(f"URL de archivo de auditoría no soportada: {url}")
+
+
+class AuditArchive:
+    """Buffer por partición (fecha, tipo) que escribe archivos JSON-lines comprimidos."""
+
+    def __init__(self, store, codec=AUDIT_ARCHIVE_CODEC, max_bytes=AUDIT_ARCHIVE_MAX_BYTES,
+                 max_age_seconds=AUDIT_ARCHIVE_MAX_AGE_SECONDS, max_pending_bytes=AUDIT_ARCHIVE_MAX_PENDING_BYTES):
+        self.store = store
+        self.codec = codec
+        self.extension = _EXTENSIONS[codec]
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.max_pending_bytes = max_pending_bytes
+        self.files_written = 0
+        self.bytes_written = 0
+        self.events_dropped = 0
+        self._compress = _compressor(codec)
+        self._partitions = {}
+        self._lock = threading.Lock()
+
+    def append(self, events):
+        """Agrega eventos a sus particiones y escribe las que superan max_bytes."""
+        full = []
+        with self._lock:
+            for event in events:
+                key = _partition(event)
+                partition = self._partitions.setdefault(key, {"lines": [], "bytes": 0, "since": time.monotonic(),
+                                                              "min": None, "max": None})
+                line = json.dumps(event, default=str, separators=(",", ":"))
+                partition["lines"].append(line)
+                partition["bytes"] += len(line) + 1
+                epoch_ms = event.get("epoch_ms")
+                if epoch_ms is not None:
+                    partition["min"] = epoch_ms if partition["min"] is None else min(partition["min"], epoch_ms)
+                    partition["max"] = epoch_ms if partition["max"] is None else max(partition["max"], epoch_ms)
+                if partition["bytes"] >= self.max_bytes:
+                    full.append((key, self._partitions.pop(key)))
+        for key, partition in full:
+            self._write(key, partition)
+
+    def flush_due(self):
+        """Escribe las particiones cuyo evento más antiguo superó max_age_seconds."""
+        now = time.monotonic()
+        with self._lock:
+            due = [key for key, partition in self._partitions.items() if now - partition["since"] >= self.max_age_seconds]
+            partitions = [(key, self._partitions.pop(key)) for key in due]
+        for key, partition in partitions:
+            self._write(key, partition)
+
+    def flush(self):
+        """Escribe todas las particiones pendientes."""
+        with self._lock:
+            partitions, self._partitions = list(self._partitions.items()), {}
+        for key, partition in partitions:
+            self._write(key, partition)
+
+    def _write(self, key, partition):
+        date, event_type = key
+        low = partition["min"] if partition["min"] is not None else 0
+        high = partition["max"] if partition["max"] is not None else int(time.time() * 1000)
+        object_key = f"date={date}/type={event_type}/{low}-{high}-{uuid.uuid4().hex[:12]}{self.extension}"
+        data = self._compress(("\n".join(partition["lines"]) + "\n").encode("utf-8"))
+        try:
+            self.store.put(object_key, data)
+        except Exception as e:
+            # Se reintenta en el próximo flush; DynamoDB ya tiene los eventos
+            logger.error(f"Error escribiendo archivo de auditoría {object_key}: {str(e)}", exc_info=True)
+            with self._lock:
+                self._partitions[key] = self._rebuffer(partition, self._partitions.get(key))
+            return
+        self.files_written += 1
+        self.bytes_written += len(data)
+        logger.info(f"Archivo de auditoría {object_key}: {len(partition['lines'])} eventos, {len(data)} bytes")
+
+    def _rebuffer(self, failed, pending):
+        """Une una partición que no se pudo escribir con la pendiente más nueva, acotada a max_pending_bytes."""
+        if pending:
+            # El rango del nombre del archivo debe cubrir los eventos de ambas
+            bounds = [value for value in (failed["min"], failed["max"], pending["min"], pending["max"]) if value is not None]
+            failed = {
+                "lines": failed["lines"] + pending["lines"],
+                "bytes": failed["bytes"] + pending["bytes"],
+                "since": min(failed["since"], pending["since"]),
+                "min": min(bounds) if bounds else None,
+                "max": max(bounds) if bounds else None,
+            }
+        # Se descartan los más antiguos con un único recorte; min/max quedan como cota (el rango solo se ensancha)
+        lines = failed["lines"]
+        dropped = 0
+        while failed["bytes"] > self.max_pending_bytes and dropped < len(lines) - 1:
+            failed["bytes"] -= len(lines[dropped]) + 1
+            dropped += 1
+        if dropped:
+            failed["lines"] = lines[dropped:]
+            self.events_dropped += dropped
+            logger.error(f"Buffer del archivo de auditoría lleno: {dropped} eventos descartados ({self.events_dropped} en total)")
+        return failed
+
+
+class ArchiveReader:
+    """Lectura de un rango de tiempo del archivo con descarte de particiones y archivos."""
+
+    def __init__(self, store):
+        self.store = store
+        self.files_read = 0
+        self.files_skipped = 0
+        self.bytes_read = 0
+
+    def _keys(self, start, end, types):
+        day = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+        start_ms, end_ms = int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+        while day < end:
+            date = day.strftime("%Y-%m-%d")
+            prefixes = [f"date={date}/type={event_type.replace('/', '_')}/" for event_type in types] if types else [f"date={date}/"]
+            for prefix in prefixes:
+                for key in self.store.list(prefix):
+                    low, high = (int(value) for value in key.rsplit("/", 1)[1].split("-")[:2])
+                    if high < start_ms or low >= end_ms:
+                        self.files_skipped += 1
+                        continue
+                    yield key
+            day += timedelta(days=1)
+
+    def scan(self, start, end, types=None, predicate=None, columns=None):
+        """Itera los eventos de [start, end) de los tipos indicados que cumplen predicate.
+
+        start y end son datetime con zona horaria; columns limita los atributos retornados.
+        """
+        start_ms, end_ms = int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+        for key in self._keys(start, end, types):
+            data = self.store.get(key)
+            self.files_read += 1
+            self.bytes_read += len(data)
+            for line in _decompress(key, data).splitlines():
+                event = json.loads(line)
+                if not start_ms <= event.get("epoch_ms", 0) < end_ms:
+                    continue
+                if predicate and not predicate(event):
+                    continue
+                yield {column: event.get(column) for column in columns} if columns else event
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lee eventos del archivo de auditoría como JSON-lines")
+    parser.add_argument("--url", default=AUDIT_ARCHIVE_URL, help="s3://bucket/prefijo/ o file:///ruta/")
+    parser.add_argument("--start", required=True, help="Inicio del rango (ISO 8601, UTC)")
+    parser.add_argument("--end", required=True, help="Fin del rango, excluido (ISO 8601, UTC)")
+    parser.add_argument("--type", action="append", dest="types", help="Tipo de evento (repetible)")
+    parser.add_argument("--where", action="append", default=[], help="Filtro atributo=valor (repetible)")
+    parser.add_argument("--columns", help="Atributos a retornar, separados por coma")
+    args = parser.parse_args()
+
+    def parse_time(value):
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+    filters = dict(condition.split("=", 1) for condition in args.where)
+    reader = ArchiveReader(build_archive_store(args.url))
+    events = reader.scan(
+        parse_time(args.start), parse_time(args.end), args.types,
+        predicate=(lambda event: all(str(event.get(name)) == value for name, value in filters.items())) if filters else None,
+        columns=args.columns.split(",") if args.columns else None,
+    )
+    for event in events:
+        print(json.dumps(event, default=str))
+    logger.info(f"Archivos leídos: {reader.files_read}, descartados: {reader.files_skipped}, bytes: {reader.bytes_read}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Backfill del layout por tiempo (ver audit_index) sobre eventos de auditoría existentes.
+
+Recorre la tabla de origen con un Scan paralelo (--segments) y escribe cada evento
+con pk, sk y epoch_ms en la tabla de destino:
+
+  - destino nuevo (TABLE_DEFINITION, --create-table para crearlo): migración a la
+    tabla particionada por tiempo; los ítems que ya tienen pk se copian tal cual.
+  - destino = origen: solo agrega los atributos a la tabla con clave histórica
+    (transaction_id, timestamp); los ítems que ya tienen pk se omiten, por lo que
+    el proceso puede reanudarse. AuditQuery los consulta con AUDIT_TABLE_LAYOUT=legacy
+    por el GSI LEGACY_TIME_INDEX (--create-index lo agrega a la tabla).
+
+Los valores de AUDIT_PARTITION_BUCKET y AUDIT_PARTITION_SHARDS deben ser los mismos
+que usa el procesador de auditoría.
+
+Uso:
+    python audit_backfill.py --source audit_events --target audit_events_by_time
+        [--segments 4] [--create-table | --create-index] [--dry-run] [--endpoint-url http://localhost:8000]
+"""
+import argparse
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import aws_clients
+from audit_index import (AUDIT_PARTITION_BUCKET, AUDIT_PARTITION_SHARDS, LEGACY_TABLE_KEYS, LEGACY_TIME_INDEX,
+                         LEGACY_TIME_INDEX_UPDATE, TABLE_DEFINITION, TABLE_KEYS, index_attributes,
+                         parse_legacy_timestamp)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+
+
+def migrate_item(item, bucket=AUDIT_PARTITION_BUCKET, shards=AUDIT_PARTITION_SHARDS):
+    """Retorna el ítem con los atributos del layout por tiempo calculados desde su timestamp histórico."""
+    when = parse_legacy_timestamp(item["timestamp"])
+    return {**item, **index_attributes(item.get("type", "unknown"), item.get("transaction_id", "N/A"), when, bucket, shards)}
+
+
+def backfill_segment(source, target, segment, total_segments, in_place=False, dry_run=False,
+                     bucket=AUDIT_PARTITION_BUCKET, shards=AUDIT_PARTITION_SHARDS):
+    """Migra un segmento del Scan paralelo. Retorna los contadores del segmento."""
+    stats = Counter()
+    scan_kwargs = {"Segment": segment, "TotalSegments": total_segments}
+    with target.batch_writer(overwrite_by_pkeys=LEGACY_TABLE_KEYS if in_place else TABLE_KEYS) as batch:
+        while True:
+            response = source.scan(**scan_kwargs)
+            for item in response.get("Items", []):
+                stats["scanned"] += 1
+                if "pk" in item:
+                    if in_place:
+                        stats["skipped"] += 1
+                        continue
+                    migrated = item
+                else:
+                    try:
+                        migrated = migrate_item(item, bucket, shards)
+                    except (KeyError, ValueError) as e:
+                        logger.warning(f"Evento {item.get('transaction_id')} sin timestamp válido, se omite: {str(e)}")
+                        stats["invalid"] += 1
+                        continue
+                if not dry_run:
+                    batch.put_item(Item=migrated)
+                stats["written"] += 1
+
+            start_key = response.get("LastEvaluatedKey")
+            if not start_key:
+                break
+            scan_kwargs["ExclusiveStartKey"] = start_key
+
+    logger.info(f"Segmento {segment}/{total_segments}: {dict(stats)}")
+    return stats
+
+
+def backfill(table_pairs, in_place=False, dry_run=False, bucket=AUDIT_PARTITION_BUCKET, shards=AUDIT_PARTITION_SHARDS):
+    """Ejecuta un segmento por cada par (origen, destino) en paralelo y retorna los contadores totales."""
+    total = Counter()
+    with ThreadPoolExecutor(max_workers=len(table_pairs)) as executor:
+        futures = [
+            executor.submit(backfill_segment, source, target, segment, len(table_pairs), in_place, dry_run, bucket, shards)
+            for segment, (source, target) in enumerate(table_pairs)
+        ]
+        for future in futures:
+            total.update(future.result())
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", required=True, help="Tabla con los eventos históricos")
+    parser.add_argument("--target", required=True, help="Tabla de destino (puede ser la misma que --source)")
+    parser.add_argument("--segments", type=int, default=4, help="Segmentos del Scan paralelo")
+    parser.add_argument("--create-table", action="store_true", help="Crea la tabla de destino con TABLE_DEFINITION")
+    parser.add_argument("--create-index", action="store_true", help="Agrega el GSI LEGACY_TIME_INDEX a la tabla (in-place)")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--endpoint-url", help="Endpoint de DynamoDB (p.ej. DynamoDB Local)")
+    args = parser.parse_args()
+
+    resource_kwargs = {"endpoint_url": args.endpoint_url} if args.endpoint_url else {}
+    in_place = args.source == args.target
+
+    if args.create_table and not in_place:
+        dynamodb = aws_clients.resource("dynamodb", **resource_kwargs)
+        dynamodb.create_table(TableName=args.target, **TABLE_DEFINITION).wait_until_exists()
+        logger.info(f"Tabla {args.target} creada")
+    if args.create_index and in_place:
+        dynamodb = aws_clients.resource("dynamodb", **resource_kwargs)
+        dynamodb.meta.client.update_table(TableName=args.target, **LEGACY_TIME_INDEX_UPDATE)
+        # El GSI se completa en segundo plano con los ítems que ya tienen pk/sk y los que escriba el backfill
+        logger.info(f"GSI {LEGACY_TIME_INDEX} solicitado en {args.target}")
+
+    # Los recursos de boto3 no son thread-safe: cada segmento usa los suyos
+    session = aws_clients.session()
+    table_pairs = []
+    for _ in range(args.segments):
+        dynamodb = session.resource("dynamodb", **resource_kwargs)
+        table_pairs.append((dynamodb.Table(args.source), dynamodb.Table(args.target)))
+
+    stats = backfill(table_pairs, in_place, args.dry_run)
+    logger.info(f"Backfill {'(dry-run) ' if args.dry_run else ''}{args.source} -> {args.target}: {dict(stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Layout particionado por tiempo de la tabla de auditoría y consultas paginadas.
+
+El procesador de auditoría escribe, además de los atributos históricos
+(transaction_id, timestamp), las claves del layout por tiempo:
+
+    pk        "<type>#<bucket>[#<shard>]"   p.ej. "email-notification#2026-10-18T14"
+    sk        "<ISO 8601 UTC>#<transaction_id>[#<messageId>]"  ordenable lexicográficamente
+    epoch_ms  instante del evento en milisegundos (Number)
+
+El instante es el `timestamp` que asigna el emisor (no el del procesamiento) y el
+sufijo messageId de SQS distingue eventos de una transacción en el mismo
+microsegundo; una reentrega del mismo mensaje produce la misma clave y sobrescribe
+el ítem en lugar de duplicarlo.
+
+Tabla (TABLE_DEFINITION): PK pk, SK sk y el GSI TRANSACTION_INDEX (transaction_id, sk)
+para buscar todos los eventos de una transacción. Un panel "eventos de tipo X en
+las últimas N horas" lee solo las particiones de esas horas en lugar de escanear la
+tabla completa.
+
+AUDIT_TABLE_LAYOUT indica sobre qué tabla escribe el procesador y consulta AuditQuery:
+
+  - "legacy" (por defecto): la tabla histórica (PK transaction_id, SK timestamp), que
+    el procesador sigue usando como DYNAMODB_AUDIT_TABLE. pk/sk se consultan por el
+    GSI LEGACY_TIME_INDEX (se crea con LEGACY_TIME_INDEX_UPDATE, ver audit_backfill
+    --create-index) y las transacciones por la clave de la tabla.
+  - "time": una tabla creada con TABLE_DEFINITION. Corte: crear la tabla, copiar los
+    eventos con audit_backfill --source <histórica> --target <nueva>, apuntar
+    DYNAMODB_AUDIT_TABLE a la nueva con AUDIT_TABLE_LAYOUT=time y repetir el backfill
+    para los eventos escritos en la histórica durante el corte (los ítems se sobrescriben).
+
+AUDIT_PARTITION_BUCKET ("hour" o "day") fija el tamaño del bucket y
+AUDIT_PARTITION_SHARDS reparte cada bucket en N particiones (por hash del
+transaction_id) cuando un tipo supera el throughput de una partición. Ambos valores
+deben coincidir entre el procesador y quien consulta.
+"""
+import base64
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+AUDIT_PARTITION_BUCKET = os.environ.get('AUDIT_PARTITION_BUCKET', 'hour')
+AUDIT_PARTITION_SHARDS = int(os.environ.get('AUDIT_PARTITION_SHARDS', '1'))
+AUDIT_TABLE_LAYOUT = os.environ.get('AUDIT_TABLE_LAYOUT', 'legacy')
+
+TABLE_KEYS = ["pk", "sk"]
+TRANSACTION_INDEX = "transaction_id-sk-index"
+LEGACY_TABLE_KEYS = ["transaction_id", "timestamp"]
+LEGACY_TIME_INDEX = "pk-sk-index"
+LEGACY_TIMESTAMP_FORMAT = "%Y-%m-%d-%H.%M.%S.%f"
+SORT_KEY_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+_BUCKETS = {
+    "hour": ("%Y-%m-%dT%H", timedelta(hours=1)),
+    "day": ("%Y-%m-%d", timedelta(days=1)),
+}
+
+# Argumentos de create_table para el layout por tiempo (despliegue, DynamoDB Local y benchmarks)
+TABLE_DEFINITION = {
+    "KeySchema": [
+        {"AttributeName": "pk", "KeyType": "HASH"},
+        {"AttributeName": "sk", "KeyType": "RANGE"},
+    ],
+    "AttributeDefinitions": [
+        {"AttributeName": "pk", "AttributeType": "S"},
+        {"AttributeName": "sk", "AttributeType": "S"},
+        {"AttributeName": "transaction_id", "AttributeType": "S"},
+    ],
+    "GlobalSecondaryIndexes": [{
+        "IndexName": TRANSACTION_INDEX,
+        "KeySchema": [
+            {"AttributeName": "transaction_id", "KeyType": "HASH"},
+            {"AttributeName": "sk", "KeyType": "RANGE"},
+        ],
+        "Projection": {"ProjectionType": "ALL"},
+    }],
+    "BillingMode": "PAY_PER_REQUEST",
+}
+
+# Argumentos de update_table para consultar pk/sk sobre la tabla histórica (on-demand)
+LEGACY_TIME_INDEX_UPDATE = {
+    "AttributeDefinitions": [
+        {"AttributeName": "pk", "AttributeType": "S"},
+        {"AttributeName": "sk", "AttributeType": "S"},
+    ],
+    "GlobalSecondaryIndexUpdates": [{"Create": {
+        "IndexName": LEGACY_TIME_INDEX,
+        "KeySchema": [
+            {"AttributeName": "pk", "KeyType": "HASH"},
+            {"AttributeName": "sk", "KeyType": "RANGE"},
+        ],
+        "Projection": {"ProjectionType": "ALL"},
+    }}],
+}
+
+# Por layout: claves de la tabla, índice de las particiones por tiempo e índice por transacción
+# (None = la clave de la propia tabla)
+LAYOUTS = {
+    "time": {"keys": TABLE_KEYS, "time_index": None, "transaction_index": TRANSACTION_INDEX},
+    "legacy": {"keys": LEGACY_TABLE_KEYS, "time_index": LEGACY_TIME_INDEX, "transaction_index": None},
+}
+
+
+def table_keys(layout=AUDIT_TABLE_LAYOUT):
+    """Claves primarias de la tabla de auditoría del layout (overwrite_by_pkeys de batch_writer)."""
+    return LAYOUTS[layout]["keys"]
+
+
+def _utc(when):
+    return when.replace(tzinfo=timezone.utc) if when.tzinfo is None else when.astimezone(timezone.utc)
+
+
+def sort_key_prefix(when):
+    """Prefijo ISO 8601 del sk para un instante (también sirve como límite de rango)."""
+    return _utc(when).strftime(SORT_KEY_FORMAT)
+
+
+def partition_key(event_type, when, transaction_id="", bucket=AUDIT_PARTITION_BUCKET, shards=AUDIT_PARTITION_SHARDS):
+    """pk del evento: tipo, bucket de tiempo y, si hay más de un shard, el shard del transaction_id."""
+    key = f"{event_type}#{_utc(when).strftime(_BUCKETS[bucket][0])}"
+    if shards > 1:
+        shard = int(hashlib.sha256(transaction_id.encode("utf-8")).hexdigest()[:8], 16) % shards
+        key += f"#{shard}"
+    return key
+
+
+def index_attributes(event_type, transaction_id, when, bucket=AUDIT_PARTITION_BUCKET, shards=AUDIT_PARTITION_SHARDS,
+                     message_id=None):
+    """Atributos de clave e índice del layout por tiempo para un evento (message_id desambigua el sk)."""
+    transaction_id = str(transaction_id)
+    sort_key = f"{sort_key_prefix(when)}#{transaction_id}"
+    if message_id:
+        sort_key += f"#{message_id}"
+    return {
+        "pk": partition_key(event_type, when, transaction_id, bucket, shards),
+        "sk": sort_key,
+        "epoch_ms": int(_utc(when).timestamp() * 1000),
+    }
+
+
+def parse_legacy_timestamp(value):
+    """Convierte el timestamp histórico (%Y-%m-%d-%H.%M.%S.%f, UTC) a datetime."""
+    return datetime.strptime(value, LEGACY_TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+
+
+def partition_keys(event_type, start, end, bucket=AUDIT_PARTITION_BUCKET, shards=AUDIT_PARTITION_SHARDS, newest_first=True):
+    """Particiones que cubren [start, end) para un tipo, en orden cronológico (o inverso)."""
+    bucket_format, step = _BUCKETS[bucket]
+    start, end = _utc(start), _utc(end)
+    current = datetime.strptime(start.strftime(bucket_format), bucket_format).replace(tzinfo=timezone.utc)
+    buckets = []
+    while current < end:
+        buckets.append(current.strftime(bucket_format))
+        current += step
+    if newest_first:
+        buckets.reverse()
+    suffixes = [f"#{shard}" for shard in range(shards)] if shards > 1 else [""]
+    return [f"{event_type}#{name}{suffix}" for name in buckets for suffix in suffixes]
+
+
+def _encode_cursor(state):
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+
+
+class AuditQuery:
+    """Consultas paginadas por rango de tiempo y tipo sobre el layout por tiempo.
+
+    Los resultados se recorren partición por partición (bucket más reciente primero
+    con newest_first) y, dentro de cada partición, ordenados por sk. Con más de un
+    shard el orden es por bucket y no estrictamente cronológico entre shards.
+
+    `layout` ("legacy" o "time", ver AUDIT_TABLE_LAYOUT) decide si pk/sk se consultan
+    por el GSI LEGACY_TIME_INDEX o por la clave de la tabla. Los GSI no admiten
+    lecturas consistentes.
+    """
+
+    def __init__(self, table, bucket=AUDIT_PARTITION_BUCKET, shards=AUDIT_PARTITION_SHARDS, consistent_read=False,
+                 layout=AUDIT_TABLE_LAYOUT):
+        self.table = table
+        self.bucket = bucket
+        self.shards = shards
+        self.time_index = LAYOUTS[layout]["time_index"]
+        self.transaction_index = LAYOUTS[layout]["transaction_index"]
+        if consistent_read and self.time_index:
+            raise ValueError(f"El layout {layout} consulta el GSI {self.time_index}, que no admite ConsistentRead")
+        self.consistent_read = consistent_read
+        self.consumed_capacity = 0.0
+
+    def _partitions(self, event_types, start, end, newest_first):
+        partitions = []
+        for event_type in event_types:
+            partitions.extend(partition_keys(event_type, start, end, self.bucket, self.shards, newest_first))
+        return partitions
+
+    def page(self, event_types, start, end, page_size=100, cursor=None, newest_first=True):
+        """Retorna hasta page_size eventos de [start, end) y el cursor de la página siguiente (o None)."""
+        partitions = self._partitions(event_types, start, end, newest_first)
+        state = _decode_cursor(cursor) if cursor else {"p": 0, "k": None}
+        partition_index, start_key = state["p"], state["k"]
+        items = []
+
+        while partition_index < len(partitions) and len(items) < page_size:
+            kwargs = {
+                "KeyConditionExpression": "pk = :pk AND sk BETWEEN :start AND :end",
+                "ExpressionAttributeValues": {
+                    ":pk": partitions[partition_index],
+                    ":start": sort_key_prefix(start),
+                    ":end": sort_key_prefix(end),
+                },
+                "ScanIndexForward": not newest_first,
+                "Limit": page_size - len(items),
+                "ReturnConsumedCapacity": "TOTAL",
+            }
+            if self.time_index:
+                kwargs["IndexName"] = self.time_index
+            else:
+                kwargs["ConsistentRead"] = self.consistent_read
+            if start_key:
+                kwargs["ExclusiveStartKey"] = start_key
+            response = self.table.query(**kwargs)
+            self.consumed_capacity += response.get("ConsumedCapacity", {}).get("CapacityUnits", 0)
+            items.extend(response.get("Items", []))
+
+            start_key = response.get("LastEvaluatedKey")
+            if not start_key:
+                partition_index += 1
+
+        next_cursor = None
+        if partition_index < len(partitions):
+            next_cursor = _encode_cursor({"p": partition_index, "k": start_key})
+        return {"items": items, "cursor": next_cursor}
+
+    def events(self, event_types, start, end, page_size=100, newest_first=True):
+        """Itera todos los eventos de [start, end) página por página."""
+        cursor = None
+        while True:
+            result = self.page(event_types, start, end, page_size, cursor, newest_first)
+            yield from result["items"]
+            cursor = result["cursor"]
+            if not cursor:
+                return
+
+    def by_transaction(self, transaction_id):
+        """Eventos de una transacción en orden cronológico (GSI TRANSACTION_INDEX o clave de la tabla histórica)."""
+        items, start_key = [], None
+        while True:
+            kwargs = {
+                "KeyConditionExpression": "transaction_id = :transaction_id",
+                "ExpressionAttributeValues": {":transaction_id": transaction_id},
+                "ReturnConsumedCapacity": "TOTAL",
+            }
+            if self.transaction_index:
+                kwargs["IndexName"] = self.transaction_index
+            if start_key:
+                kwargs["ExclusiveStartKey"] = start_key
+            response = self.table.query(**kwargs)
+            self.consumed_capacity += response.get("ConsumedCapacity", {}).get("CapacityUnits", 0)
+            items.extend(response.get("Items", []))
+            start_key = response.get("LastEvaluatedKey")
+            if not start_key:
+                return items
+
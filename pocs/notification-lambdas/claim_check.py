@@ -0,0 +1,96 @@
+"""Claim-check para payloads grandes en el pipeline de notificaciones.
+
+Los payloads cuyo JSON supera CLAIM_CHECK_THRESHOLD_BYTES se guardan en S3 y en
+la cola (o en la auditoría) viaja solo una referencia compacta:
+
+    {"$claim_check": {"bucket": "...", "key": "claim-checks/<sha256>.json", "bytes": 123456}}
+
+Las claves son direccionadas por contenido, por lo que un mismo cuerpo compartido
+por varios chunks se guarda una sola vez. Se recomienda una regla de lifecycle en
+el bucket para expirar el prefijo CLAIM_CHECK_PREFIX.
+
+Los consumidores resuelven las referencias de forma perezosa y las cachean durante
+la invocación (start_invocation limpia la cache).
+"""
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger()
+
+CLAIM_CHECK_BUCKET = os.environ.get('CLAIM_CHECK_BUCKET')  # Sin bucket, el offload queda desactivado
+CLAIM_CHECK_THRESHOLD_BYTES = int(os.environ.get('CLAIM_CHECK_THRESHOLD_BYTES', str(64 * 1024)))
+CLAIM_CHECK_PREFIX = os.environ.get('CLAIM_CHECK_PREFIX', 'claim-checks/')
+
+REFERENCE_KEY = "$claim_check"
+
+# Campos de los mensajes de notificación que pueden viajar como referencia
+PAYLOAD_FIELDS = ("body", "message", "data", "recipients")
+
+
+def is_reference(value):
+    """Indica si `value` es una referencia claim-check."""
+    return isinstance(value, dict) and len(value) == 1 and REFERENCE_KEY in value
+
+
+class ClaimCheckStore:
+    """Guarda y resuelve payloads grandes en S3 (o un doble local con la misma interfaz)."""
+
+    def __init__(self, s3_client, bucket=CLAIM_CHECK_BUCKET, threshold=CLAIM_CHECK_THRESHOLD_BYTES, prefix=CLAIM_CHECK_PREFIX):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.threshold = threshold
+        self.prefix = prefix
+        self._cache = {}
+
+    def start_invocation(self):
+        """Limpia la cache de referencias resueltas al comienzo de cada invocación."""
+        self._cache = {}
+
+    def offload(self, payload):
+        """Retorna el payload tal cual o, si supera el umbral, una referencia a su copia en S3."""
+        if not self.bucket or payload is None or is_reference(payload):
+            return payload
+
+        serialized = json.dumps(payload).encode("utf-8")
+        if len(serialized) <= self.threshold:
+            return payload
+        return self._put(payload, serialized)
+
+    def store(self, payload):
+        """Guarda el payload en S3 sin importar su tamaño y retorna la referencia (None sin bucket)."""
+        if not self.bucket:
+            return None
+        if is_reference(payload):
+            return payload
+        return self._put(payload, json.dumps(payload, default=str).encode("utf-8"))
+
+    def _put(self, payload, serialized):
+        key = f"{self.prefix}{hashlib.sha256(serialized).hexdigest()}.json"
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=serialized, ContentType="application/json")
+        logger.info(f"Payload de {len(serialized)} bytes almacenado en s3://{self.bucket}/{key}")
+
+        reference = {REFERENCE_KEY: {"bucket": self.bucket, "key": key, "bytes": len(serialized)}}
+        self._cache[key] = payload
+        return reference
+
+    def resolve(self, value):
+        """Retorna el payload original de una referencia (o el valor recibido si no lo es)."""
+        if not is_reference(value):
+            return value
+
+        pointer = value[REFERENCE_KEY]
+        if pointer["key"] not in self._cache:
+            response = self.s3.get_object(Bucket=pointer["bucket"], Key=pointer["key"])
+            self._cache[pointer["key"]] = json.loads(response["Body"].read())
+            logger.info(f"Claim-check resuelto desde s3://{pointer['bucket']}/{pointer['key']}")
+        return self._cache[pointer["key"]]
+
+    def offload_fields(self, message, fields):
+        """Retorna una copia de `message` con los campos indicados reemplazados por referencias si son grandes."""
+        return {key: self.offload(value) if key in fields else value for key, value in message.items()}
+
+    def resolve_fields(self, message, fields):
+        """Retorna una copia de `message` con las referencias de los campos indicados resueltas."""
+        return {key: self.resolve(value) if key in fields else value for key, value in message.items()}
@@ -0,0 +1,146 @@
+"""Conexión a Aurora reutilizable entre invocaciones de un mismo contenedor Lambda.
+
+La conexión se crea en el primer uso y se mantiene a nivel de módulo mientras el
+contenedor esté caliente. Antes de reutilizarla tras un periodo de inactividad se
+valida con un health check y, si el socket quedó obsoleto, se reconecta de forma
+transparente. Cada invocación puede consultar sus métricas de conexión y consulta.
+
+Los drivers (psycopg2, pymysql) se importan en la primera conexión y no al crear la
+DatabaseConnection, de modo que importar un handler no exige el driver instalado.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+
+# Segundos de inactividad tras los cuales se valida la conexión antes de reutilizarla
+DB_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_HEALTH_CHECK_INTERVAL', '60'))
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', '5'))
+
+
+class DatabaseConnection:
+    """Conexión DB-API perezosa, con health check y métricas por invocación."""
+
+    def __init__(self, name, connect, ping, disconnect_errors=(), health_check_interval=DB_HEALTH_CHECK_INTERVAL):
+        self.name = name
+        self._connect = connect
+        self._ping = ping
+        self._disconnect_errors = disconnect_errors  # Tupla de excepciones o función que la retorna
+        self._health_check_interval = health_check_interval
+        self._conn = None
+        self._last_used = 0.0
+        self.metrics = {}
+        self.start_invocation()
+
+    def start_invocation(self):
+        """Reinicia las métricas al comienzo de cada invocación."""
+        self.metrics = {"connects": 0, "connect_ms": 0.0, "health_checks": 0, "queries": 0, "query_ms": 0.0}
+
+    def connection(self):
+        """Retorna una conexión sana, reutilizando la del contenedor si sigue viva."""
+        if self._conn is not None and time.monotonic() - self._last_used >= self._health_check_interval:
+            self.metrics["health_checks"] += 1
+            try:
+                self._ping(self._conn)
+            except Exception as e:
+                logger.warning(f"Conexión {self.name} obsoleta, reconectando: {str(e)}")
+                self.close()
+
+        if self._conn is None:
+            start = time.perf_counter()
+            self._conn = self._connect()
+            self.metrics["connects"] += 1
+            self.metrics["connect_ms"] += (time.perf_counter() - start) * 1000
+            logger.info(f"Nueva conexión {self.name} establecida")
+
+        self._last_used = time.monotonic()
+        return self._conn
+
+    def disconnect_errors(self):
+        """Excepciones que indican un socket cerrado, resueltas en el primer uso (import del driver)."""
+        if callable(self._disconnect_errors):
+            self._disconnect_errors = self._disconnect_errors()
+        return tuple(self._disconnect_errors)
+
+    @contextmanager
+    def cursor(self, **kwargs):
+        """Abre un cursor sobre la conexión compartida y mide el tiempo de consulta."""
+        cursor = self.connection().cursor(**kwargs)
+        start = time.perf_counter()
+        try:
+            yield cursor
+        except self.disconnect_errors():
+            # El socket se cerró a mitad de la consulta: la próxima llamada reconecta
+            self._close_cursor(cursor)
+            self.close()
+            raise
+        except BaseException:
+            self._close_cursor(cursor)
+            raise
+        else:
+            cursor.close()
+        finally:
+            self.metrics["queries"] += 1
+            self.metrics["query_ms"] += (time.perf_counter() - start) * 1000
+            self._last_used = time.monotonic()
+
+    def _close_cursor(self, cursor):
+        """Cierra el cursor tras un error sin ocultar la excepción original."""
+        try:
+            cursor.close()
+        except Exception as e:
+            logger.warning(f"No se pudo cerrar el cursor {self.name}: {str(e)}")
+
+    def close(self):
+        """Cierra la conexión actual (si existe) ignorando errores de sockets ya cerrados."""
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+
+def postgres_connection(host, user, password, dbname, **kwargs):
+    """Crea una DatabaseConnection sobre psycopg2 en modo autocommit."""
+
+    def connect():
+        import psycopg2
+        conn = psycopg2.connect(host=host, user=user, password=password, dbname=dbname,
+                                connect_timeout=DB_CONNECT_TIMEOUT, **kwargs)
+        # Sin autocommit, una conexión reutilizada quedaría "idle in transaction" entre invocaciones
+        conn.autocommit = True
+        return conn
+
+    def ping(conn):
+        if conn.closed:
+            raise ConnectionError("connection already closed")
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1;")
+
+    def disconnect_errors():
+        import psycopg2
+        return psycopg2.OperationalError, psycopg2.InterfaceError
+
+    return DatabaseConnection("postgres", connect, ping, disconnect_errors)
+
+
+def mysql_connection(host, user, password, database, **kwargs):
+    """Crea una DatabaseConnection sobre pymysql en modo autocommit."""
+
+    def connect():
+        import pymysql
+        # Con autocommit cada consulta ve datos actuales y no un snapshot de una transacción abierta
+        return pymysql.connect(host=host, user=user, password=password, database=database,
+                               connect_timeout=DB_CONNECT_TIMEOUT, autocommit=True, **kwargs)
+
+    def ping(conn):
+        conn.ping(reconnect=False)
+
+    def disconnect_errors():
+        import pymysql
+        return pymysql.err.OperationalError, pymysql.err.InterfaceError
+
+    return DatabaseConnection("mysql", connect, ping, disconnect_errors)
@@ -0,0 +1,210 @@
+"""Idempotencia de los consumidores de SQS ante reentregas.
+
+Los handlers confirman (delete_message) después de los efectos (sns.publish,
+put_item); si la Lambda vence o falla entre ambos, SQS reentrega el mensaje. Cada
+unidad de trabajo se identifica con una clave estable entre reentregas, p.ej.
+"sms#<transaction_id>#<chunk_index>" o "email#<messageId>", y pasa por:
+
+    claim(key)    -> escritura condicional IN_PROGRESS con un lease de IDEMPOTENCY_LEASE_SECONDS.
+                     Retorna CLAIMED, COMPLETED (duplicado: confirmar sin procesar) o
+                     IN_PROGRESS (otro contenedor la reclamó y su lease sigue vigente)
+    complete(key) -> COMPLETED, expira a los IDEMPOTENCY_TTL_SECONDS (atributo TTL expires_at)
+    release(key)  -> borra la clave si el trabajo falló, para que el reintento pueda procesarlo
+
+Un reintento de trabajo ya completado cuesta una escritura condicional rechazada en
+lugar de un reenvío completo, y nada si el mismo contenedor lo completó: las claves
+completadas se recuerdan en un LRU en memoria (IDEMPOTENCY_CACHE_SIZE) que se
+consulta antes del store.
+
+Una clave IN_PROGRESS no es un duplicado: el contenedor que la reclamó pudo vencer
+antes de publicar o escribir. Los consumidores no confirman esos mensajes (fallidos /
+batchItemFailures) y SQS los reentrega; al vencer el lease la reentrega puede
+reclamarlos. Conviene un visibility timeout cercano a IDEMPOTENCY_LEASE_SECONDS para
+no agotar el maxReceiveCount de la DLQ mientras el lease sigue vigente.
+
+El procesador de auditoría no usa este módulo: su escritura ya es idempotente (la
+clave del evento se deriva del timestamp del emisor y del messageId, ver audit_index)
+y un claim/complete por registro duplicaría las llamadas a DynamoDB del lote.
+
+Si el store no responde se procesa igual (al menos una vez): es preferible un
+duplicado a perder una notificación.
+
+IDEMPOTENCY_TABLE:
+  - nombre de tabla DynamoDB (PK idempotency_key (S), TTL sobre expires_at)
+  - memory:// : InMemoryIdempotencyStore, solo para pruebas locales
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+IDEMPOTENCY_TABLE = os.environ.get('IDEMPOTENCY_TABLE')  # Sin tabla, la idempotencia queda desactivada
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '300'))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '10000'))
+
+IN_PROGRESS = 'IN_PROGRESS'
+COMPLETED = 'COMPLETED'
+CLAIMED = 'CLAIMED'
+
+
+class DynamoIdempotencyStore:
+    """Claves de idempotencia en DynamoDB con escrituras condicionales."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def put_if_absent(self, key, status, lease_until, expires_at, now):
+        """Crea la clave si no existe, expiró o su lease venció.
+
+        Retorna None si la escribió, o el estado vigente (COMPLETED / IN_PROGRESS) si otra la tiene.
+        """
+        try:
+            self.table.put_item(
+                Item={"idempotency_key": key, "status": status, "lease_until": lease_until, "expires_at": expires_at},
+                ConditionExpression=(
+                    "attribute_not_exists(idempotency_key) OR expires_at < :now "
+                    "OR (#status = :in_progress AND lease_until < :now)"
+                ),
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={":now": now, ":in_progress": IN_PROGRESS},
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            )
+            return None
+        except Exception as e:
+            response = getattr(e, "response", {})
+            if response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+            current = response.get("Item", {}).get("status")
+            if isinstance(current, dict):
+                current = current.get("S")  # El error trae el item en formato de bajo nivel
+            if current is None:
+                current = self.table.get_item(Key={"idempotency_key": key}, ConsistentRead=True).get("Item", {}).get("status")
+            return COMPLETED if current == COMPLETED else IN_PROGRESS
+
+    def put(self, key, status, expires_at):
+        self.table.put_item(Item={"idempotency_key": key, "status": status, "lease_until": 0, "expires_at": expires_at})
+
+    def delete(self, key):
+        self.table.delete_item(Key={"idempotency_key": key})
+
+
+class InMemoryIdempotencyStore:
+    """Doble local con la misma semántica que DynamoIdempotencyStore (no se comparte entre Lambdas)."""
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def put_if_absent(self, key, status, lease_until, expires_at, now):
+        with self._lock:
+            item = self._items.get(key)
+            if item and item["expires_at"] >= now and not (item["status"] == IN_PROGRESS and item["lease_until"] < now):
+                return item["status"]
+            self._items[key] = {"status": status, "lease_until": lease_until, "expires_at": expires_at}
+            return None
+
+    def put(self, key, status, expires_at):
+        with self._lock:
+            self._items[key] = {"status": status, "lease_until": 0, "expires_at": expires_at}
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+def build_idempotency_store(table_name=IDEMPOTENCY_TABLE):
+    """Retorna el store de idempotencia configurado, o None si está desactivado."""
+    if not table_name:
+        return None
+    if table_name.startswith("memory://"):
+        return InMemoryIdempotencyStore()
+    import aws_clients
+    return DynamoIdempotencyStore(aws_clients.table(table_name))
+
+
+class Idempotency:
+    """claim / complete / release sobre un store, con LRU en memoria de las claves completadas."""
+
+    def __init__(self, store, lease_seconds=IDEMPOTENCY_LEASE_SECONDS, ttl_seconds=IDEMPOTENCY_TTL_SECONDS,
+                 cache_size=IDEMPOTENCY_CACHE_SIZE, clock=time.time):
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.ttl_seconds = ttl_seconds
+        self.cache_size = cache_size
+        self._clock = clock
+        self._completed = OrderedDict()  # clave -> expires_at
+        self._lock = threading.Lock()
+        self.metrics = {"claimed": 0, "duplicates_local": 0, "duplicates_store": 0, "in_progress": 0, "store_errors": 0}
+
+    def _recently_completed(self, key, now):
+        with self._lock:
+            expires_at = self._completed.get(key)
+            if expires_at is None:
+                return False
+            if expires_at < now:
+                del self._completed[key]
+                return False
+            self._completed.move_to_end(key)
+            return True
+
+    def claim(self, key):
+        """Reserva la clave. Retorna CLAIMED, COMPLETED (ya procesada) o IN_PROGRESS (lease ajeno vigente)."""
+        now = int(self._clock())
+        if self._recently_completed(key, now):
+            self.metrics["duplicates_local"] += 1
+            return COMPLETED
+        try:
+            current = self.store.put_if_absent(key, IN_PROGRESS, now + self.lease_seconds, now + self.ttl_seconds, now)
+        except Exception as e:
+            self.metrics["store_errors"] += 1
+            logger.warning(f"Store de idempotencia no disponible, se procesa {key}: {str(e)}")
+            return CLAIMED
+        if current is None:
+            self.metrics["claimed"] += 1
+            return CLAIMED
+        if current == COMPLETED:
+            self.metrics["duplicates_store"] += 1
+            return COMPLETED
+        self.metrics["in_progress"] += 1
+        return IN_PROGRESS
+
+    def complete(self, key):
+        """Marca la clave como completada en el store y en el LRU."""
+        expires_at = int(self._clock()) + self.ttl_seconds
+        with self._lock:
+            self._completed[key] = expires_at
+            self._completed.move_to_end(key)
+            while len(self._completed) > self.cache_size:
+                self._completed.popitem(last=False)
+        try:
+            self.store.put(key, COMPLETED, expires_at)
+        except Exception as e:
+            self.metrics["store_errors"] += 1
+            logger.warning(f"No se pudo marcar {key} como completada: {str(e)}")
+
+    def release(self, key):
+        """Libera la clave de un trabajo fallido para que la reentrega lo procese."""
+        try:
+            self.store.delete(key)
+        except Exception as e:
+            # El lease vence solo; la reentrega podrá reclamarla después de IDEMPOTENCY_LEASE_SECONDS
+            self.metrics["store_errors"] += 1
+            logger.warning(f"No se pudo liberar {key}: {str(e)}")
+
+
+def build_idempotency():
+    """Idempotency sobre el store configurado, o None si está desactivada."""
+    store = build_idempotency_store()
+    return Idempotency(store) if store else None
+
+
+def message_key(scope, message, message_id):
+    """Clave estable de un mensaje de notificación: transaction_id + chunk_index, o el MessageId de SQS."""
+    transaction_id = message.get("transaction_id")
+    if transaction_id:
+        return f"{scope}#{transaction_id}#{message.get('chunk_index', 0)}"
+    return f"{scope}#{message_id}"
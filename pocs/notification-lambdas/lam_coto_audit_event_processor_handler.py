@@ -1,65 +1,163 @@
 import json
-import boto3
 import os
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
+import aws_clients
+from audit_archive import AuditArchive, build_archive_store
+from audit_index import LEGACY_TIMESTAMP_FORMAT, index_attributes, parse_legacy_timestamp, table_keys
 
 # Configuración de logs
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
 # Configuración de AWS
-sqs = boto3.client('sqs')
-dynamodb = boto3.resource('dynamodb')
+sqs = aws_clients.client('sqs')
 
 # Variables de entorno
 SQS_QUEUE_URL = os.environ['SQS_AUDIT_QUEUE_URL']  # URL de la cola SQS
 DYNAMODB_TABLE_NAME = os.environ['DYNAMODB_AUDIT_TABLE']  # Nombre de la tabla DynamoDB
 
+# Modo de confirmación de mensajes:
+#   "partial-batch" -> responde batchItemFailures (requiere ReportBatchItemFailures en el trigger)
+#   "delete-batch"  -> elimina los mensajes procesados con delete_message_batch
+SQS_ACK_MODE = os.environ.get('SQS_ACK_MODE', 'partial-batch')
+SQS_DELETE_BATCH_SIZE = 10  # Máximo de entradas permitido por delete_message_batch
+
+# Claves de DYNAMODB_AUDIT_TABLE según AUDIT_TABLE_LAYOUT: la tabla histórica (transaction_id, timestamp)
+# con pk/sk en un GSI, o la tabla por tiempo (pk = type#bucket, sk = ISO 8601#transaction_id), ver audit_index
+AUDIT_TABLE_KEYS = table_keys()
+
 # Referencia a la tabla DynamoDB
-audit_table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+audit_table = aws_clients.table(DYNAMODB_TABLE_NAME)
+
+# Archivo comprimido opcional para analítica (AUDIT_ARCHIVE_URL, ver audit_archive)
+archive_store = build_archive_store()
+audit_archive = AuditArchive(archive_store) if archive_store else None
+
+# Sin store de idempotencia: la clave de cada evento (timestamp del emisor + messageId, ver
+# audit_index) es la misma en una reentrega, que sobrescribe el ítem en lugar de duplicarlo
+
+def event_time(sqs_message, record):
+    """Instante de emisión: timestamp del emisor, SentTimestamp de SQS o, en último caso, el actual."""
+    try:
+        return parse_legacy_timestamp(sqs_message["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        pass
+    sent_timestamp = record.get("attributes", {}).get("SentTimestamp")
+    if sent_timestamp:
+        return datetime.fromtimestamp(int(sent_timestamp) / 1000, tz=timezone.utc)
+    return datetime.now(timezone.utc)
+
+def build_audit_event(record, request_id):
+    """Construye el evento de auditoría a partir de un registro SQS."""
+    # Extraer el cuerpo del mensaje desde SQS
+    sqs_message = json.loads(record['body'])
+
+    transaction_id = sqs_message.get("transaction_id", "N/A")
+    event_type = sqs_message.get("type", "unknown")
+    emitted_at = event_time(sqs_message, record)
+
+    # Extraer los datos esperados del mensaje
+    audit_event = {
+        **index_attributes(event_type, transaction_id, emitted_at, message_id=record["messageId"]),
+        "transaction_id": transaction_id,
+        "type": event_type,
+        "timestamp": emitted_at.strftime(LEGACY_TIMESTAMP_FORMAT),
+        "message_id": record["messageId"],
+        "path": sqs_message.get("path", "N/A"),
+        "request_body": sqs_message.get("request_body", {}),
+        "transaction_output": sqs_message.get("transaction_output", {}),
+        "aws_request_id": request_id
+    }
+    # Referencias a los payloads completos guardados en S3 (AUDIT_PAYLOAD_MODE=full)
+    if "full_payloads" in sqs_message:
+        audit_event["full_payloads"] = sqs_message["full_payloads"]
+    return audit_event
+
+def write_audit_events(audit_events):
+    """Guarda los eventos en DynamoDB con batch_writer (agrupa de a 25 y reintenta UnprocessedItems)."""
+    with audit_table.batch_writer(overwrite_by_pkeys=AUDIT_TABLE_KEYS) as batch:
+        for audit_event in audit_events:
+            batch.put_item(Item=audit_event)
+
+def archive_audit_events(audit_events):
+    """Agrega los eventos al archivo y escribe las particiones vencidas. Nunca falla el lote."""
+    if audit_archive is None:
+        return
+    try:
+        audit_archive.append(audit_events)
+        audit_archive.flush_due()
+    except Exception as e:
+        logger.error(f"Error archivando eventos de auditoría: {str(e)}", exc_info=True)
+
+def delete_messages_batch(records):
+    """ACK: Elimina de la cola los mensajes procesados en lotes de 10. Retorna los messageId que fallaron."""
+    failed_message_ids = []
+
+    for i in range(0, len(records), SQS_DELETE_BATCH_SIZE):
+        entries = [
+            {"Id": record["messageId"], "ReceiptHandle": record["receiptHandle"]}
+            for record in records[i:i + SQS_DELETE_BATCH_SIZE]
+        ]
+        response = sqs.delete_message_batch(QueueUrl=SQS_QUEUE_URL, Entries=entries)
+        for failure in response.get("Failed", []):
+            logger.warning(f"No se pudo eliminar el mensaje {failure['Id']} de SQS: {failure.get('Message')}")
+            failed_message_ids.append(failure["Id"])
+
+    return failed_message_ids
 
 def process_sqs_messages(event, request_id):
     """Procesa los mensajes recibidos de la cola SQS, los guarda en DynamoDB y confirma el ACK."""
+    records = event.get('Records', [])
+    failed_message_ids = []
+
     try:
-        logger.info(f"Recibiendo {len(event['Records'])} mensajes desde SQS...")
-
-        for record in event['Records']:
-            # Extraer el cuerpo del mensaje desde SQS
-            sqs_message = json.loads(record['body'])
-
-            # Extraer los datos esperados del mensaje
-            transaction_id = sqs_message.get("transaction_id", "N/A")
-            request_body = sqs_message.get("request_body", {})
-            transaction_output = sqs_message.get("transaction_output", {})
-            path = sqs_message.get("path", "N/A")
-            request_type = sqs_message.get("type", "unknown")
-
-            # Generar el evento a almacenar en DynamoDB
-            audit_event = {
-                "transaction_id": transaction_id,
-                "type": request_type,
-                "timestamp": datetime.utcnow().strftime("%Y-%m-%d-%H.%M.%S.%f"),
-                "path": path,
-                "request_body": request_body,
-                "transaction_output": transaction_output,
-                "aws_request_id": request_id
-            }
-
-            # Guardar en DynamoDB
-            audit_table.put_item(Item=audit_event)
-            logger.info(f"Evento audit guardado en DynamoDB: {audit_event}")
-
-            # ACK: Confirmar recepción eliminando el mensaje de la cola SQS
-            receipt_handle = record["receiptHandle"]
-            sqs.delete_message(QueueUrl=SQS_QUEUE_URL, ReceiptHandle=receipt_handle)
-            logger.info(f"Mensaje con transaction_id {transaction_id} eliminado de SQS (ACK enviado)")
-
-        return {"statusCode": 200, "body": "Mensajes procesados y guardados en audit_events"}
+        logger.info(f"Recibiendo {len(records)} mensajes desde SQS...")
+
+        audit_events = []
+        parsed_records = []
+
+        for record in records:
+            try:
+                audit_event = build_audit_event(record, request_id)
+            except Exception as e:
+                logger.error(f"Mensaje {record.get('messageId')} inválido: {str(e)}")
+                failed_message_ids.append(record["messageId"])
+                continue
+            audit_events.append(audit_event)
+            parsed_records.append(record)
+
+        if audit_events:
+            try:
+                # Guardar en DynamoDB
+                write_audit_events(audit_events)
+                logger.info(f"{len(audit_events)} eventos audit guardados en DynamoDB")
+                archive_audit_events(audit_events)
+            except Exception as e:
+                # Si el lote no se pudo escribir, se devuelven todos sus mensajes para reintento
+                logger.error(f"Error guardando eventos en DynamoDB: {str(e)}", exc_info=True)
+                failed_message_ids.extend(record["messageId"] for record in parsed_records)
+                parsed_records = []
+
+        if SQS_ACK_MODE == "delete-batch":
+            if parsed_records:
+                failed_message_ids.extend(delete_messages_batch(parsed_records))
+                logger.info(f"{len(parsed_records)} mensajes eliminados de SQS (ACK enviado)")
+
+            if failed_message_ids:
+                return {"statusCode": 500, "body": json.dumps({"failed_message_ids": failed_message_ids})}
+            return {"statusCode": 200, "body": "Mensajes procesados y guardados en audit_events"}
+
+        # partial-batch: SQS elimina los mensajes exitosos y reintenta solo los fallidos
+        if failed_message_ids:
+            logger.warning(f"{len(failed_message_ids)} mensajes serán reintentados por SQS")
+        return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed_message_ids]}
 
     except Exception as e:
         logger.error(f"Error procesando mensajes SQS: {str(e)}", exc_info=True)
-        return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
+        if SQS_ACK_MODE == "delete-batch":
+            return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
+        return {"batchItemFailures": [{"itemIdentifier": record["messageId"]} for record in records]}
 
 def lambda_handler(event, context):
     """Lambda Handler para procesar mensajes de la cola SQS."""
@@ -1,18 +1,25 @@
 import json
-import boto3
 import os
 import logging
 import uuid
-from datetime import datetime
+import aws_clients
+import receive_loop
+from audit_emitter import AuditEmitter
+from audit_projection import summarize_sqs_messages
+from claim_check import ClaimCheckStore, PAYLOAD_FIELDS
+from idempotency import build_idempotency, message_key
+from sns_dispatcher import dispatch_batch
+from template_cache import TemplateCache
+from template_engine import compile_template
 
 # Configuración de logs
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
 # Configuración de AWS
-s3 = boto3.client('s3')
-sqs = boto3.client('sqs')
-sns = boto3.client('sns')
+s3 = aws_clients.client('s3')
+sqs = aws_clients.client('sqs')
+sns = aws_clients.client('sns')
 
 # Variables de entorno
 S3_BUCKET_NAME = os.environ['S3_BUCKET_NAME_EMAIL']
@@ -21,110 +28,148 @@ SNS_TOPIC_ARN = os.environ['SNS_TOPIC_ARN_EMAIL']
 SQS_QUEUE_URL = os.environ['SQS_QUEUE_URL_EMAIL']
 SQS_AUDIT_QUEUE_URL = os.environ['SQS_COTO_AUDIT_QUEUE_EMAIL']
 
-def send_audit_event(transaction_id, path, request_body, transaction_output, request_id):
-    """Envía un mensaje de auditoría a SQS."""
-    audit_message = {
-        "transaction_id": transaction_id,
-        "type": "sms-notification",
-        "timestamp": datetime.utcnow().strftime("%Y-%m-%d-%H.%M.%S.%f"),
-        "path": path,
-        "request_body": request_body,
-        "transaction_output": transaction_output,
-        "aws_request_id": request_id
-    }
-    sqs.send_message(QueueUrl=SQS_AUDIT_QUEUE_URL, MessageBody=json.dumps(audit_message))
-    logger.info(f"Evento de auditoría enviado: {audit_message}")
+# Cache de plantillas HTML (memoria + /tmp) compartida entre invocaciones
+template_cache = TemplateCache(s3, S3_BUCKET_NAME)
+
+# Resolución de payloads grandes almacenados en S3 (claim-check)
+claim_checks = ClaimCheckStore(s3)
+
+# Eventos de auditoría con envío por lotes a SQS (ver audit_emitter)
+audit = AuditEmitter(sqs, SQS_AUDIT_QUEUE_URL, "email-notification", payload_store=claim_checks.store)
 
-def get_email_template():
-    """Descarga la plantilla HTML desde S3 y la devuelve como string."""
+# Deduplicación de reentregas de SQS (IDEMPOTENCY_TABLE, ver idempotency)
+idempotency = build_idempotency()
+
+def get_email_template(template_name=TEMPLATE_FILE_NAME):
+    """Obtiene la plantilla HTML desde la cache (revalidada contra S3) y la devuelve como string."""
     try:
-        logger.info(f"Descargando plantilla HTML '{TEMPLATE_FILE_NAME}' desde S3 bucket '{S3_BUCKET_NAME}'")
-        response = s3.get_object(Bucket=S3_BUCKET_NAME, Key=TEMPLATE_FILE_NAME)
-        template = response['Body'].read().decode('utf-8')
-        logger.info("Plantilla HTML descargada con éxito")
-        return template
+        return template_cache.get(template_name)
     except Exception as e:
-        logger.error(f"Error al obtener la plantilla HTML de S3: {str(e)}", exc_info=True)
+        logger.error(f"Error al obtener la plantilla HTML '{template_name}' de S3: {str(e)}", exc_info=True)
         return None
 
-def process_sqs_messages(path:str, transaction_id:str, request_id:str):
+def render_email(template, variables, recipients):
+    """Renderiza la plantilla precompilada con las variables del mensaje.
+
+    El body compartido se renderiza una sola vez. Solo los placeholders que algún
+    destinatario aporta (en su diccionario o en su "variables", p.ej. %{user_name}%)
+    generan un "body" propio, solo en los destinatarios que los aportan; el resto de
+    los placeholders sin valor se conserva tal cual en lugar de multiplicar el body
+    por cada destinatario.
+    """
+    message_template = compile_template(template).bind(variables)
+    recipient_names = {
+        name for name in message_template.placeholders
+        if any(name in recipient or name in recipient.get("variables", {}) for recipient in recipients)
+    }
+    unresolved = [name for name in message_template.placeholders if name not in recipient_names]
+    if unresolved:
+        logger.warning(f"Placeholders sin valor en la plantilla, se conservan: {unresolved}")
+
+    if recipient_names:
+        personalized = []
+        for recipient in recipients:
+            values = {
+                name: value for name, value in {**recipient, **recipient.get("variables", {})}.items()
+                if name in recipient_names
+            }
+            # Los destinatarios sin valores propios usan el body compartido
+            personalized.append(dict(recipient, body=message_template.render(values)) if values else recipient)
+        recipients = personalized
+    return message_template.render({}), recipients
+
+def process_batch(messages, path:str, transaction_id:str, request_id:str):
+    """Publica en SNS un lote recibido de la cola SQS, lo confirma y lo audita."""
+    email_template = get_email_template()
+    if not email_template:
+        logger.error("Error al obtener la plantilla HTML. No se pueden procesar los mensajes")
+        raise Exception("Error al obtener la plantilla HTML")
+
+    entries = []
+    processed_messages = []
+
+    for message in messages["Messages"]:
+        receipt_handle = message["ReceiptHandle"]
+        sns_message = claim_checks.resolve_fields(json.loads(message["Body"]), PAYLOAD_FIELDS)  # Extraer contenido del mensaje
+        
+        transaction_id = sns_message.get("transaction_id", transaction_id)
+        subject = sns_message.get("subject", "Sin Asunto")
+        body = sns_message.get("body", "")
+        sender = sns_message.get("from", "no-reply@miempresa.com")
+        recipients = sns_message.get("recipients", [])
+        template_name = sns_message.get("template", TEMPLATE_FILE_NAME)
+
+        if not recipients:
+            logger.warning(f"Mensaje con subject '{subject}' no tiene destinatarios. Se descartará.")
+            entries.append({"id": message["MessageId"], "receipt_handle": receipt_handle, "publish": None})
+            continue
+
+        message_template = email_template if template_name == TEMPLATE_FILE_NAME else get_email_template(template_name)
+        if not message_template:
+            # Se deja el mensaje en la cola para que sea reintentado
+            logger.error(f"No se pudo obtener la plantilla '{template_name}'. Mensaje con subject '{subject}' no procesado")
+            continue
+
+        # Reemplazar %{body}%, %{subject}% y demás placeholders con el contenido real del email
+        variables = {"subject": subject, "body": body, "from": sender, **sns_message.get("variables", {})}
+        email_content, recipients = render_email(message_template, variables, recipients)
+        
+        # Construir el mensaje procesado
+        processed_message = {
+            "subject": subject,
+            "body": email_content,
+            "from": sender,
+            "recipients": recipients
+        }
+
+        logger.info(f"Mensaje listo para SNS. Subject: {subject}, Destinatarios: {len(recipients)}")
+
+        entries.append({
+            "id": message["MessageId"],
+            "idempotency_key": message_key("email", sns_message, message["MessageId"]),
+            "receipt_handle": receipt_handle,
+            "publish": {"TopicArn": SNS_TOPIC_ARN, "Message": json.dumps(processed_message), "Subject": subject}
+        })
+        processed_messages.append({
+            "email_processed_message" : processed_message,
+            "transaction_id": transaction_id,
+            "chunk_index": sns_message.get("chunk_index", 0),
+            "chunk_count": sns_message.get("chunk_count", 1),
+            "message_id": message["MessageId"]
+        })
+
+    # Publicar en SNS en paralelo y eliminar de la cola solo los mensajes publicados
+    results = dispatch_batch(sns, sqs, SQS_QUEUE_URL, entries, idempotency=idempotency)
+    for processed_message in processed_messages:
+        processed_message.update(results[processed_message["message_id"]])
+
+    transaction_output = {"processed_messages": processed_messages}
+    audit.emit(transaction_id, path, messages, transaction_output, request_id, summarize_request=summarize_sqs_messages)
+
+def process_sqs_messages(path:str, transaction_id:str, request_id:str, context=None):
     """Lee los mensajes de la cola SQS y los procesa uno por uno."""
 
     try:
         logger.info(f"Esperando mensajes en la cola SQS: {SQS_QUEUE_URL}")
-        messages = sqs.receive_message(
-            QueueUrl=SQS_QUEUE_URL,
-            MaxNumberOfMessages=10,  # Leer hasta 10 mensajes a la vez
-            WaitTimeSeconds=5
+        summary = receive_loop.drain(
+            sqs, SQS_QUEUE_URL, context,
+            lambda messages: process_batch(messages, path, transaction_id, request_id)
         )
 
-        if "Messages" not in messages:
+        if not summary["messages"]:
+            # Sin evento de auditoría para los polls vacíos
             logger.info("No hay mensajes en la cola SQS")
-            transaction_output = {"message": "No hay mensajes en la cola"}
-            send_audit_event(transaction_id, path, {}, transaction_output, request_id)
-            return {"statusCode": 200, "body": transaction_output}
-
-        email_template = get_email_template()
-        if not email_template:
-            logger.error("Error al obtener la plantilla HTML. No se pueden procesar los mensajes")
-            transaction_output = {"error": "Error al obtener la plantilla HTML"}
-            send_audit_event(transaction_id, path, {}, transaction_output, request_id)
-            return {"statusCode": 500, "body": transaction_output}
-
-        processed_messages = []
-
-        for message in messages["Messages"]:
-            receipt_handle = message["ReceiptHandle"]
-            sns_message = json.loads(message["Body"])  # Extraer contenido del mensaje
-            
-            transaction_id = sns_message.get("transaction_id", transaction_id)
-            subject = sns_message.get("subject", "Sin Asunto")
-            body = sns_message.get("body", "")
-            sender = sns_message.get("from", "no-reply@miempresa.com")
-            recipients = sns_message.get("recipients", [])
-
-            if not recipients:
-                logger.warning(f"Mensaje con subject '{subject}' no tiene destinatarios. Se descartará.")
-                sqs.delete_message(QueueUrl=SQS_QUEUE_URL, ReceiptHandle=receipt_handle)
-                continue
-
-            # Reemplazar %{body}% en la plantilla con el contenido real del email
-            email_content = email_template.replace("%{body}%", body)
-            
-            # Construir el mensaje procesado
-            processed_message = {
-                "subject": subject,
-                "body": email_content,
-                "from": sender,
-                "recipients": recipients
-            }
-
-            logger.info(f"Publicando mensaje en SNS. Subject: {subject}, Destinatarios: {len(recipients)}")
-
-            # Publicar el mensaje en SNS para su entrega final
-            sns.publish(
-                TopicArn=SNS_TOPIC_ARN,
-                Message=json.dumps(processed_message),
-                Subject=subject
-            )
-
-            # Eliminar el mensaje de la cola una vez procesado correctamente
-            sqs.delete_message(QueueUrl=SQS_QUEUE_URL, ReceiptHandle=receipt_handle)
-            logger.info(f"Mensaje procesado y eliminado de la cola SQS: {subject}")
-
-            processed_messages.append({"email_processed_message" : processed_message, "transaction_id": transaction_id})
-
-        transaction_output = {"processed_messages": processed_messages}
-        send_audit_event(transaction_id, path, messages, transaction_output, request_id)
+            return {"statusCode": 200, "body": {"message": "No hay mensajes en la cola"}}
 
         return {"statusCode": 200, "body": "Mensajes procesados y enviados a SNS"}
 
     except Exception as e:
         logger.error(f"Error en process_sqs_messages: {str(e)}", exc_info=True)
         transaction_output = {"error": str(e)}
-        send_audit_event(transaction_id, path, {}, transaction_output, request_id)
+        audit.emit(transaction_id, path, {}, transaction_output, request_id)
         return {"statusCode": 500, "body": transaction_output}
 
+@audit.flush_on_return
 def lambda_handler(event, context):
     """Lambda que procesa los mensajes de SQS y publica en SNS para entrega final."""
     request_id = context.aws_request_id if context else "N/A"
@@ -132,5 +177,6 @@ def lambda_handler(event, context):
 
     logger.info(f"Lambda ejecutada. Request ID: {request_id}, Transaction ID: {transaction_id}")
 
+    claim_checks.start_invocation()
     path = "/users/emails"
-    return process_sqs_messages(path, transaction_id, request_id)
\ No newline at end of file
+    return process_sqs_messages(path, transaction_id, request_id, context)
\ No newline at end of file
@@ -1,18 +1,23 @@
+import hashlib
 import json
-import boto3
 import random
-import psycopg2
 import os
 import logging
 import uuid
-from datetime import datetime
+import aws_clients
+from audit_emitter import AuditEmitter
+from claim_check import ClaimCheckStore, PAYLOAD_FIELDS
+from db_connection import postgres_connection
+from otp_cache import build_otp_cache
+from otp_store import OtpStore
 
 # Configuración de logs
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
 # Configuración de AWS
-sqs = boto3.client('sqs')
+sqs = aws_clients.client('sqs')
+s3 = aws_clients.client('s3')
 queue_url_email = os.environ['SQS_QUEUE_URL_EMAIL']
 queue_url_sms = os.environ['SQS_QUEUE_URL_SMS']
 queue_url_push = os.environ['SQS_QUEUE_URL_PUSH']
@@ -24,56 +29,165 @@ DB_USER = os.environ['DB_USER']
 DB_PASS = os.environ['DB_PASS']
 DB_NAME = os.environ['DB_NAME']
 
-def get_db_connection():
-    """Establece y devuelve una conexión a la base de datos."""
-    return psycopg2.connect(
-        host=DB_HOST,
-        user=DB_USER,
-        password=DB_PASS,
-        dbname=DB_NAME
-    )
-
-def send_audit_event(transaction_id, path, request_body, transaction_output, request_id):
-    """Envía un mensaje de auditoría a SQS."""
-    audit_message = {
-        "transaction_id": transaction_id,
-        "type": "prepare-notification",
-        "timestamp": datetime.utcnow().strftime("%Y-%m-%d-%H.%M.%S.%f"),
-        "path": path,
-        "request_body": request_body,
-        "transaction_output": transaction_output,
-        "aws_request_id": request_id
-    }
-    sqs.send_message(QueueUrl=queue_url_audit, MessageBody=json.dumps(audit_message))
-    logger.info(f"Evento de auditoría enviado: {audit_message}")
-
-def get_user_data(query, user_id, field_name):
-    """Consulta la vista de Aurora para obtener un dato específico del usuario."""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(query, (user_id,))
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        if result:
-            logger.info(f"Datos obtenidos para user_id {user_id}: {field_name} = {result[0]}")
-            return result[0]
+# Cantidad máxima de user_ids por consulta a UsersTable
+USER_LOOKUP_CHUNK_SIZE = int(os.environ.get('USER_LOOKUP_CHUNK_SIZE', '1000'))
+
+# Cantidad máxima de destinatarios por mensaje encolado a los handlers de canal
+RECIPIENTS_CHUNK_SIZE = int(os.environ.get('RECIPIENTS_CHUNK_SIZE', '500'))
+SQS_MAX_MESSAGE_BYTES = 256 * 1024  # Límite de SQS por mensaje y por send_message_batch
+SQS_SEND_BATCH_SIZE = 10  # Máximo de entradas permitido por send_message_batch
+
+# Los reintentos del cliente con el mismo header Idempotency-Key (y el mismo principal, ruta y
+# body) reutilizan el transaction_id, de modo que los chunks ya enviados se descartan por
+# idempotencia en los handlers de canal
+TRANSACTION_ID_NAMESPACE = uuid.UUID(os.environ.get('TRANSACTION_ID_NAMESPACE', '6f1c2a8e-3b7d-4c59-9e0a-5d2f8b4c7a13'))
+
+# Payloads grandes (cuerpos, listas de destinatarios) viajan por S3 como claim-check
+claim_checks = ClaimCheckStore(s3)
+
+# Conexión compartida entre invocaciones del mismo contenedor
+db = postgres_connection(host=DB_HOST, user=DB_USER, password=DB_PASS, dbname=DB_NAME)
+
+# OTPs emitidos, consumidos luego por la verificación (ver otp_store y otp_cache)
+otp_store = OtpStore(db, "postgres", cache=build_otp_cache())
+
+# Eventos de auditoría con envío por lotes a SQS (ver audit_emitter)
+audit = AuditEmitter(sqs, queue_url_audit, "prepare-notification", payload_store=claim_checks.store)
+
+def get_users_contact_data(user_ids):
+    """Consulta la vista de Aurora por lotes de user_ids sobre una sola conexión.
+
+    Ejecuta una consulta `WHERE user_id = ANY(%s)` por cada lote de USER_LOOKUP_CHUNK_SIZE
+    usuarios y retorna un diccionario {user_id: {email, phone, device_token}}.
+    """
+    users_data = {}
+    queries = 0
+    with db.cursor() as cursor:
+        for i in range(0, len(user_ids), USER_LOOKUP_CHUNK_SIZE):
+            chunk = user_ids[i:i + USER_LOOKUP_CHUNK_SIZE]
+            cursor.execute(
+                "SELECT user_id, email, phone, device_token FROM UsersTable WHERE user_id = ANY(%s);",
+                (chunk,)
+            )
+            queries += 1
+            for user_id, email, phone, device_token in cursor.fetchall():
+                users_data[str(user_id)] = {"email": email, "phone": phone, "device_token": device_token}
+
+    logger.info(f"Datos obtenidos para {len(users_data)} de {len(user_ids)} usuarios en {queries} consultas")
+    return users_data
+
+def resolve_recipients(to_users, field_name):
+    """Resuelve el dato de contacto `field_name` de cada usuario.
+
+    Retorna (destinatarios en el orden de entrada, user_ids sin el dato solicitado).
+    Los user_ids duplicados se resuelven una sola vez.
+    """
+    user_ids = list(dict.fromkeys(to_users))
+    users_data = get_users_contact_data(user_ids) if user_ids else {}
+
+    recipients = []
+    missing_users = []
+    for user_id in user_ids:
+        value = users_data.get(str(user_id), {}).get(field_name)
+        if value:
+            recipients.append({"user_id": user_id, field_name: value})
         else:
-            logger.warning(f"No se encontró {field_name} para user_id {user_id}")
-            return None
-    except Exception as e:
-        logger.error(f"Error obteniendo {field_name} para user_id {user_id}: {str(e)}")
-        return None
-
-def get_user_email(user_id):
-    return get_user_data("SELECT email FROM UsersTable WHERE user_id = %s;", user_id, "email")
-
-def get_user_phone(user_id):
-    return get_user_data("SELECT phone FROM UsersTable WHERE user_id = %s;", user_id, "phone")
-
-def get_user_device_token(user_id):
-    return get_user_data("SELECT device_token FROM UsersTable WHERE user_id = %s;", user_id, "device_token")
+            missing_users.append(user_id)
+
+    if missing_users:
+        logger.warning(f"No se encontró {field_name} para {len(missing_users)} usuarios: {missing_users}")
+    return recipients, missing_users
+
+def split_recipients(message, recipients):
+    """Divide los destinatarios en chunks de hasta RECIPIENTS_CHUNK_SIZE que quepan en un mensaje SQS."""
+    pending = [recipients[i:i + RECIPIENTS_CHUNK_SIZE] for i in range(0, len(recipients), RECIPIENTS_CHUNK_SIZE)]
+    chunks = []
+    while pending:
+        chunk = pending.pop(0)
+        # Se reserva espacio para chunk_index/chunk_count, que se agregan al serializar
+        size = len(json.dumps({**message, "recipients": chunk}).encode("utf-8")) + 64
+        if size > SQS_MAX_MESSAGE_BYTES and len(chunk) > 1:
+            middle = len(chunk) // 2
+            pending[:0] = [chunk[:middle], chunk[middle:]]
+        else:
+            chunks.append(chunk)
+    return chunks
+
+def resolve_transaction_id(event):
+    """transaction_id estable para un reintento (uuid5), o uno nuevo si no viene Idempotency-Key.
+
+    La clave se acota al principal del authorizer, la ruta y el body canónico: la misma
+    clave enviada por otro cliente o reutilizada para otra notificación produce otro
+    transaction_id, en lugar de descartarse como duplicado en los handlers de canal.
+    """
+    headers = {key.lower(): value for key, value in (event.get("headers") or {}).items()}
+    idempotency_key = headers.get("idempotency-key")
+    if not idempotency_key:
+        return str(uuid.uuid4())
+
+    authorizer = (event.get("requestContext") or {}).get("authorizer") or {}
+    principal = str(authorizer.get("principalId") or authorizer.get("userId") or "")
+    raw_body = event.get("body") or ""
+    try:
+        canonical_body = json.dumps(json.loads(raw_body), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        canonical_body = raw_body
+    body_hash = hashlib.sha256(canonical_body.encode("utf-8")).hexdigest()
+    name = "\x00".join([principal, event.get("path") or "", body_hash, idempotency_key])
+    return str(uuid.uuid5(TRANSACTION_ID_NAMESPACE, name))
+
+def enqueue_in_chunks(queue_url, message, recipients):
+    """Encola el mensaje dividido en chunks de destinatarios usando send_message_batch.
+
+    Cada chunk lleva el transaction_id compartido más chunk_index/chunk_count para que los
+    handlers de canal procesen el envío en paralelo y la auditoría pueda reconstruirlo.
+    Retorna (cantidad de chunks, índices de los chunks que SQS rechazó tras un reintento).
+    Un lote rechazado no interrumpe el resto: los chunks ya encolados no se reenvían.
+    """
+    # El contenido común se almacena una sola vez en S3 si es grande y lo comparten todos los chunks
+    message = claim_checks.offload_fields(message, PAYLOAD_FIELDS)
+    chunks = split_recipients(message, recipients)
+    chunk_count = len(chunks)
+    bodies = [
+        json.dumps({**message, "recipients": claim_checks.offload(chunk), "chunk_index": index, "chunk_count": chunk_count})
+        for index, chunk in enumerate(chunks)
+    ]
+
+    # Lotes de hasta 10 mensajes sin superar el tamaño total permitido por send_message_batch
+    batches, batch, batch_size = [], [], 0
+    for index, message_body in enumerate(bodies):
+        size = len(message_body.encode("utf-8"))
+        if batch and (len(batch) == SQS_SEND_BATCH_SIZE or batch_size + size > SQS_MAX_MESSAGE_BYTES):
+            batches.append(batch)
+            batch, batch_size = [], 0
+        batch.append({"Id": str(index), "MessageBody": message_body})
+        batch_size += size
+    if batch:
+        batches.append(batch)
+
+    failed_chunks = []
+    for entries in batches:
+        try:
+            response = sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+            failed_ids = {failure["Id"] for failure in response.get("Failed", [])}
+        except Exception as e:
+            logger.warning(f"Error encolando {len(entries)} chunks, se reintentan: {str(e)}")
+            failed_ids = {entry["Id"] for entry in entries}
+        if failed_ids:
+            # Reintento único de las entradas rechazadas
+            logger.warning(f"Reintentando {len(failed_ids)} chunks rechazados por SQS")
+            retry = [entry for entry in entries if entry["Id"] in failed_ids]
+            try:
+                response = sqs.send_message_batch(QueueUrl=queue_url, Entries=retry)
+                failed_ids = {failure["Id"] for failure in response.get("Failed", [])}
+            except Exception as e:
+                logger.error(f"Error reintentando {len(retry)} chunks: {str(e)}")
+            failed_chunks.extend(sorted(int(entry_id) for entry_id in failed_ids))
+
+    if failed_chunks:
+        logger.error(f"Transacción {message['transaction_id']}: no se pudieron encolar los chunks {failed_chunks} de {chunk_count} en {queue_url}")
+    logger.info(f"Transacción {message['transaction_id']}: {len(recipients)} destinatarios encolados en {chunk_count - len(failed_chunks)} de {chunk_count} chunks")
+    return chunk_count, failed_chunks
 
 def generate_otp():
     """Genera un OTP de 6 dígitos."""
@@ -84,23 +198,18 @@ def generate_otp():
 def store_otp(user_id, otp, transaction_type):
     """Guarda el OTP en la base de datos Aurora."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO otps (otp, user_id, created_at, status, transaction_type) VALUES (%s, %s, NOW(), %s, %s);",
-            (otp, user_id, 'PENDING', transaction_type)
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
+        otp_store.save(user_id, otp, transaction_type)
         logger.info(f"OTP almacenado para user_id {user_id}, transaction_type: {transaction_type}")
     except Exception as e:
         logger.error(f"Error almacenando OTP para user_id {user_id}: {str(e)}")
 
+@audit.flush_on_return
 def lambda_handler(event, context):
     """Maneja la solicitud de API Gateway."""
     request_id = context.aws_request_id if context else "N/A"
-    transaction_id = str(uuid.uuid4())
+    transaction_id = resolve_transaction_id(event)
+    db.start_invocation()
+    claim_checks.start_invocation()
     
     logger.info(f"Lambda ejecutada. Request ID: {request_id}, Transaction ID: {transaction_id}")
     
@@ -117,6 +226,7 @@ def lambda_handler(event, context):
         to_users = body.get("to", [])
 
         processed_recipients = []
+        missing_users = []
         transaction_output = {}
 
         logger.info(f"Procesando petición en {path}. Usuarios: {to_users}")
@@ -126,34 +236,26 @@ def lambda_handler(event, context):
             message_body = body.get("body", "")
             sender = body.get("from", "no-reply@miempresa.com")
 
-            for user_id in to_users:
-                email = get_user_email(user_id)
-                if email:
-                    recipient_info = {"user_id": user_id, "email": email}
-                    processed_recipients.append(recipient_info)
+            processed_recipients, missing_users = resolve_recipients(to_users, "email")
 
-            transaction_output = {"recipients": processed_recipients}
+            transaction_output = {"recipients": processed_recipients, "missing_users": missing_users}
 
             if processed_recipients:
-                message = {"transaction_id": transaction_id, "aws_request_id": request_id, "subject": subject, "body": message_body, "from": sender, "recipients": processed_recipients}
-                sqs.send_message(QueueUrl=queue_url_email, MessageBody=json.dumps(message))
+                message = {"transaction_id": transaction_id, "aws_request_id": request_id, "subject": subject, "body": message_body, "from": sender}
+                transaction_output["chunks"], transaction_output["failed_chunks"] = enqueue_in_chunks(queue_url_email, message, processed_recipients)
                 logger.info(f"Mensaje enviado a SQS Email: {message}")
 
         elif path == "/users/sms":
             message_body = body.get("message", "")
             sender_id = body.get("senderId", "MiEmpresa")
 
-            for user_id in to_users:
-                phone = get_user_phone(user_id)
-                if phone:
-                    recipient_info = {"user_id": user_id, "phone": phone}
-                    processed_recipients.append(recipient_info)
+            processed_recipients, missing_users = resolve_recipients(to_users, "phone")
 
-            transaction_output = {"recipients": processed_recipients}
+            transaction_output = {"recipients": processed_recipients, "missing_users": missing_users}
 
             if processed_recipients:
-                message = {"transaction_id": transaction_id, "aws_request_id": request_id, "message": message_body, "senderId": sender_id, "recipients": processed_recipients}
-                sqs.send_message(QueueUrl=queue_url_sms, MessageBody=json.dumps(message))
+                message = {"transaction_id": transaction_id, "aws_request_id": request_id, "message": message_body, "senderId": sender_id}
+                transaction_output["chunks"], transaction_output["failed_chunks"] = enqueue_in_chunks(queue_url_sms, message, processed_recipients)
                 logger.info(f"Mensaje enviado a SQS SMS: {message}")
 
         elif path == "/users/push":
@@ -162,31 +264,40 @@ def lambda_handler(event, context):
             priority = body.get("priority", "normal")
             data = body.get("data", {})
 
-            for user_id in to_users:
-                device_token = get_user_device_token(user_id)
-                if device_token:
-                    recipient_info = {"user_id": user_id, "device_token": device_token}
-                    processed_recipients.append(recipient_info)
+            processed_recipients, missing_users = resolve_recipients(to_users, "device_token")
 
-            transaction_output = {"recipients": processed_recipients}
+            transaction_output = {"recipients": processed_recipients, "missing_users": missing_users}
 
             if processed_recipients:
-                message = {"transaction_id": transaction_id, "aws_request_id": request_id, "title": title, "body": message_body, "priority": priority, "data": data, "recipients": processed_recipients}
-                sqs.send_message(QueueUrl=queue_url_push, MessageBody=json.dumps(message))
+                message = {"transaction_id": transaction_id, "aws_request_id": request_id, "title": title, "body": message_body, "priority": priority, "data": data}
+                transaction_output["chunks"], transaction_output["failed_chunks"] = enqueue_in_chunks(queue_url_push, message, processed_recipients)
                 logger.info(f"Mensaje enviado a SQS Push: {message}")
 
         else:
             logger.warning(f"Ruta no permitida: {path}")
             transaction_output = {"error": "Ruta no permitida"}
-            send_audit_event(transaction_id, path, body, transaction_output, request_id)
+            audit.emit(transaction_id, path, body, transaction_output, request_id)
             return {"statusCode": 400, "body": json.dumps(transaction_output)}
 
-        send_audit_event(transaction_id, path, body, transaction_output, request_id)
+        audit.emit(transaction_id, path, body, transaction_output, request_id)
 
-        return {"statusCode": 200, "body": json.dumps({"message": "Mensaje enviado a SQS", "recipients": processed_recipients})}
+        failed_chunks = transaction_output.get("failed_chunks", [])
+        if failed_chunks:
+            # Reintentable: con el mismo Idempotency-Key los chunks ya encolados se descartan
+            return {"statusCode": 503, "body": json.dumps({
+                "error": "No se pudieron encolar todos los chunks, reintentar con el mismo Idempotency-Key",
+                "transaction_id": transaction_id, "failed_chunks": failed_chunks, "chunks": transaction_output["chunks"]
+            })}
+        return {"statusCode": 200, "body": json.dumps({
+            "message": "Mensaje enviado a SQS", "transaction_id": transaction_id, "recipients": processed_recipients,
+            "missing_users": missing_users
+        })}
 
     except Exception as e:
         logger.error(f"Error en lambda_handler: {str(e)}", exc_info=True)
         transaction_output = {"error": str(e)}
-        send_audit_event(transaction_id, path, body, transaction_output, request_id)
-        return {"statusCode": 500, "body": json.dumps(transaction_output)}
\ No newline at end of file
+        audit.emit(transaction_id, path, body, transaction_output, request_id)
+        return {"statusCode": 500, "body": json.dumps(transaction_output)}
+
+    finally:
+        logger.info(f"Métricas de base de datos: {db.metrics}")
\ No newline at end of file
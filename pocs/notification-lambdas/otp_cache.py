@@ -0,0 +1,61 @@
+"""Tier en memoria (Redis compatible) para los OTPs pendientes.
+
+Con OTP_CACHE_URL definida, OtpStore guarda cada OTP emitido en Redis (SET con TTL
+igual a OTP_TTL_SECONDS) además de la tabla `otps`, y la verificación lo consume con
+GETDEL: una sola operación atómica en memoria, sin consultar Aurora. La tabla se
+actualiza por clave primaria para conservar el registro de auditoría.
+
+URLs soportadas:
+  - redis://host:6379/0 o rediss://... : ElastiCache/Valkey/Redis >= 6.2 (requiere redis-py).
+  - memory:// : InMemoryOtpCache, solo para pruebas locales (no se comparte entre Lambdas).
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger()
+
+OTP_CACHE_URL = os.environ.get('OTP_CACHE_URL')  # Sin URL, el tier en memoria queda desactivado
+OTP_CACHE_TIMEOUT = float(os.environ.get('OTP_CACHE_TIMEOUT', '0.5'))
+
+
+class InMemoryOtpCache:
+    """Doble local con la semántica de Redis usada por OtpStore: SET con EX, GETDEL y DEL."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            self._entries[name] = (value, self._clock() + ex if ex else None)
+        return True
+
+    def getdel(self, name):
+        with self._lock:
+            entry = self._entries.pop(name, None)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= self._clock():
+            return None
+        return value
+
+    def delete(self, name):
+        with self._lock:
+            return int(self._entries.pop(name, None) is not None)
+
+
+def build_otp_cache(url=OTP_CACHE_URL):
+    """Retorna el cliente del tier en memoria configurado, o None si está desactivado."""
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return InMemoryOtpCache()
+
+    import redis
+
+    logger.info("Tier de OTPs en memoria habilitado")
+    return redis.Redis.from_url(url, socket_timeout=OTP_CACHE_TIMEOUT, socket_connect_timeout=OTP_CACHE_TIMEOUT)
@@ -0,0 +1,182 @@
+"""Almacenamiento y consumo de OTPs en la tabla `otps`.
+
+Lo usan prepare-notifications (save) y la verificación de OTP (consume). El consumo
+es una única sentencia UPDATE condicional: solo marca como usado un OTP pendiente,
+del usuario y tipo de transacción indicados, creado hace menos de OTP_TTL_SECONDS.
+Como la condición sobre `status` se reevalúa bajo el lock de la fila, dos
+verificaciones concurrentes del mismo OTP no pueden tener éxito ambas.
+
+Estados: PENDING (emitido) -> USED (verificado). La expiración se calcula con el
+reloj de la base de datos, el mismo que asigna `created_at`.
+
+Con un tier en memoria (ver otp_cache) los OTPs se emiten como CACHED: se verifican
+con un GETDEL atómico y la tabla solo recibe el UPDATE a USED por clave primaria.
+Un OTP ausente del tier se rechaza sin consultar Aurora (intentos inválidos, vencidos
+o repetidos). Con OTP_CACHE_MISS_FALLBACK=true se busca además en la tabla, solo
+entre los PENDING (emitidos sin tier, p.ej. antes de habilitarlo), de modo que un OTP
+ya consumido en memoria no puede reutilizarse desde Aurora. Si el tier no responde
+se recurre a la tabla para ambos estados.
+
+El UPDATE de un acierto en el tier también exige que la fila siga CACHED o PENDING:
+un OTP consumido desde la tabla mientras el tier no respondía (o cuyo SET venció
+después de guardarse) no vuelve a validarse cuando la clave reaparece en el tier.
+Tras consumir desde la tabla se intenta borrar la clave del tier.
+
+Índices requeridos (INDEX_DDL, ver ensure_indexes): la búsqueda por
+(user_id, transaction_type, otp) con filtro de estado y antigüedad.
+"""
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger()
+
+OTP_TTL_SECONDS = int(os.environ.get('OTP_TTL_SECONDS', '300'))
+OTP_CACHE_PREFIX = os.environ.get('OTP_CACHE_PREFIX', 'otp:')
+OTP_CACHE_MISS_FALLBACK = os.environ.get('OTP_CACHE_MISS_FALLBACK', 'false').lower() == 'true'
+
+OTP_PENDING = 'PENDING'
+OTP_CACHED = 'CACHED'
+OTP_USED = 'USED'
+
+# Límite inferior de created_at para un OTP vigente, según el dialecto SQL
+_EXPIRY_CUTOFF = {
+    "postgres": "NOW() - %s * INTERVAL '1 second'",
+    "mysql": "NOW() - INTERVAL %s SECOND",
+    "sqlite": "datetime('now', '-' || %s || ' seconds')",  # Pruebas y benchmarks locales
+}
+
+INDEX_DDL = {
+    # Índice parcial: solo los OTP pendientes participan de la verificación
+    "postgres": (
+        "CREATE INDEX IF NOT EXISTS idx_otps_pending_lookup "
+        "ON otps (user_id, transaction_type, otp, created_at) WHERE status IN ('PENDING', 'CACHED');"
+    ),
+    "mysql": (
+        "CREATE INDEX idx_otps_pending_lookup "
+        "ON otps (user_id, transaction_type, otp, status, created_at);"
+    ),
+    "sqlite": (
+        "CREATE INDEX IF NOT EXISTS idx_otps_pending_lookup "
+        "ON otps (user_id, transaction_type, otp, created_at) WHERE status IN ('PENDING', 'CACHED');"
+    ),
+}
+
+# MySQL no admite CREATE INDEX IF NOT EXISTS: se consulta el catálogo antes de crearlo
+INDEX_EXISTS_SQL = {
+    "mysql": (
+        "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() "
+        "AND table_name = 'otps' AND index_name = 'idx_otps_pending_lookup' LIMIT 1;"
+    ),
+}
+
+_INSERT_SQL = "INSERT INTO otps (otp, user_id, created_at, status, transaction_type) VALUES (%s, %s, NOW(), %s, %s)"
+
+
+class OtpStore:
+    """Guarda y consume OTPs sobre una DatabaseConnection (ver db_connection) y un tier en memoria opcional."""
+
+    def __init__(self, db, dialect, ttl=OTP_TTL_SECONDS, cache=None, miss_fallback=OTP_CACHE_MISS_FALLBACK):
+        if dialect not in _EXPIRY_CUTOFF:
+            raise ValueError(f"Dialecto SQL no soportado: {dialect}")
+        self.db = db
+        self.dialect = dialect
+        self.ttl = ttl
+        self.cache = cache
+        self.miss_fallback = miss_fallback
+        self._consume_by_id_sql = (
+            f"UPDATE otps SET status = '{OTP_USED}' "
+            f"WHERE id = %s AND status IN ('{OTP_CACHED}', '{OTP_PENDING}');"
+        )
+        self._consume_sql = {
+            statuses: (
+                f"UPDATE otps SET status = '{OTP_USED}' "
+                f"WHERE user_id = %s AND transaction_type = %s AND otp = %s "
+                f"AND status IN ({', '.join(repr(status) for status in statuses)}) "
+                f"AND created_at >= {_EXPIRY_CUTOFF[dialect]};"
+            )
+            for statuses in ((OTP_PENDING,), (OTP_PENDING, OTP_CACHED))
+        }
+
+    def _cache_key(self, user_id, otp, transaction_type):
+        # El OTP no aparece en claro en el keyspace del tier
+        return OTP_CACHE_PREFIX + hashlib.sha256(f"{transaction_type}\x00{user_id}\x00{otp}".encode()).hexdigest()
+
+    def _discard_cached(self, cache_key):
+        """Borra la clave del tier si responde; si no, el UPDATE condicional la invalida igual."""
+        try:
+            self.cache.delete(cache_key)
+        except Exception as e:
+            logger.warning(f"No se pudo borrar el OTP del tier en memoria: {str(e)}")
+
+    def save(self, user_id, otp, transaction_type):
+        """Registra un OTP pendiente para el usuario y tipo de transacción."""
+        if self.cache is None:
+            with self.db.cursor() as cursor:
+                cursor.execute(_INSERT_SQL + ";", (otp, user_id, OTP_PENDING, transaction_type))
+            return
+
+        with self.db.cursor() as cursor:
+            if self.dialect == "postgres":
+                cursor.execute(_INSERT_SQL + " RETURNING id;", (otp, user_id, OTP_CACHED, transaction_type))
+                otp_id = cursor.fetchone()[0]
+            else:
+                cursor.execute(_INSERT_SQL + ";", (otp, user_id, OTP_CACHED, transaction_type))
+                otp_id = cursor.lastrowid
+
+        cache_key = self._cache_key(user_id, otp, transaction_type)
+        try:
+            self.cache.set(cache_key, otp_id, ex=self.ttl)
+        except Exception as e:
+            # Sin tier disponible el OTP queda verificable desde la tabla. El SET pudo haberse
+            # aplicado igual (timeout): se intenta borrar la clave para no dejar dos caminos
+            logger.warning(f"No se pudo guardar el OTP en el tier en memoria, se usará Aurora: {str(e)}")
+            with self.db.cursor() as cursor:
+                cursor.execute(f"UPDATE otps SET status = '{OTP_PENDING}' WHERE id = %s;", (otp_id,))
+            self._discard_cached(cache_key)
+
+    def consume(self, user_id, otp, transaction_type):
+        """Marca el OTP como usado si está pendiente y vigente. Retorna True si se consumió."""
+        statuses = (OTP_PENDING,)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._cache_key(user_id, otp, transaction_type)
+            try:
+                otp_id = self.cache.getdel(cache_key)
+            except Exception as e:
+                logger.warning(f"Tier de OTPs en memoria no disponible, se verifica en Aurora: {str(e)}")
+                otp_id = None
+                statuses = (OTP_PENDING, OTP_CACHED)
+
+            if otp_id is not None:
+                # Write-through para auditoría: actualización por clave primaria, solo si la
+                # fila no fue consumida desde la tabla mientras el tier no respondía
+                with self.db.cursor() as cursor:
+                    cursor.execute(self._consume_by_id_sql, (int(otp_id),))
+                    consumed = cursor.rowcount > 0
+                if consumed:
+                    logger.info(f"OTP consumido desde el tier en memoria para user_id {user_id}, transaction_type: {transaction_type}")
+                else:
+                    logger.warning(f"OTP del tier en memoria ya usado en Aurora para user_id {user_id}, transaction_type: {transaction_type}")
+                return consumed
+            if statuses == (OTP_PENDING,) and not self.miss_fallback:
+                return False
+
+        with self.db.cursor() as cursor:
+            cursor.execute(self._consume_sql[statuses], (user_id, transaction_type, otp, self.ttl))
+            consumed = cursor.rowcount > 0
+        if consumed:
+            logger.info(f"OTP consumido para user_id {user_id}, transaction_type: {transaction_type}")
+            if cache_key is not None:
+                self._discard_cached(cache_key)
+        return consumed
+
+    def ensure_indexes(self):
+        """Crea el índice del que depende consume (despliegues y entornos locales). Es idempotente."""
+        with self.db.cursor() as cursor:
+            exists_sql = INDEX_EXISTS_SQL.get(self.dialect)
+            if exists_sql:
+                cursor.execute(exists_sql)
+                if cursor.fetchone():
+                    return
+            cursor.execute(INDEX_DDL[self.dialect])
@@ -0,0 +1,124 @@
+"""Bucle de recepción compartido por los handlers de email, SMS y push.
+
+En modo "drain" (SQS_RECEIVE_MODE, por defecto) el handler recibe y procesa lotes de
+hasta 10 mensajes hasta que la cola queda vacía o el tiempo restante de la
+invocación (context.get_remaining_time_in_millis) no alcanza para otro lote con
+margen: long poll + duración del lote más lento visto + SQS_DRAIN_SAFETY_MARGIN_MS.
+Así un backlog se vacía con pocas invocaciones en lugar de una por cada 10 mensajes.
+
+  - El primer receive usa SQS_WAIT_TIME_SECONDS de long poll; los siguientes,
+    SQS_DRAIN_WAIT_TIME_SECONDS (la cola ya tenía mensajes).
+  - Con SQS_VISIBILITY_EXTENSION_SECONDS > 0, mientras un lote se procesa se extiende
+    su visibility timeout cada la mitad de ese valor, para que un lote lento no sea
+    reentregado a otro consumidor.
+  - Un receive vacío termina el bucle sin invocar process_batch (sin auditoría de
+    polls vacíos).
+
+SQS_RECEIVE_MODE=single mantiene un único receive por invocación.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger()
+
+SQS_RECEIVE_MODE = os.environ.get('SQS_RECEIVE_MODE', 'drain')
+SQS_WAIT_TIME_SECONDS = int(os.environ.get('SQS_WAIT_TIME_SECONDS', '5'))
+SQS_DRAIN_WAIT_TIME_SECONDS = int(os.environ.get('SQS_DRAIN_WAIT_TIME_SECONDS', '1'))
+SQS_DRAIN_SAFETY_MARGIN_MS = int(os.environ.get('SQS_DRAIN_SAFETY_MARGIN_MS', '10000'))
+SQS_VISIBILITY_EXTENSION_SECONDS = int(os.environ.get('SQS_VISIBILITY_EXTENSION_SECONDS', '0'))
+SQS_RECEIVE_BATCH_SIZE = 10  # Máximo de mensajes permitido por receive_message
+
+
+class VisibilityHeartbeat:
+    """Extiende el visibility timeout de un lote mientras se procesa (context manager)."""
+
+    def __init__(self, sqs_client, queue_url, messages, extension_seconds):
+        self.sqs = sqs_client
+        self.queue_url = queue_url
+        self.messages = messages
+        self.extension_seconds = extension_seconds
+        self.extensions = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.extension_seconds > 0:
+            self._thread = threading.Thread(target=self._run, name="sqs-visibility", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.extension_seconds / 2):
+            entries = [
+                {"Id": str(i), "ReceiptHandle": message["ReceiptHandle"], "VisibilityTimeout": self.extension_seconds}
+                for i, message in enumerate(self.messages)
+            ]
+            try:
+                # Los mensajes ya eliminados fallan con ReceiptHandleIsInvalid, lo que es esperado
+                self.sqs.change_message_visibility_batch(QueueUrl=self.queue_url, Entries=entries)
+                self.extensions += 1
+            except Exception as e:
+                logger.warning(f"No se pudo extender el visibility timeout del lote: {str(e)}")
+
+
+def _remaining_ms(context):
+    return context.get_remaining_time_in_millis() if context else float("inf")
+
+
+def drain(sqs_client, queue_url, context, process_batch, mode=None, wait_time_seconds=None,
+          drain_wait_time_seconds=None, safety_margin_ms=None, visibility_extension_seconds=None):
+    """Recibe lotes de queue_url y los pasa a process_batch(response) hasta vaciar la cola o agotar el tiempo.
+
+    Los parámetros omitidos toman la configuración del módulo al momento de la llamada.
+    Retorna {"batches", "messages", "stopped": "empty" | "time" | "single"}.
+    """
+    mode = mode or SQS_RECEIVE_MODE
+    wait_time_seconds = SQS_WAIT_TIME_SECONDS if wait_time_seconds is None else wait_time_seconds
+    drain_wait_time_seconds = SQS_DRAIN_WAIT_TIME_SECONDS if drain_wait_time_seconds is None else drain_wait_time_seconds
+    safety_margin_ms = SQS_DRAIN_SAFETY_MARGIN_MS if safety_margin_ms is None else safety_margin_ms
+    if visibility_extension_seconds is None:
+        visibility_extension_seconds = SQS_VISIBILITY_EXTENSION_SECONDS
+
+    summary = {"batches": 0, "messages": 0, "stopped": "empty"}
+    slowest_batch_ms = 0.0
+    wait_time = wait_time_seconds
+
+    while True:
+        budget_ms = _remaining_ms(context) - safety_margin_ms - slowest_batch_ms
+        if summary["batches"] and budget_ms <= 0:
+            summary["stopped"] = "time"
+            break
+        if context:
+            # El long poll no puede consumir el tiempo reservado para procesar el lote
+            wait_time = max(0, min(wait_time, int(budget_ms // 1000)))
+
+        response = sqs_client.receive_message(
+            QueueUrl=queue_url,
+            MaxNumberOfMessages=SQS_RECEIVE_BATCH_SIZE,
+            WaitTimeSeconds=wait_time
+        )
+        messages = response.get("Messages", [])
+        if not messages:
+            break
+
+        start = time.perf_counter()
+        with VisibilityHeartbeat(sqs_client, queue_url, messages, visibility_extension_seconds):
+            process_batch(response)
+        slowest_batch_ms = max(slowest_batch_ms, (time.perf_counter() - start) * 1000)
+
+        summary["batches"] += 1
+        summary["messages"] += len(messages)
+        if mode == "single":
+            summary["stopped"] = "single"
+            break
+        wait_time = drain_wait_time_seconds
+
+    logger.info(f"Recepción terminada ({summary['stopped']}): {summary['messages']} mensajes en {summary['batches']} lotes")
+    return summary
@@ -0,0 +1,185 @@
+"""Etapa de despacho compartida por los handlers de email, SMS y push.
+
+Publica en SNS los mensajes procesados de un lote recibido de SQS en paralelo,
+con un pool de threads acotado (o agrupados en PublishBatch de hasta 10 entradas
+si SNS_PUBLISH_BATCH_ENABLED=true), y confirma (delete_message_batch) solo los
+mensajes cuya publicación fue exitosa. Los fallidos vuelven a la cola al vencer
+su visibility timeout.
+
+Cada entrada del lote es un diccionario con:
+    id              identificador único en el lote (MessageId de SQS)
+    receipt_handle  receipt handle del mensaje SQS
+    publish         kwargs de sns.publish, o None si el mensaje solo debe descartarse
+    idempotency_key (opcional) clave estable entre reentregas, ver idempotency
+
+Con un `idempotency` (ver idempotency.Idempotency), las entradas cuya clave ya fue
+completada no se publican: se confirman como "duplicate". Las que otro contenedor
+reclamó y aún no completó tampoco se publican, pero quedan "failed" (sin confirmar)
+para que SQS las reentregue y puedan reclamarse al vencer el lease.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from idempotency import CLAIMED, COMPLETED
+
+logger = logging.getLogger()
+
+SNS_PUBLISH_CONCURRENCY = int(os.environ.get('SNS_PUBLISH_CONCURRENCY', '10'))
+SNS_PUBLISH_BATCH_ENABLED = os.environ.get('SNS_PUBLISH_BATCH_ENABLED', 'false').lower() == 'true'
+SNS_PUBLISH_BATCH_SIZE = 10  # Máximo de entradas permitido por publish_batch
+SNS_PUBLISH_BATCH_MAX_BYTES = 256 * 1024  # Tamaño máximo del payload agregado de publish_batch
+SQS_DELETE_BATCH_SIZE = 10  # Máximo de entradas permitido por delete_message_batch
+
+PUBLISHED = "published"
+DISCARDED = "discarded"
+DUPLICATE = "duplicate"
+FAILED = "failed"
+
+# Pool reutilizado entre invocaciones del mismo contenedor
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SNS_PUBLISH_CONCURRENCY, thread_name_prefix="sns-publish")
+    return _executor
+
+
+def _publish(sns_client, entry):
+    try:
+        response = sns_client.publish(**entry["publish"])
+        return {"status": PUBLISHED, "sns_message_id": response.get("MessageId")}
+    except Exception as e:
+        logger.error(f"Error publicando el mensaje {entry['id']} en SNS: {str(e)}")
+        return {"status": FAILED, "error": str(e)}
+
+
+def publish_concurrently(sns_client, entries):
+    """Publica las entradas en paralelo. Retorna {id: resultado}."""
+    futures = {entry["id"]: _get_executor().submit(_publish, sns_client, entry) for entry in entries}
+    return {entry_id: future.result() for entry_id, future in futures.items()}
+
+
+def _publish_batch(sns_client, topic_arn, batch):
+    request_entries = [
+        {"Id": entry["id"], **{key: value for key, value in entry["publish"].items() if key != "TopicArn"}}
+        for entry in batch
+    ]
+    try:
+        response = sns_client.publish_batch(TopicArn=topic_arn, PublishBatchRequestEntries=request_entries)
+    except Exception as e:
+        logger.error(f"Error publicando lote de {len(batch)} mensajes en SNS: {str(e)}")
+        return {entry["id"]: {"status": FAILED, "error": str(e)} for entry in batch}
+
+    results = {}
+    for success in response.get("Successful", []):
+        results[success["Id"]] = {"status": PUBLISHED, "sns_message_id": success.get("MessageId")}
+    for failure in response.get("Failed", []):
+        logger.error(f"SNS rechazó el mensaje {failure['Id']}: {failure.get('Code')} {failure.get('Message')}")
+        results[failure["Id"]] = {"status": FAILED, "error": f"{failure.get('Code')}: {failure.get('Message')}"}
+    for entry in batch:
+        results.setdefault(entry["id"], {"status": FAILED, "error": "Sin respuesta de publish_batch"})
+    return results
+
+
+def _entry_size(entry):
+    publish = entry["publish"]
+    return len(publish["Message"].encode("utf-8")) + len(publish.get("Subject", "").encode("utf-8"))
+
+
+def _publish_batches(entries):
+    """Agrupa las entradas por topic en lotes que respetan el límite de cantidad y tamaño de publish_batch."""
+    by_topic = {}
+    for entry in entries:
+        by_topic.setdefault(entry["publish"]["TopicArn"], []).append(entry)
+
+    for topic_arn, topic_entries in by_topic.items():
+        batch, batch_size = [], 0
+        for entry in topic_entries:
+            size = _entry_size(entry)
+            if batch and (len(batch) == SNS_PUBLISH_BATCH_SIZE or batch_size + size > SNS_PUBLISH_BATCH_MAX_BYTES):
+                yield topic_arn, batch
+                batch, batch_size = [], 0
+            batch.append(entry)
+            batch_size += size
+        if batch:
+            yield topic_arn, batch
+
+
+def publish_in_batches(sns_client, entries):
+    """Publica las entradas con publish_batch (lotes en paralelo). Retorna {id: resultado}."""
+    futures = [
+        _get_executor().submit(_publish_batch, sns_client, topic_arn, batch)
+        for topic_arn, batch in _publish_batches(entries)
+    ]
+    results = {}
+    for future in futures:
+        results.update(future.result())
+    return results
+
+
+def delete_messages(sqs_client, queue_url, entries):
+    """Elimina de la cola las entradas indicadas en lotes de 10. Retorna los ids que no se pudieron eliminar."""
+    failed_ids = []
+    for i in range(0, len(entries), SQS_DELETE_BATCH_SIZE):
+        batch = [{"Id": entry["id"], "ReceiptHandle": entry["receipt_handle"]} for entry in entries[i:i + SQS_DELETE_BATCH_SIZE]]
+        try:
+            response = sqs_client.delete_message_batch(QueueUrl=queue_url, Entries=batch)
+            failed_ids.extend(failure["Id"] for failure in response.get("Failed", []))
+        except Exception as e:
+            logger.error(f"Error eliminando mensajes de la cola SQS: {str(e)}")
+            failed_ids.extend(item["Id"] for item in batch)
+    return failed_ids
+
+
+def dispatch_batch(sns_client, sqs_client, queue_url, entries, batch_mode=None, idempotency=None):
+    """Publica el lote en SNS y elimina de SQS los mensajes publicados, descartados o duplicados.
+
+    `batch_mode` fuerza (o desactiva) el uso de publish_batch; por defecto se usa
+    SNS_PUBLISH_BATCH_ENABLED. Retorna {id: {"status": published|discarded|duplicate|failed, ...}}
+    para incluir en la auditoría.
+    """
+    if batch_mode is None:
+        batch_mode = SNS_PUBLISH_BATCH_ENABLED
+    publish = publish_in_batches if batch_mode else publish_concurrently
+
+    results = {}
+    to_publish = []
+    for entry in entries:
+        if not entry.get("publish"):
+            continue
+        claim = idempotency.claim(entry["idempotency_key"]) if idempotency and entry.get("idempotency_key") else CLAIMED
+        if claim == COMPLETED:
+            logger.info(f"Mensaje {entry['id']} ya procesado ({entry['idempotency_key']}), no se vuelve a publicar")
+            results[entry["id"]] = {"status": DUPLICATE}
+        elif claim != CLAIMED:
+            logger.warning(f"Mensaje {entry['id']} en curso en otro contenedor ({entry['idempotency_key']}), se reintentará")
+            results[entry["id"]] = {"status": FAILED, "error": "En curso en otro contenedor"}
+        else:
+            to_publish.append(entry)
+
+    if to_publish:
+        results.update(publish(sns_client, to_publish))
+    for entry in entries:
+        results.setdefault(entry["id"], {"status": DISCARDED})
+
+    if idempotency:
+        for entry in to_publish:
+            if not entry.get("idempotency_key"):
+                continue
+            if results[entry["id"]]["status"] == PUBLISHED:
+                idempotency.complete(entry["idempotency_key"])
+            else:
+                idempotency.release(entry["idempotency_key"])
+
+    to_delete = [entry for entry in entries if results[entry["id"]]["status"] != FAILED]
+    for entry_id in delete_messages(sqs_client, queue_url, to_delete):
+        logger.warning(f"El mensaje {entry_id} no pudo eliminarse de SQS y será reentregado")
+        results[entry_id]["deleted"] = False
+
+    statuses = [result["status"] for result in results.values()]
+    logger.info(f"Lote despachado: {statuses.count(PUBLISHED)} publicados, {statuses.count(FAILED)} fallidos, "
+                f"{statuses.count(DUPLICATE)} duplicados, {statuses.count(DISCARDED)} descartados")
+    return results
@@ -0,0 +1,112 @@
+"""Cache de plantillas almacenadas en S3 con revalidación por ETag.
+
+Nivel 1: memoria del proceso, vive mientras el contenedor Lambda esté caliente.
+Nivel 2: archivos en /tmp, sobreviven a una nueva importación del handler.
+
+Una plantilla se sirve desde la cache sin consultar S3 durante TEMPLATE_CACHE_TTL
+segundos. Pasado ese tiempo se revalida con un GET condicional (IfNoneMatch); si
+S3 responde 304 Not Modified no se vuelve a descargar el contenido.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger()
+
+TEMPLATE_CACHE_TTL = float(os.environ.get('TEMPLATE_CACHE_TTL', '300'))
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', '/tmp/coto-templates')
+
+
+def _is_not_modified(error):
+    """Indica si la excepción de boto3 corresponde a un 304 Not Modified."""
+    response = getattr(error, "response", None) or {}
+    status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    code = response.get("Error", {}).get("Code")
+    return status == 304 or code in ("304", "NotModified")
+
+
+class TemplateCache:
+    """Cache de plantillas de un bucket S3, indexada por nombre (key) de plantilla."""
+
+    def __init__(self, s3_client, bucket, ttl=TEMPLATE_CACHE_TTL, cache_dir=TEMPLATE_CACHE_DIR):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self._entries = {}
+
+    def get(self, name):
+        """Retorna el contenido de la plantilla `name`, descargándolo de S3 solo si cambió."""
+        entry = self._entries.get(name) or self._read_disk(name)
+        now = time.time()
+
+        if entry and now - entry["checked_at"] < self.ttl:
+            self._entries[name] = entry
+            return entry["body"]
+
+        request = {"Bucket": self.bucket, "Key": name}
+        if entry:
+            request["IfNoneMatch"] = entry["etag"]
+
+        try:
+            logger.info(f"Consultando plantilla '{name}' en S3 bucket '{self.bucket}'")
+            response = self.s3.get_object(**request)
+        except Exception as e:
+            if entry and _is_not_modified(e):
+                logger.info(f"Plantilla '{name}' sin cambios (304), se mantiene la copia en cache")
+                entry["checked_at"] = now
+                self._store(name, entry)
+                return entry["body"]
+            if entry:
+                # S3 no disponible: se sirve la última versión conocida
+                logger.warning(f"No se pudo revalidar la plantilla '{name}', usando copia en cache: {str(e)}")
+                return entry["body"]
+            raise
+
+        entry = {
+            "body": response["Body"].read().decode("utf-8"),
+            "etag": response.get("ETag"),
+            "checked_at": now,
+        }
+        self._store(name, entry)
+        logger.info(f"Plantilla '{name}' descargada y almacenada en cache (ETag {entry['etag']})")
+        return entry["body"]
+
+    def invalidate(self, name=None):
+        """Descarta una plantilla (o todas) de ambos niveles de cache."""
+        if name is None:
+            self._entries.clear()
+            paths = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir)] if os.path.isdir(self.cache_dir) else []
+        else:
+            self._entries.pop(name, None)
+            paths = [self._disk_path(name)]
+
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _store(self, name, entry):
+        self._entries[name] = entry
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._disk_path(name)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.warning(f"No se pudo escribir la plantilla '{name}' en {self.cache_dir}: {str(e)}")
+
+    def _read_disk(self, name):
+        try:
+            with open(self._disk_path(name), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _disk_path(self, name):
+        key = hashlib.sha256(f"{self.bucket}/{name}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
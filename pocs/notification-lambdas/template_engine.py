@@ -0,0 +1,64 @@
+"""Motor de plantillas precompiladas con placeholders %{nombre}%.
+
+La plantilla se analiza una sola vez y se divide en segmentos literales y
+placeholders. Renderizar un mensaje consiste en unir esos segmentos con los
+valores de las variables, sin volver a recorrer ni copiar la plantilla por cada
+placeholder. Los placeholders sin valor se conservan tal cual en la salida.
+"""
+import re
+from functools import lru_cache
+
+PLACEHOLDER_PATTERN = re.compile(r"%\{([A-Za-z0-9_.-]+)\}%")
+
+
+class CompiledTemplate:
+    """Plantilla analizada en segmentos: literals[i], names[i], literals[i + 1], ..."""
+
+    __slots__ = ("literals", "names")
+
+    def __init__(self, literals, names):
+        self.literals = literals
+        self.names = names
+
+    @classmethod
+    def parse(cls, source):
+        parts = PLACEHOLDER_PATTERN.split(source)
+        return cls(tuple(parts[0::2]), tuple(parts[1::2]))
+
+    @property
+    def placeholders(self):
+        """Nombres de los placeholders presentes, sin repetir y en orden de aparición."""
+        return tuple(dict.fromkeys(self.names))
+
+    def render(self, variables):
+        """Renderiza la plantilla con el diccionario `variables`."""
+        literals = self.literals
+        pieces = [literals[0]]
+        for i, name in enumerate(self.names):
+            value = variables.get(name)
+            pieces.append(f"%{{{name}}}%" if value is None else str(value))
+            pieces.append(literals[i + 1])
+        return "".join(pieces)
+
+    def bind(self, variables):
+        """Retorna una nueva plantilla con los placeholders de `variables` ya resueltos.
+
+        Permite renderizar una vez las variables comunes de un mensaje y luego solo
+        las variables propias de cada destinatario.
+        """
+        literals = [self.literals[0]]
+        names = []
+        for i, name in enumerate(self.names):
+            value = variables.get(name)
+            if value is None:
+                names.append(name)
+                literals.append(self.literals[i + 1])
+            else:
+                literals[-1] = f"{literals[-1]}{value}{self.literals[i + 1]}"
+        return CompiledTemplate(tuple(literals), tuple(names))
+
+
+@lru_cache(maxsize=32)
+def compile_template(source):
+    """Analiza la plantilla `source` (cacheando el resultado por contenido)."""
+    return CompiledTemplate.parse(source)
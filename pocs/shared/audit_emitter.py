@@ -0,0 +1,229 @@
+"""Emisor de eventos de auditoría compartido por todas las Lambdas de COTO.
+
+Se despliega como Lambda Layer (módulo de nivel superior `audit_emitter`) y
+reemplaza las copias de send_audit_event de cada handler.
+
+Los eventos se acumulan en memoria y se envían a la cola de auditoría con
+send_message_batch (hasta 10 mensajes / 256 KB por llamada):
+  - en un thread de fondo cada AUDIT_FLUSH_INTERVAL segundos (si es > 0),
+  - cuando el buffer alcanza AUDIT_BUFFER_SIZE eventos (backpressure: quien emite
+    paga el envío), y
+  - siempre antes de que el handler retorne (decorador flush_on_return), ya que
+    Lambda congela los threads de fondo al terminar la invocación.
+
+Si el buffer sigue lleno porque SQS no acepta los envíos, los eventos nuevos se
+descartan y se contabilizan en `dropped`.
+
+Los payloads se registran según AUDIT_PAYLOAD_MODE:
+  - "compact" (por defecto): proyección de audit_projection (ids, conteos, hashes y
+    vistas previas truncadas).
+  - "full": además de la proyección, los payloads recortados se guardan completos en
+    el blob store (`payload_store`, p.ej. ClaimCheckStore.store) y el evento lleva la
+    referencia en `full_payloads`.
+  - "raw": el payload tal cual (comportamiento anterior).
+emit acepta `summarize_request` (p.ej. audit_projection.summarize_sqs_messages): en los
+modos "compact" y "full" el request_body se reemplaza por ese resumen antes de
+proyectarlo; en "raw" se registra el request_body original.
+Ningún evento supera AUDIT_MAX_EVENT_BYTES (por debajo del límite de 256 KB de SQS y
+de 400 KB por ítem de DynamoDB): si ocurre, los payloads se reemplazan por su resumen
+(tamaño y hash) y, si hay blob store, por la referencia a su copia completa.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+
+from audit_projection import project, summarize
+
+logger = logging.getLogger()
+
+AUDIT_BUFFER_SIZE = int(os.environ.get('AUDIT_BUFFER_SIZE', '100'))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', '0'))
+SQS_SEND_BATCH_SIZE = 10  # Máximo de entradas permitido por send_message_batch
+SQS_MAX_BATCH_BYTES = 256 * 1024  # Tamaño máximo del payload agregado de send_message_batch
+AUDIT_PAYLOAD_MODE = os.environ.get('AUDIT_PAYLOAD_MODE', 'compact')
+AUDIT_MAX_EVENT_BYTES = int(os.environ.get('AUDIT_MAX_EVENT_BYTES', str(200 * 1024)))
+PAYLOAD_FIELDS = ("request_body", "transaction_output")
+
+
+class AuditEmitter:
+    """Buffer de eventos de auditoría con envío por lotes a SQS."""
+
+    def __init__(self, sqs_client, queue_url, event_type, payload_store=None,
+                 max_buffer=AUDIT_BUFFER_SIZE, flush_interval=AUDIT_FLUSH_INTERVAL,
+                 payload_mode=AUDIT_PAYLOAD_MODE, max_event_bytes=AUDIT_MAX_EVENT_BYTES):
+        self.sqs = sqs_client
+        self.queue_url = queue_url
+        self.event_type = event_type
+        self.payload_store = payload_store
+        self.payload_mode = payload_mode
+        self.max_event_bytes = max_event_bytes
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self.sent = 0
+        self.dropped = 0
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._worker = None
+
+    def emit(self, transaction_id, path, request_body, transaction_output, request_id=None, summarize_request=None):
+        """Encola un evento de auditoría. Nunca lanza excepciones al handler.
+
+        `summarize_request` resume el request_body en los modos distintos de "raw".
+        """
+        try:
+            audit_message = {
+                "transaction_id": transaction_id,
+                "type": self.event_type,
+                "timestamp": datetime.utcnow().strftime("%Y-%m-%d-%H.%M.%S.%f"),
+                "path": path,
+            }
+            if request_id is not None:
+                audit_message["aws_request_id"] = request_id
+            payloads = {"request_body": request_body, "transaction_output": transaction_output}
+            message_body = self._serialize(audit_message, payloads, {"request_body": summarize_request})
+            if message_body is None:
+                self.dropped += 1
+                logger.error(f"Evento de auditoría {transaction_id} descartado: supera {self.max_event_bytes} bytes aun resumido")
+                return
+        except Exception as e:
+            logger.error(f"Error al construir evento de auditoría: {str(e)}", exc_info=True)
+            self.dropped += 1
+            return
+
+        if len(self._buffer) >= self.max_buffer:
+            # Backpressure: el buffer está lleno, se envía antes de aceptar más eventos
+            self.flush()
+
+        with self._buffer_lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                logger.warning(f"Buffer de auditoría lleno, evento {transaction_id} descartado (total descartados: {self.dropped})")
+                return
+            self._buffer.append(message_body)
+
+        self._ensure_worker()
+
+    def flush(self):
+        """Envía todos los eventos pendientes con send_message_batch."""
+        with self._send_lock:
+            with self._buffer_lock:
+                pending, self._buffer = self._buffer, []
+            if not pending:
+                return
+
+            failed = []
+            for batch in self._batches(pending):
+                failed.extend(self._send_batch(batch))
+
+            remaining = []
+            if failed:
+                # Reintento único; si vuelve a fallar el evento se vuelve a encolar
+                for batch in self._batches(failed):
+                    remaining.extend(self._send_batch(batch))
+                with self._buffer_lock:
+                    self._buffer[:0] = remaining
+
+            logger.info(f"Eventos de auditoría enviados: {len(pending) - len(remaining)} (pendientes {len(remaining)}, descartados {self.dropped})")
+
+    def flush_on_return(self, handler):
+        """Decorador de lambda_handler que garantiza el envío de la auditoría antes de retornar."""
+        @wraps(handler)
+        def wrapper(event, context):
+            try:
+                return handler(event, context)
+            finally:
+                self.flush()
+                if self._buffer:
+                    with self._buffer_lock:
+                        self.dropped += len(self._buffer)
+                        logger.error(f"{len(self._buffer)} eventos de auditoría no pudieron enviarse y se descartan")
+                        self._buffer = []
+        return wrapper
+
+    def _serialize(self, audit_message, payloads, summarizers=None):
+        """Serializa el evento con los payloads proyectados, respetando max_event_bytes."""
+        full_payloads = {}
+        summarizers = summarizers or {}
+        for field in PAYLOAD_FIELDS:
+            payload = payloads[field]
+            if self.payload_mode == "raw":
+                audit_message[field] = payload
+                continue
+            summarizer = summarizers.get(field)
+            audit_message[field] = project(summarizer(payload) if summarizer else payload)
+            if self.payload_mode == "full" and audit_message[field] is not payload:
+                self._store_full(field, payload, full_payloads)
+        if full_payloads:
+            audit_message["full_payloads"] = full_payloads
+
+        message_body = json.dumps(audit_message, default=str)
+        if not self.max_event_bytes or len(message_body.encode("utf-8")) <= self.max_event_bytes:
+            return message_body
+
+        # Guarda de tamaño: solo quedan resumen y, si es posible, la copia completa en el blob store
+        for field in PAYLOAD_FIELDS:
+            audit_message[field] = summarize(payloads[field])
+            if field not in full_payloads:
+                self._store_full(field, payloads[field], full_payloads)
+        if full_payloads:
+            audit_message["full_payloads"] = full_payloads
+        message_body = json.dumps(audit_message, default=str)
+        if len(message_body.encode("utf-8")) <= self.max_event_bytes:
+            logger.warning(f"Evento de auditoría {audit_message['transaction_id']} resumido por tamaño")
+            return message_body
+        return None
+
+    def _store_full(self, field, payload, full_payloads):
+        """Guarda el payload completo en el blob store (si hay uno) y registra su referencia."""
+        if not self.payload_store:
+            return
+        try:
+            reference = self.payload_store(payload)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el payload completo de auditoría ({field}): {str(e)}")
+            return
+        if reference is not None:
+            full_payloads[field] = reference
+
+    def _batches(self, messages):
+        batch, batch_size = [], 0
+        for message_body in messages:
+            size = len(message_body.encode("utf-8"))
+            if batch and (len(batch) == SQS_SEND_BATCH_SIZE or batch_size + size > SQS_MAX_BATCH_BYTES):
+                yield batch
+                batch, batch_size = [], 0
+            batch.append(message_body)
+            batch_size += size
+        if batch:
+            yield batch
+
+    def _send_batch(self, batch):
+        """Envía un lote y retorna los mensajes que no pudieron enviarse."""
+        entries = [{"Id": str(i), "MessageBody": message_body} for i, message_body in enumerate(batch)]
+        try:
+            response = self.sqs.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+        except Exception as e:
+            logger.error(f"Error al enviar eventos de auditoría: {str(e)}", exc_info=True)
+            return batch
+        failed_ids = {failure["Id"] for failure in response.get("Failed", [])}
+        self.sent += len(batch) - len(failed_ids)
+        return [entry["MessageBody"] for entry in entries if entry["Id"] in failed_ids]
+
+    def _ensure_worker(self):
+        if self.flush_interval <= 0 or (self._worker and self._worker.is_alive()):
+            return
+        self._worker = threading.Thread(target=self._run_worker, name="audit-emitter", daemon=True)
+        self._worker.start()
+
+    def _run_worker(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error en el envío de auditoría en segundo plano: {str(e)}", exc_info=True)
@@ -0,0 +1,70 @@
+"""Proyección compacta de payloads para los eventos de auditoría.
+
+Se despliega en el Lambda Layer junto a audit_emitter. En lugar de copiar cuerpos
+completos a la auditoría se registran identificadores, conteos, hashes y vistas
+previas truncadas:
+
+  - strings de más de AUDIT_PREVIEW_CHARS -> {"preview", "chars", "sha256"}
+  - listas de más de AUDIT_MAX_LIST_ITEMS  -> {"count", "sha256", "items": primeros N}
+  - claves de transporte de SQS (ReceiptHandle, MD5OfBody, ...) se omiten
+
+Los valores que no necesitan recortarse se retornan sin copiar (el mismo objeto), de
+modo que `project(payload) is payload` indica que la proyección no perdió datos.
+"""
+import hashlib
+import json
+import os
+
+AUDIT_PREVIEW_CHARS = int(os.environ.get('AUDIT_PREVIEW_CHARS', '256'))
+AUDIT_MAX_LIST_ITEMS = int(os.environ.get('AUDIT_MAX_LIST_ITEMS', '20'))
+
+# Atributos de receive_message que no aportan a la auditoría
+SQS_TRANSPORT_KEYS = frozenset({
+    "ReceiptHandle", "receipt_handle", "MD5OfBody", "MD5OfMessageAttributes",
+    "MD5OfMessageSystemAttributes", "ResponseMetadata"
+})
+
+
+def digest(value):
+    """SHA-256 del valor (strings tal cual, el resto serializado a JSON)."""
+    raw = value if isinstance(value, str) else json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def summarize(value):
+    """Resumen mínimo de un payload: tamaño serializado y hash."""
+    raw = value if isinstance(value, str) else json.dumps(value, default=str)
+    return {"truncated": True, "bytes": len(raw.encode("utf-8")), "sha256": digest(value)}
+
+
+def project(value, preview_chars=AUDIT_PREVIEW_CHARS, max_items=AUDIT_MAX_LIST_ITEMS):
+    """Retorna la proyección compacta de `value` (el mismo objeto si no hubo que recortar)."""
+    if isinstance(value, str):
+        if len(value) <= preview_chars:
+            return value
+        return {"preview": value[:preview_chars], "chars": len(value), "sha256": digest(value)}
+
+    if isinstance(value, dict):
+        projected = {
+            key: project(item, preview_chars, max_items)
+            for key, item in value.items() if key not in SQS_TRANSPORT_KEYS
+        }
+        if len(projected) == len(value) and all(projected[key] is value[key] for key in projected):
+            return value
+        return projected
+
+    if isinstance(value, (list, tuple)):
+        items = [project(item, preview_chars, max_items) for item in value[:max_items]]
+        if len(value) > max_items:
+            return {"count": len(value), "sha256": digest(value), "items": items}
+        if all(projected is item for projected, item in zip(items, value)):
+            return value
+        return items
+
+    return value
+
+
+def summarize_sqs_messages(response):
+    """Resumen de una respuesta de receive_message: cantidad e ids de los mensajes."""
+    messages = response.get("Messages", []) if isinstance(response, dict) else []
+    return {"message_count": len(messages), "message_ids": [message.get("MessageId") for message in messages]}
@@ -0,0 +1,91 @@
+"""Fábrica perezosa de clientes AWS compartida por las Lambdas.
+
+Se despliega en el Lambda Layer junto a audit_emitter. Los handlers declaran sus
+clientes a nivel de módulo como hasta ahora:
+
+    sqs = aws_clients.client('sqs')
+    audit_table = aws_clients.table(DYNAMODB_TABLE_NAME)
+
+pero boto3 no se importa ni se crea ningún cliente hasta el primer uso, de modo que
+el cold start no paga por clientes que el camino ejecutado no necesita. Todos los
+clientes salen de una única sesión de boto3 y se reutilizan: dos módulos que piden
+el mismo servicio con los mismos parámetros comparten el cliente (y su pool HTTP).
+"""
+import threading
+
+_lock = threading.RLock()
+_session = None
+_instances = {}
+
+
+def session():
+    """Sesión de boto3 del contenedor, creada en el primer uso."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import boto3
+                _session = boto3.session.Session()
+    return _session
+
+
+def _get_or_create(kind, service, kwargs):
+    key = (kind, service, tuple(sorted(kwargs.items())))
+    instance = _instances.get(key)
+    if instance is None:
+        # Session no es thread-safe al crear clientes; los clientes ya creados sí lo son
+        with _lock:
+            instance = _instances.get(key)
+            if instance is None:
+                instance = getattr(session(), kind)(service, **kwargs)
+                _instances[key] = instance
+    return instance
+
+
+class LazyProxy:
+    """Delegado que crea el objeto real en el primer acceso a un atributo."""
+
+    __slots__ = ("_factory", "_instance", "_description")
+
+    def __init__(self, factory, description):
+        self._factory = factory
+        self._instance = None
+        self._description = description
+
+    def _resolve(self):
+        if self._instance is None:
+            self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __repr__(self):
+        state = "creado" if self._instance is not None else "pendiente"
+        return f"<LazyProxy {self._description} ({state})>"
+
+
+def client(service, **kwargs):
+    """Cliente boto3 de `service`, creado en el primer uso."""
+    return LazyProxy(lambda: _get_or_create("client", service, kwargs), f"client {service}")
+
+
+def resource(service, **kwargs):
+    """Recurso boto3 de `service`, creado en el primer uso."""
+    return LazyProxy(lambda: _get_or_create("resource", service, kwargs), f"resource {service}")
+
+
+def table(name, **kwargs):
+    """Tabla DynamoDB (recurso Table de boto3), creada en el primer uso."""
+    return LazyProxy(lambda: _get_or_create("resource", "dynamodb", kwargs).Table(name), f"table {name}")
+
+
+def register(service, instance, kind="client", **kwargs):
+    """Reemplaza el cliente (o recurso) de `service` por `instance`, p.ej. un doble local en benchmarks."""
+    with _lock:
+        _instances[(kind, service, tuple(sorted(kwargs.items())))] = instance
+
+
+def created():
+    """Servicios con cliente o recurso ya creado en este contenedor."""
+    return sorted(f"{kind}:{service}" for kind, service, _ in _instances)
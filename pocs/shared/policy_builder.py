@@ -0,0 +1,92 @@
+"""Construcción de políticas IAM para los Lambda Authorizers de API Gateway.
+
+Se despliega en el Lambda Layer junto a audit_emitter. La granularidad de las
+políticas Allow se configura con AUTHORIZER_POLICY_GRANULARITY:
+
+  - "method": solo el methodArn de la solicitud (sin beneficio del cache de API Gateway).
+  - "api":    todas las rutas del stage ({apiId}/{stage}/*). Adecuado cuando la decisión
+              depende solo del token, ya que el resultado cacheado por API Gateway sirve
+              para cualquier ruta de la sesión.
+  - "routes": una política con las rutas que el principal puede invocar, definidas en
+              AUTHORIZER_POLICY_ROUTES ("GET /orgs/*,POST /users/*") o por quien llama.
+
+Las políticas Deny siempre se limitan al methodArn, para que un rechazo cacheado no
+bloquee otras rutas. Los documentos de política se memorizan y se comparten entre
+invocaciones: no deben modificarse después de construidos.
+"""
+import os
+from functools import lru_cache
+
+AUTHORIZER_POLICY_GRANULARITY = os.environ.get("AUTHORIZER_POLICY_GRANULARITY")
+AUTHORIZER_POLICY_ROUTES = os.environ.get("AUTHORIZER_POLICY_ROUTES", "")
+
+ALLOW = "Allow"
+GRANULARITIES = ("method", "api", "routes")
+
+
+def parse_routes(routes):
+    """Convierte "GET /orgs/*,POST /users/*" en (("GET", "orgs/*"), ("POST", "users/*"))."""
+    parsed = []
+    for route in routes.split(",") if isinstance(routes, str) else routes:
+        route = route.strip()
+        if route:
+            method, _, path = route.partition(" ")
+            parsed.append((method.upper() or "*", path.strip().lstrip("/") or "*"))
+    return tuple(parsed)
+
+
+@lru_cache(maxsize=256)
+def _stage_prefix(method_arn):
+    """arn:aws:execute-api:{region}:{account}:{apiId}/{stage}/{method}/{path} -> arn:...:{apiId}/{stage}"""
+    api_arn, _, rest = method_arn.partition("/")
+    stage = rest.split("/", 1)[0]
+    return f"{api_arn}/{stage}"
+
+
+@lru_cache(maxsize=1024)
+def _policy_document(effect, resources):
+    return {
+        "Version": "2012-10-17",
+        "Statement": [{
+            "Effect": effect,
+            "Action": "execute-api:Invoke",
+            "Resource": list(resources) if len(resources) > 1 else resources[0]
+        }]
+    }
+
+
+class PolicyBuilder:
+    """Genera respuestas de authorizer con la granularidad configurada."""
+
+    def __init__(self, granularity=None, routes=None, default_granularity="method"):
+        self.granularity = granularity or AUTHORIZER_POLICY_GRANULARITY or default_granularity
+        if self.granularity not in GRANULARITIES:
+            raise ValueError(f"Granularidad de política inválida: {self.granularity}")
+        self.routes = parse_routes(routes if routes is not None else AUTHORIZER_POLICY_ROUTES)
+
+    def resources(self, method_arn, routes=None):
+        """ARNs cubiertos por una política Allow para la solicitud `method_arn`."""
+        if self.granularity == "method":
+            return (method_arn,)
+        prefix = _stage_prefix(method_arn)
+        if self.granularity == "api":
+            return (f"{prefix}/*",)
+        routes = parse_routes(routes) if routes is not None else self.routes
+        return tuple(f"{prefix}/{method}/{path}" for method, path in routes) or (method_arn,)
+
+    def cache_scope(self, method_arn):
+        """Alcance de una política Allow: permite reutilizarla para otras rutas del mismo stage."""
+        if self.granularity == "method" or (self.granularity == "routes" and not self.routes):
+            return method_arn
+        return _stage_prefix(method_arn)
+
+    def build(self, principal_id, effect, method_arn, context=None, routes=None):
+        """Retorna la respuesta del authorizer (principalId, policyDocument y context opcional)."""
+        resources = self.resources(method_arn, routes) if effect == ALLOW else (method_arn,)
+        policy = {
+            "principalId": principal_id,
+            "policyDocument": _policy_document(effect, resources)
+        }
+        if context is not None:
+            policy["context"] = context
+        return policy
@@ -0,0 +1,76 @@
+"""Cache en proceso de tokens verificados para los Lambda Authorizers.
+
+Se despliega en el Lambda Layer junto a audit_emitter. Las entradas se indexan
+por el hash SHA-256 del token (nunca se guarda el token en claro) más un `scope`
+opcional, lo que permite guardar:
+  - los claims decodificados del token (sin scope), y
+  - la política generada para un recurso concreto (scope = methodArn, ruta, etc.).
+
+Ninguna entrada sobrevive al `exp` del token; las políticas además se limitan a
+TOKEN_CACHE_POLICY_TTL segundos para que un cambio de permisos no quede oculto
+durante toda la vida del token. El tamaño está acotado con desalojo LRU.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+TOKEN_CACHE_MAX_SIZE = int(os.environ.get("TOKEN_CACHE_MAX_SIZE", "1024"))
+TOKEN_CACHE_POLICY_TTL = float(os.environ.get("TOKEN_CACHE_POLICY_TTL", "300"))
+
+
+class TokenCache:
+    """LRU de resultados de verificación con expiración por entrada."""
+
+    def __init__(self, max_size=TOKEN_CACHE_MAX_SIZE, clock=time.time):
+        self.max_size = max_size
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token, scope):
+        return hashlib.sha256(f"{scope or ''}\x00{token}".encode()).hexdigest()
+
+    def get(self, token, scope=None):
+        """Retorna el valor cacheado para (token, scope) o None si no existe o expiró."""
+        key = self._key(token, scope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, token, value, expires_at, scope=None):
+        """Guarda `value` hasta `expires_at` (epoch en segundos, normalmente el `exp` del token)."""
+        if not expires_at or expires_at <= self._clock():
+            return
+        key = self._key(token, scope)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def policy_expiry(self, claims):
+        """Vencimiento para una política derivada de `claims`: exp del token acotado por TOKEN_CACHE_POLICY_TTL."""
+        exp = claims.get("exp")
+        if not exp:
+            return None
+        return min(float(exp), self._clock() + TOKEN_CACHE_POLICY_TTL)
+
+    def stats(self):
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}